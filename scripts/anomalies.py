@@ -0,0 +1,158 @@
+"""Vectorized anomaly detection over the (geo x year x indicator) panel.
+
+Usage: python scripts/anomalies.py [--long data/estat_nrg_ind_market_long.csv | --panel X.npanel]
+                                   [--z 3.5] [--out anomalies.csv]
+
+Two checks, each computed for every series (geo, indicator) at once:
+
+- level: robust z-score of each value against its series, 0.6745 * (x - median) / MAD
+- yoy: the same score for the change from the same period one year earlier
+  (2022 -> 2023, 2022Q3 -> 2023Q3, 2022-07 -> 2023-07), so a sudden jump
+  stands out even in a trending or seasonal series. Each period is compared
+  only with a period of its own frequency (`periods.year_ago`), so panels
+  mixing annual, quarterly and monthly columns never difference across them.
+
+Medians come from one sort along the year axis (NaN sorts last, the middle
+element is picked per series by its own count of observed values), so the
+cost is a handful of array passes whatever the number of series. Series
+whose MAD is zero fall back to the mean absolute deviation (scaled by
+1.2533, as in Iglewicz & Hoaglin); constant series score NaN and are never
+flagged.
+
+Requires numpy.
+"""
+import argparse
+import csv
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from compressed_io import open_text
+from panel_store import Panel, load_panel, panel_from_long
+from periods import period_label, year_ago
+
+Z_THRESHOLD = 3.5
+MAD_SCALE = 0.6745
+MEAN_AD_SCALE = 1.2533
+CHECKS = ('level', 'yoy')
+
+
+def nanmedian(values: np.ndarray, axis: int = 1) -> np.ndarray:
+    """Median along `axis` ignoring NaN (NaN where a slice has no values), keepdims."""
+    ordered = np.sort(values, axis=axis)
+    n = (~np.isnan(values)).sum(axis=axis, keepdims=True)
+    lo = np.maximum((n - 1) // 2, 0)
+    hi = np.maximum(n // 2, 0)
+    med = 0.5 * (np.take_along_axis(ordered, lo, axis) + np.take_along_axis(ordered, hi, axis))
+    return np.where(n > 0, med, np.nan)
+
+
+def robust_z(values: np.ndarray, axis: int = 1, reference: np.ndarray = None) -> np.ndarray:
+    """Modified z-scores along `axis`; NaN for missing values and constant series.
+
+    With `reference` (same shape) the values are scored against the median
+    and MAD of the reference series instead of their own, e.g. a new data
+    vintage against the previous one (profile_history.drift).
+    """
+    reference = values if reference is None else reference
+    med = nanmedian(reference, axis)
+    dev = np.abs(reference - med)
+    mad = nanmedian(dev, axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_ad = np.nanmean(dev, axis=axis, keepdims=True)
+        z = np.where(mad > 0, MAD_SCALE * (values - med) / mad,
+                     (values - med) / (MEAN_AD_SCALE * mean_ad))
+    return np.where(np.isfinite(z), z, np.nan)
+
+
+def year_ago_index(periods) -> np.ndarray:
+    """Position in `periods` of each period's year-earlier period (-1 where absent)."""
+    periods = np.asarray(periods, dtype=np.int64)
+    order = np.argsort(periods, kind='stable')
+    ordered = periods[order]
+    prev = year_ago(periods)
+    pos = np.minimum(np.searchsorted(ordered, prev), len(periods) - 1)
+    return np.where(ordered[pos] == prev, order[pos], -1)
+
+
+def detect(values: np.ndarray, z: float = Z_THRESHOLD, periods=None) -> dict:
+    """Scores and flags for a (geo, period, indicator) array.
+
+    `periods` are the period codes of axis 1 (e.g. `Panel.years`); without
+    them the columns are taken as consecutive years. Returns
+    {'level': (scores, mask), 'yoy': (scores, mask), 'change': array}; all
+    arrays have the input's shape. The yoy score at a period is for the change
+    from the same period a year earlier (NaN where that period is not in the
+    panel or either value is missing).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if periods is None:
+        periods = np.arange(values.shape[1])
+    prev = year_ago_index(periods)
+    has = np.flatnonzero(prev >= 0)
+    change = np.full_like(values, np.nan)
+    change[:, has] = values[:, has] - values[:, prev[has]]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # mean of an all-missing series
+        level = robust_z(values, axis=1)
+        yoy = robust_z(change, axis=1)
+        return {
+            'level': (level, np.abs(level) > z),
+            'yoy': (yoy, np.abs(yoy) > z),
+            'change': change,
+        }
+
+
+def anomaly_rows(panel: Panel, result: dict):
+    """Flagged cells as (check, geo, year label, indicator, value, change, z) tuples."""
+    for check in CHECKS:
+        scores, mask = result[check]
+        for g, y, k in zip(*np.nonzero(mask)):
+            yield (check, str(panel.geos[g]), period_label(int(panel.years[y])), panel.indicators[k],
+                   float(panel.values[g, y, k]), float(result['change'][g, y, k]), float(scores[g, y, k]))
+
+
+def write_anomalies(rows, out_csv: Path):
+    with open_text(out_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['check', 'geo', 'year', 'indicator', 'value', 'change', 'z'])
+        for check, geo, year, ind, value, change, score in rows:
+            writer.writerow([check, geo, year, ind] + ['' if x != x else f'{x:.6g}' for x in (value, change, score)])
+
+
+def summary(panel: Panel, result: dict) -> dict:
+    """Flag counts per check and indicator."""
+    return {check: dict(zip(panel.indicators, result[check][1].sum(axis=(0, 1)).tolist())) for check in CHECKS}
+
+
+def main():
+    root = Path(__file__).resolve().parents[1] / 'data'
+    parser = argparse.ArgumentParser(description='Flag robust-z and year-over-year outliers in the panel.')
+    src = parser.add_mutually_exclusive_group()
+    src.add_argument('--long', default=str(root / 'estat_nrg_ind_market_long.csv'),
+                     help='long CSV; every indicator_unit series becomes a panel column')
+    src.add_argument('--panel', help='existing .npanel directory (e.g. from build_master_dataset.py --panel)')
+    parser.add_argument('--z', type=float, default=Z_THRESHOLD, help='flag |robust z| above this')
+    parser.add_argument('--out', help='write flagged cells to this CSV')
+    args = parser.parse_args()
+
+    panel = load_panel(Path(args.panel)) if args.panel else panel_from_long(Path(args.long))
+    t0 = time.perf_counter()
+    result = detect(panel.values, args.z, panel.years)
+    elapsed = time.perf_counter() - t0
+    geos, years, indicators = panel.shape
+    print(f'Panel: {geos} geos x {years} periods x {indicators} indicators; detection {elapsed * 1000:.1f} ms')
+    counts = summary(panel, result)
+    print(f"{'indicator':<22} | {'level':>6} | {'yoy':>6}")
+    print('-' * 40)
+    for name in panel.indicators:
+        print(f"{name:<22} | {counts['level'][name]:6d} | {counts['yoy'][name]:6d}")
+    if args.out:
+        write_anomalies(anomaly_rows(panel, result), Path(args.out))
+        print(f'Wrote flagged cells to: {args.out}')
+
+
+if __name__ == '__main__':
+    main()
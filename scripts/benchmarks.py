@@ -0,0 +1,321 @@
+"""Micro-benchmarks for the data pipeline.
+
+Usage: python scripts/benchmarks.py <name> [options]
+
+Each benchmark runs on synthetic data in a temporary directory and prints its
+numbers to stdout. Heavy runs are executed in a child interpreter so that peak
+RSS is measured per run rather than for the whole benchmark process.
+"""
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DEFAULT_YEARS = [str(y) for y in range(2013, 2025)]
+
+
+def write_synthetic_tsv(path: Path, n_cells: int, years=DEFAULT_YEARS, seed: int = 0):
+    """Write a Eurostat-shaped TSV with roughly n_cells value cells."""
+    rng = random.Random(seed)
+    n_rows = max(1, n_cells // len(years))
+    with path.open('w', encoding='utf-8') as f:
+        f.write('freq,siec,indic_nrgm,unit,geo\\TIME_PERIOD\t' + '\t'.join(f'{y} ' for y in years) + '\n')
+        for i in range(n_rows):
+            meta = f'A,E7000,IND{i // 1000:05d},PC,G{i % 1000:03d}'
+            cells = []
+            for _ in years:
+                if rng.random() < 0.1:
+                    cells.append(': ')
+                else:
+                    cells.append(f'{rng.uniform(-100, 1000):.3f} ')
+            f.write(meta + '\t' + '\t'.join(cells) + '\n')
+    return n_rows * len(years)
+
+
+def run_child(code: str):
+    """Run code in a fresh interpreter and return the JSON dict it prints last."""
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                         cwd=str(SCRIPTS_DIR))
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+_CLEAN_CHILD = """
+import json, resource, sys, time
+from pathlib import Path
+sys.path.insert(0, {scripts!r})
+import clean_eurostat_tsv as m
+t0 = time.perf_counter()
+m.{func}(Path({src!r}), Path({out!r}))
+elapsed = time.perf_counter() - t0
+print(json.dumps({{'seconds': elapsed, 'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+
+def bench_clean_stream(n_cells: int = 10_000_000):
+    """Peak RSS and long rows/sec for clean_eurostat_tsv vs its streaming variant."""
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        src = tmp / 'synthetic.tsv'
+        cells = write_synthetic_tsv(src, n_cells)
+        size_mb = src.stat().st_size / 1024 ** 2
+        print(f'Synthetic TSV: {cells:,} cells, {size_mb:.1f} MB')
+        print(f"{'mode':<10} | {'seconds':>8} | {'rows/sec':>12} | {'peak RSS MB':>11}")
+        print('-' * 52)
+        for label, func in [('stream', 'clean_eurostat_tsv_stream'), ('in-memory', 'clean_eurostat_tsv')]:
+            res = run_child(_CLEAN_CHILD.format(scripts=str(SCRIPTS_DIR), func=func, src=str(src),
+                                                out=str(tmp / label)))
+            rate = cells / res['seconds'] if res['seconds'] else float('inf')
+            print(f"{label:<10} | {res['seconds']:8.2f} | {rate:12,.0f} | {res['max_rss_kb'] / 1024:11.1f}")
+
+
+def bench_clean_batch(n_files: int = 8, cells_per_file: int = 1_000_000):
+    """Wall time of clean_eurostat_batch for 1, 2, 4, ... workers."""
+    from clean_eurostat_batch import clean_eurostat_batch
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        inputs = []
+        for i in range(n_files):
+            src = tmp / f'ds_{i:02d}.tsv'
+            write_synthetic_tsv(src, cells_per_file, seed=i)
+            inputs.append(src)
+        print(f'{n_files} files x {cells_per_file:,} cells')
+        print(f"{'workers':>7} | {'seconds':>8} | {'speedup':>7}")
+        print('-' * 30)
+        base = None
+        workers = 1
+        while workers <= min(n_files, os.cpu_count() or 1):
+            manifest = json.loads(clean_eurostat_batch(inputs, tmp / f'out_{workers}', workers=workers).read_text())
+            base = base or manifest['seconds']
+            print(f"{workers:7d} | {manifest['seconds']:8.2f} | {base / manifest['seconds']:7.2f}")
+            workers *= 2
+
+
+def bench_columnar_load(repeat: int = 20):
+    """Load time and on-disk size: long CSV parsed with csv+float vs the .npcols table."""
+    import csv
+    import time
+    from columnar import load_columnar, long_csv_to_columnar
+
+    long_csv = SCRIPTS_DIR.parent / 'data' / 'estat_nrg_ind_market_long.csv'
+
+    def load_csv():
+        values = []
+        with long_csv.open('r', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                values.append(float(row['value']) if row['value'] != '' else float('nan'))
+        return values
+
+    def load_npcols(path):
+        table = load_columnar(path)
+        return float(table['value'].sum())
+
+    def best_of(fn, *args):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(*args)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        npcols = long_csv_to_columnar(long_csv, Path(tmp) / 'long.npcols')
+        npcols_bytes = sum(p.stat().st_size for p in npcols.iterdir())
+        print(f"{'format':<8} | {'load ms':>8} | {'size KB':>8}")
+        print('-' * 32)
+        print(f"{'csv':<8} | {best_of(load_csv) * 1000:8.2f} | {long_csv.stat().st_size / 1024:8.1f}")
+        print(f"{'npcols':<8} | {best_of(load_npcols, npcols) * 1000:8.2f} | {npcols_bytes / 1024:8.1f}")
+
+
+def bench_reader(n_cells: int = 1_000_000):
+    """Bulk read_eurostat vs the cleaner's per-cell parse of the same TSV."""
+    import time
+    from clean_eurostat_tsv import parse_header, parse_row
+    from eurostat_reader import read_eurostat
+
+    def per_cell(path):
+        with path.open('r', encoding='utf-8') as f:
+            _, years = parse_header(f.readline())
+            return [parse_row(line, years) for line in f]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / 'synthetic.tsv'
+        cells = write_synthetic_tsv(src, n_cells)
+        print(f"{'reader':<12} | {'seconds':>8} | {'cells/sec':>12}")
+        print('-' * 38)
+        for label, fn in [('per-cell', per_cell), ('bulk numpy', read_eurostat)]:
+            t0 = time.perf_counter()
+            fn(src)
+            elapsed = time.perf_counter() - t0
+            print(f'{label:<12} | {elapsed:8.2f} | {cells / elapsed:12,.0f}')
+
+
+def bench_sqlite_query(n_cells: int = 1_000_000, repeat: int = 5):
+    """Bulk-load time into SQLite, then one (indicator, geo) series: CSV scan vs indexed query."""
+    import csv
+    import time
+    from clean_eurostat_tsv import clean_eurostat_tsv_stream
+    from sqlite_store import connect, query_long
+
+    def best_of(fn, *args):
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(*args)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    def scan_csv(long_csv):
+        with long_csv.open('r', encoding='utf-8', newline='') as f:
+            return [row for row in csv.DictReader(f) if row['indic_nrgm'] == 'IND00000' and row['geo'] == 'G042']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        write_synthetic_tsv(tmp / 'synthetic.tsv', n_cells)
+        t0 = time.perf_counter()
+        _, long_csv = clean_eurostat_tsv_stream(tmp / 'synthetic.tsv', tmp, dataset='synthetic')
+        csv_only = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        clean_eurostat_tsv_stream(tmp / 'synthetic.tsv', tmp, dataset='synthetic', sqlite_db=tmp / 'store.db')
+        with_sqlite = time.perf_counter() - t0
+        conn = connect(tmp / 'store.db')
+        print(f'clean: {csv_only:.2f}s CSV only, {with_sqlite:.2f}s with SQLite sink')
+        print(f"{'query':<12} | {'ms':>10}")
+        print('-' * 25)
+        print(f"{'csv scan':<12} | {best_of(scan_csv, Path(long_csv)) * 1000:10.2f}")
+        print(f"{'sqlite':<12} | {best_of(query_long, conn, 'IND00000', 'G042') * 1000:10.2f}")
+        conn.close()
+
+
+def bench_anomalies(n_geos: int = 1_500, n_years: int = 12, n_indicators: int = 21, repeat: int = 5):
+    """Robust-z and year-over-year detection on a synthetic (geo, year, indicator) panel."""
+    import time
+    import numpy as np
+    from anomalies import detect
+
+    rng = np.random.default_rng(0)
+    values = rng.normal(100, 10, size=(n_geos, n_years, n_indicators)).cumsum(axis=1)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = detect(values, periods=np.arange(2013, 2013 + n_years))
+        times.append(time.perf_counter() - t0)
+    flagged = int(result['level'][1].sum() + result['yoy'][1].sum())
+    print(f'panel {n_geos} x {n_years} x {n_indicators} ({values.size:,} cells): '
+          f'best {min(times) * 1000:.1f} ms, {flagged:,} cells flagged')
+
+
+def bench_ols_subsets(n_rows: int = 264, n_candidates: int = 20, max_size: int = 0):
+    """All-subsets OLS over a shared design (max_size 0 = every combination)."""
+    import time
+    import numpy as np
+    from ols import SharedDesign, all_subsets
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_candidates))
+    y = X[:, :3] @ np.array([1.0, -0.5, 0.25]) + rng.normal(size=n_rows)
+    design = SharedDesign(X, y)
+    print(f"{'max size':>8} | {'models':>10} | {'ms':>10} | {'us/model':>8}")
+    print('-' * 46)
+    for k in ([max_size] if max_size else [1, 2, 3, 5, n_candidates]):
+        t0 = time.perf_counter()
+        n_models = sum(len(res['ok']) for res in all_subsets(design, k))
+        elapsed = time.perf_counter() - t0
+        print(f'{k:8d} | {n_models:10,} | {elapsed * 1000:10.1f} | {elapsed / n_models * 1e6:8.2f}')
+
+
+def bench_fixed_effects(n_regions: int = 1_500, n_months: int = 240, n_regressors: int = 3, drop_pct: int = 20):
+    """Two-way fixed effects on an unbalanced NUTS-3 x monthly sized panel."""
+    import time
+    import numpy as np
+    from fixed_effects import demean, two_way_fe
+
+    rng = np.random.default_rng(0)
+    geo = np.repeat(np.arange(n_regions), n_months)
+    month = np.tile(np.arange(n_months), n_regions)
+    keep = rng.random(geo.size) >= drop_pct / 100
+    geo, month = geo[keep], month[keep]
+    X = rng.normal(size=(geo.size, n_regressors)) + rng.normal(size=n_regions)[geo, None]
+    beta = np.arange(1.0, n_regressors + 1)
+    y = X @ beta + rng.normal(size=n_regions)[geo] + rng.normal(size=n_months)[month] + rng.normal(size=geo.size)
+    _, n_pass = demean(np.column_stack([y, X]), [geo, month])
+    t0 = time.perf_counter()
+    result = two_way_fe(y, X, geo, month)
+    elapsed = time.perf_counter() - t0
+    print(f'{geo.size:,} rows, {n_regions:,} regions x {n_months} months, {drop_pct}% dropped: '
+          f'{elapsed * 1000:.1f} ms ({n_pass} demeaning passes)')
+    print(f'max |b - beta| = {np.abs(result.coef - beta).max():.4f}')
+
+
+def bench_robust_se(n_clusters: int = 5_000, n_periods: int = 60, n_regressors: int = 5, repeat: int = 5):
+    """Classical, cluster-robust and Newey-West standard errors on a large panel."""
+    import time
+    import numpy as np
+    from ols import ols
+
+    rng = np.random.default_rng(0)
+    geo = np.repeat(np.arange(n_clusters), n_periods)
+    period = np.tile(np.arange(n_periods), n_clusters)
+    X = rng.normal(size=(geo.size, n_regressors))
+    y = X.sum(axis=1) + rng.normal(size=n_clusters)[geo] + rng.normal(size=geo.size)
+    print(f'{geo.size:,} rows, {n_clusters:,} clusters x {n_periods} periods, {n_regressors} regressors')
+    for cov in ('classical', 'cluster', 'hac'):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            result = ols(X, y, cov=cov, clusters=geo, time=period, groups=geo)
+        elapsed = (time.perf_counter() - t0) / repeat
+        print(f'{cov:>9}: {elapsed * 1000:8.1f} ms  {result.cov_note}')
+
+
+def bench_bootstrap(n_geos: int = 36, n_years: int = 12, n_replicates: int = 10_000, workers: int = 0):
+    """Row and cluster bootstrap plus permutation test of one x-y pair (workers 0 = CPU count)."""
+    import time
+    import numpy as np
+    from resampling import bootstrap, permutation_test
+
+    rng = np.random.default_rng(0)
+    geo = np.repeat(np.arange(n_geos), n_years)
+    x = rng.normal(size=geo.size) + rng.normal(size=n_geos)[geo]
+    y = 0.3 * x + rng.normal(size=geo.size) + rng.normal(size=n_geos)[geo]
+    print(f'{geo.size:,} rows, {n_geos:,} clusters, {n_replicates:,} replicates, workers {workers or "auto"}')
+    runs = [
+        ('row bootstrap', lambda: bootstrap(x, y, n_boot=n_replicates, workers=workers or None)),
+        ('cluster bootstrap', lambda: bootstrap(x, y, clusters=geo, n_boot=n_replicates, workers=workers or None)),
+        ('permutation', lambda: permutation_test(x, y, n_perm=n_replicates, workers=workers or None)),
+    ]
+    for name, run in runs:
+        t0 = time.perf_counter()
+        run()
+        print(f'{name:>17}: {(time.perf_counter() - t0) * 1000:8.1f} ms')
+
+
+BENCHMARKS = {
+    'anomalies': bench_anomalies,
+    'bootstrap': bench_bootstrap,
+    'clean_stream': bench_clean_stream,
+    'clean_batch': bench_clean_batch,
+    'columnar_load': bench_columnar_load,
+    'fixed_effects': bench_fixed_effects,
+    'ols_subsets': bench_ols_subsets,
+    'reader': bench_reader,
+    'robust_se': bench_robust_se,
+    'sqlite_query': bench_sqlite_query,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in BENCHMARKS:
+        print('Available benchmarks: ' + ', '.join(sorted(BENCHMARKS)))
+        return
+    name, args = argv[0], argv[1:]
+    BENCHMARKS[name](*(int(a) for a in args))
+
+
+if __name__ == '__main__':
+    main()
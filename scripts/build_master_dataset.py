@@ -1,8 +1,21 @@
+import argparse
 import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from collections import defaultdict
 
-# Selected indicators to keep as example features
+import numpy as np
+
+from columnar import is_columnar, load_columnar
+from compressed_io import open_text
+from derived_indicators import DerivedExpression, check_inputs, compile_registry, evaluate_derived, format_array, to_float_array
+from panel_store import panel_from_columns, panel_path, write_panel
+from partitioned_long import is_partitioned, read_partitioned
+from periods import FREQS, parse_periods, period_label, resample, to_freq
+
+# Selected indicators to keep as example features (default selection; see make_selection)
 KEEP_INDICATORS = {
     # Energy cost/access proxies (percent or levels)
     'CMPY_ECAP5',  # Electricity price competitiveness (proxy)
@@ -11,74 +24,452 @@ KEEP_INDICATORS = {
     'GRTL',        # Grid-related outages (proxy reliability)
 }
 
+# Derived indicators: output column -> expression over master columns (see derived_indicators.py)
+DERIVED_INDICATORS = {
+    # Energy price gap: electricity vs gas competitiveness
+    'DERIV_energy_price_gap_PC': 'CMPY_ECAP5_PC - CMPY_EG5_PC',
+}
+
 
 def read_long(path: Path):
-    with path.open('r', encoding='utf-8') as f:
+    # .gz / .zst inputs are decompressed as they stream (see compressed_io)
+    with open_text(path, newline='') as f:
         reader = csv.DictReader(f)
         for row in reader:
             yield row
 
 
-def build_master(long_csv: Path, out_csv: Path):
+def iter_long_rows(long_path: Path, indicators=None):
+    """Long rows from a CSV, or from a partitioned tree with only `indicators` read."""
+    if is_partitioned(long_path):
+        filters = {'indic_nrgm': indicators} if indicators is not None else None
+        return read_partitioned(long_path, filters)
+    return read_long(long_path)
+
+
+def parse_indicator(spec: str):
+    """'GRTL:NR' -> ('GRTL', 'NR'); 'GRTL' -> ('GRTL', None), i.e. every unit."""
+    code, _, unit = spec.partition(':')
+    return code.strip(), (unit.strip() or None)
+
+
+def make_selection(indicators=None, geos=None, derived=None, freq=None, agg='mean', allow_missing=None):
+    """Normalised master selection.
+
+    `indicators` are 'CODE' or 'CODE:UNIT' strings (default: KEEP_INDICATORS,
+    all units); `geos` limits the countries (default: all); `derived`
+    replaces DERIVED_INDICATORS. A derived input that is not a master column
+    is an error unless it is listed in `allow_missing` (e.g. an indicator
+    this selection drops), in which case it is all-NaN. `freq` ('A' or 'Q')
+    down-samples finer periods with `agg` ('mean', 'sum' or 'last'); by
+    default every period is kept at its own frequency.
+    """
+    if freq is not None and freq not in FREQS:
+        raise ValueError(f'Unknown frequency {freq!r}; expected one of {", ".join(FREQS)}')
+    if indicators is None:
+        indicators = sorted(KEEP_INDICATORS)
+    return {
+        'indicators': [parse_indicator(s) if isinstance(s, str) else tuple(s) for s in indicators],
+        'geos': sorted(set(geos)) if geos else None,
+        'derived': derived,
+        'freq': freq,
+        'agg': agg,
+        'allow_missing': sorted(allow_missing or ()),
+    }
+
+
+def load_selection(config_path: Path):
+    """Read a selection (plus optional 'long' and 'out' paths) from a JSON config file."""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    selection = make_selection(config.get('indicators'), config.get('geos'), config.get('derived'),
+                               config.get('freq'), config.get('agg', 'mean'), config.get('allow_missing'))
+    selection['long'] = config.get('long')
+    selection['out'] = config.get('out')
+    return selection
+
+
+def _row_selected(row, selection, units_by_code):
+    units = units_by_code.get(row['indic_nrgm'])
+    if units is None or (None not in units and row['unit'] not in units):
+        return False
+    return selection['geos'] is None or row['geo'] in selection['geos']
+
+
+def _collect_rows(long_path: Path, selection):
+    """(keys, text columns) from a long CSV or partitioned tree."""
+    units_by_code = defaultdict(set)
+    for code, unit in selection['indicators']:
+        units_by_code[code].add(unit)
     # Structure: key (geo, year) -> features dict
     features = defaultdict(dict)
-    meta_store = {}
-
-    for row in read_long(long_csv):
-        geo = row['geo']
-        year = row['year']
-        indic = row['indic_nrgm']
-        unit = row['unit']
-        val = row['value']
-        if indic not in KEEP_INDICATORS:
+
+    # A partitioned long tree (see partitioned_long.py) is pruned to the selected indicators up front
+    for row in iter_long_rows(long_path, set(units_by_code)):
+        if not _row_selected(row, selection, units_by_code):
             continue
-        key = (geo, year)
-        col = f'{indic}_{unit}'
-        features[key][col] = val
-        meta_store[key] = {'geo': geo, 'year': year}
-
-    # Derived indicators: example ratios if components exist
-    rows = []
-    for key, cols in features.items():
-        base = meta_store[key].copy()
-        # Convert numeric where possible
-        numeric = {}
-        for k, v in cols.items():
-            try:
-                numeric[k] = float(v) if v != '' else None
-            except Exception:
-                numeric[k] = None
-        # Example derived: energy_price_gap = CMPY_ECAP5_PC - CMPY_EG5_PC
-        ecap = numeric.get('CMPY_ECAP5_PC')
-        eg = numeric.get('CMPY_EG5_PC')
-        if ecap is not None and eg is not None:
-            cols['DERIV_energy_price_gap_PC'] = f"{ecap - eg:.3f}"
-        else:
-            cols['DERIV_energy_price_gap_PC'] = ''
-
-        # Attach cols
-        base.update({k: (v if isinstance(v, str) else ('' if v is None else str(v))) for k, v in cols.items()})
-        rows.append(base)
-
-    # Determine columns
-    colnames = ['geo', 'year']
-    all_cols = set()
-    for r in rows:
-        all_cols.update(r.keys())
-    for c in sorted(all_cols):
-        if c not in colnames:
-            colnames.append(c)
-
-    with out_csv.open('w', encoding='utf-8', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=colnames)
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(r)
+        key = (row['geo'], row['year'])
+        col = f"{row['indic_nrgm']}_{row['unit']}"
+        features[key][col] = row['value']
 
+    # Sorted by (geo, year) so the output does not depend on input row order
+    keys = sorted(features)
+    source_cols = sorted({c for cols in features.values() for c in cols})
+    text = {c: [features[k].get(c, '') for k in keys] for c in source_cols}
+    return keys, text, {c: to_float_array(text[c]) for c in source_cols}
 
-if __name__ == '__main__':
+
+def _collect_columnar(path: Path, selection):
+    """(keys, text, numeric) from a `.npcols` table via its series index, without a scan."""
+    table = load_columnar(path)
+    parts = [table.rows_for(code, unit) for code, unit in selection['indicators']]
+    rows = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+    if selection['geos'] is not None:
+        geo_codes = [table.code_of('geo', g) for g in selection['geos']]
+        rows = rows[np.isin(table['geo'][rows], geo_codes)]
+    if not len(rows):
+        return [], {}, {}
+
+    # Cells keyed by (geo label rank, period label rank) so np.unique sorts like the CSV path
+    geo_levels = table.levels['geo']
+    geo_rank = np.argsort(np.argsort(geo_levels))
+    periods, period_of_row = np.unique(table['year'][rows], return_inverse=True)
+    labels = np.array([period_label(p) for p in periods.tolist()])
+    label_order = np.argsort(labels)
+    period_rank = np.argsort(label_order)
+    span = len(periods)
+    cell = geo_rank[table['geo'][rows]] * span + period_rank[period_of_row.reshape(-1)]
+    cells, row_cell = np.unique(cell, return_inverse=True)
+
+    n_units = len(table.levels['unit'])
+    col_key = np.asarray(table['indic_nrgm'][rows], dtype=np.int64) * n_units + table['unit'][rows]
+    col_keys, row_col = np.unique(col_key, return_inverse=True)
+    matrix = np.full((len(cells), len(col_keys)), np.nan)
+    # Rows are in table order, so a later duplicate wins as in the CSV path
+    matrix[row_cell, row_col] = table['value'][rows]
+
+    sorted_geos = np.sort(geo_levels)
+    sorted_labels = labels[label_order]
+    keys = [(str(sorted_geos[c // span]), str(sorted_labels[c % span])) for c in cells.tolist()]
+    names = [f"{table.levels['indic_nrgm'][k // n_units]}_{table.levels['unit'][k % n_units]}"
+             for k in col_keys.tolist()]
+    numeric = {name: matrix[:, j] for j, name in enumerate(names)}
+    text = {name: format_array(col, exact=True) for name, col in numeric.items()}
+    return keys, text, numeric
+
+
+def _resample_master(keys, text, numeric, freq: str, how: str = 'mean'):
+    """Down-sample master rows finer than `freq` to `freq` periods, per geo.
+
+    Rows already at `freq` or coarser are kept with their original text. An
+    aggregated cell is only used where no native value at that period exists,
+    so an annual value is not averaged with its own months.
+    """
+    codes = parse_periods([y for _, y in keys]) if keys else np.empty(0, dtype=np.int32)
+    fine = to_freq(codes, freq) != codes
+    if not fine.any():
+        return keys, text, numeric
+    names = sorted(numeric)
+    geo_labels, geo_ids = np.unique([g for g, _ in keys], return_inverse=True)
+    matrix = np.column_stack([numeric[n] for n in names]) if names else np.empty((len(keys), 0))
+    g_ids, p_codes, agg = resample(geo_ids.reshape(-1)[fine], codes[fine], matrix[fine], freq, how)
+
+    agg_keys = [(str(geo_labels[g]), period_label(p)) for g, p in zip(g_ids.tolist(), p_codes.tolist())]
+    native = np.flatnonzero(~fine)
+    out_keys = sorted(set(agg_keys) | {keys[i] for i in native.tolist()})
+    pos = {k: i for i, k in enumerate(out_keys)}
+    agg_pos = np.array([pos[k] for k in agg_keys], dtype=np.int64)
+    native_pos = np.array([pos[keys[i]] for i in native.tolist()], dtype=np.int64)
+
+    out_text, out_numeric = {}, {}
+    for j, name in enumerate(names):
+        col = np.full(len(out_keys), np.nan)
+        col[agg_pos] = agg[:, j]
+        col_text = [''] * len(out_keys)
+        for p, t in zip(agg_pos.tolist(), format_array(agg[:, j])):
+            col_text[p] = t
+        src_text = text[name]
+        for i, p in zip(native.tolist(), native_pos.tolist()):
+            if src_text[i] != '':
+                col[p] = numeric[name][i]
+                col_text[p] = src_text[i]
+        out_numeric[name] = col
+        out_text[name] = col_text
+    return out_keys, out_text, out_numeric
+
+
+def _derived_registry(selection, available):
+    if selection['derived'] is not None:
+        return selection['derived']
+    # Default registry: only indicators whose inputs this selection provides
+    registry = {}
+    for name, expr in DERIVED_INDICATORS.items():
+        if DerivedExpression(name, expr).inputs <= set(available) | set(DERIVED_INDICATORS):
+            registry[name] = expr
+    return registry
+
+
+def build_master(long_csv: Path, out_csv: Path, selection=None, panel_out: Path = None, sqlite_db: Path = None):
+    """Build the (geo, year) master table.
+
+    Periods may mix frequencies ('2023', '2023Q3', '2023-07'); rows sort by
+    geo, then period label. `long_csv` may be a long CSV, a partitioned long directory or a `.npcols`
+    table; the latter two are read through partition pruning / the series
+    index instead of a full scan. `selection` comes from make_selection or
+    load_selection (default: KEEP_INDICATORS, all geos). With `panel_out`, the
+    same numeric columns are also saved as a (geo, year, indicator) panel
+    (see panel_store.py). With `sqlite_db`, the master is also loaded into that
+    SQLite store under the output file's base name (see sqlite_store.py).
+    """
+    selection = selection or make_selection()
+    if is_columnar(long_csv):
+        keys, text, numeric = _collect_columnar(long_csv, selection)
+    else:
+        keys, text, numeric = _collect_rows(long_csv, selection)
+    if selection.get('freq'):
+        keys, text, numeric = _resample_master(keys, text, numeric, selection['freq'], selection.get('agg', 'mean'))
+
+    # Derived indicators: evaluated column-wise over float arrays, NaN for missing
+    derived = evaluate_derived(_derived_registry(selection, numeric), numeric, len(keys),
+                               selection.get('allow_missing', ()))
+    for name, values in derived.items():
+        text[name] = format_array(values)
+
+    if panel_out is not None:
+        write_panel(panel_from_columns(keys, {**numeric, **derived}), panel_out)
+
+    if sqlite_db is not None:
+        from sqlite_store import connect, load_master_columns
+        conn = connect(sqlite_db)
+        try:
+            load_master_columns(conn, keys, text, variant=out_csv.name.split('.', 1)[0])
+        finally:
+            conn.close()
+
+    _write_master(out_csv, keys, text)
+    write_manifest(out_csv, {'mode': 'full', 'rows': len(keys)})
+
+
+def _write_master(out_csv: Path, keys, text):
+    colnames = ['geo', 'year'] + sorted(c for c in text if c not in ('geo', 'year'))
+    with open_text(out_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(colnames)
+        data_cols = [text[c] for c in colnames[2:]]
+        for i, (geo, year) in enumerate(keys):
+            writer.writerow([geo, year] + [col[i] for col in data_cols])
+
+
+def manifest_path(master_csv: Path) -> Path:
+    return master_csv.with_name(master_csv.name.split('.', 1)[0] + '_manifest.json')
+
+
+def write_manifest(master_csv: Path, manifest: dict):
+    """Record what the last build changed next to the master CSV.
+
+    A 'full' manifest means every row may have changed; an 'incremental' one
+    lists the added, changed and removed (geo, year) rows and the columns
+    written (see update_master).
+    """
+    path = manifest_path(master_csv)
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('w', encoding='utf-8') as f:
+        json.dump({'master': master_csv.name, **manifest}, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_master_text(master_csv: Path):
+    """(keys, name -> list of cell strings) from an existing master CSV."""
+    with open_text(master_csv, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    keys = [(r[0], r[1]) for r in rows]
+    text = {name: [r[j] if j < len(r) else '' for r in rows] for j, name in enumerate(header) if j >= 2}
+    return keys, text
+
+
+def _indexed_layout(series_index: dict, selection):
+    """(keys, source columns) a full rebuild would produce, from a cleaner series index."""
+    units_by_code = defaultdict(set)
+    for code, unit in selection['indicators']:
+        units_by_code[code].add(unit)
+    keys, cols = set(), set()
+    for series in series_index['series']:
+        _, _, code, unit, geo = series.split(',')
+        if not _row_selected({'indic_nrgm': code, 'unit': unit, 'geo': geo}, selection, units_by_code):
+            continue
+        cols.add(f'{code}_{unit}')
+        keys.update((geo, year) for year in series_index['years'])
+    return keys, cols
+
+
+def update_master(master_csv: Path, delta_csv: Path, selection=None, series_index: Path = None):
+    """Apply a cleaner delta to an existing master in place.
+
+    `delta_csv` holds long rows with a `change` column (added / changed /
+    removed), as written by `clean_eurostat_tsv --incremental`. Only cells of
+    selected series are touched; derived indicators are recomputed only if
+    they depend (directly or through other derived indicators) on a changed
+    column, and only on the affected rows. Removed series blank their cells.
+
+    Which rows and columns exist after a removal can only be told from the
+    full series list: with `series_index` (default: the
+    `<dataset>_series_index.json` next to the delta, if present), rows and
+    columns are added and dropped exactly as a full rebuild would; without
+    it they are kept. Writes the master manifest and returns it.
+    """
+    selection = selection or make_selection()
+    if selection.get('freq'):
+        raise ValueError('Incremental updates of a down-sampled master are not supported; rebuild it')
+    units_by_code = defaultdict(set)
+    for code, unit in selection['indicators']:
+        units_by_code[code].add(unit)
+    keys, text = _read_master_text(master_csv)
+    derived_names = set(DERIVED_INDICATORS if selection['derived'] is None else selection['derived'])
+    old_keys = set(keys)
+
+    updates = {}
+    with open_text(delta_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            if not _row_selected(row, selection, units_by_code):
+                continue
+            value = '' if row['change'] == 'removed' else row['value']
+            updates[(row['geo'], row['year']), f"{row['indic_nrgm']}_{row['unit']}"] = value
+
+    if series_index is None:
+        candidate = delta_csv.with_name(delta_csv.name.replace('_delta.csv', '_series_index.json'))
+        series_index = candidate if candidate != delta_csv and candidate.exists() else None
+    if series_index is not None:
+        with open(series_index, 'r', encoding='utf-8') as f:
+            new_keys, new_cols = _indexed_layout(json.load(f), selection)
+    else:
+        new_keys = old_keys | {k for k, _ in updates}
+        new_cols = {c for c in text if c not in derived_names} | {c for _, c in updates}
+
+    # Re-shape to the new row and column set, carrying over existing cells
+    removed_cols = sorted(c for c in text if c not in derived_names and c not in new_cols)
+    added_cols = sorted(new_cols - set(text))
+    if new_keys != old_keys or removed_cols or added_cols:
+        pos = {k: i for i, k in enumerate(keys)}
+        keys = sorted(new_keys)
+        text = {c: [col[pos[k]] if k in pos else '' for k in keys]
+                for c, col in text.items() if c not in removed_cols}
+        text.update({c: [''] * len(keys) for c in added_cols})
+
+    pos = {k: i for i, k in enumerate(keys)}
+    changed_rows, changed_cols = set(), set(added_cols) | set(removed_cols)
+    for (key, col), value in updates.items():
+        i = pos.get(key)
+        if i is None or col not in text or text[col][i] == value:
+            continue
+        text[col][i] = value
+        changed_rows.add(i)
+        changed_cols.add(col)
+
+    # Derived indicators downstream of a changed column, in dependency order
+    available = [c for c in text if c not in derived_names]
+    registry = _derived_registry(selection, available)
+    check_inputs(compile_registry(registry), available, selection.get('allow_missing', ()))
+    for name in derived_names & set(text) - set(registry):
+        del text[name]
+        changed_cols.add(name)
+    dirty, recompute = set(changed_cols), []
+    for expr in compile_registry(registry):
+        if expr.name not in text or expr.inputs & dirty:
+            dirty.add(expr.name)
+            recompute.append(expr)
+    rows = sorted(pos[k] for k in new_keys - old_keys) + sorted(changed_rows)
+    if any(expr.name not in text for expr in recompute):
+        rows = list(range(len(keys)))
+    rows = sorted(set(rows))
+    if recompute and rows:
+        columns = {c: to_float_array([col[i] for i in rows]) for c, col in text.items()}
+        for expr in recompute:
+            columns[expr.name] = values = expr.evaluate(columns, len(rows))
+            col = text.setdefault(expr.name, [''] * len(keys))
+            for i, v in zip(rows, format_array(values)):
+                col[i] = v
+
+    _write_master(master_csv, keys, text)
+    manifest = {
+        'mode': 'incremental',
+        'delta': delta_csv.name,
+        'rows': len(keys),
+        'rows_added': [list(k) for k in sorted(new_keys - old_keys)],
+        'rows_removed': [list(k) for k in sorted(old_keys - new_keys)],
+        'rows_changed': [list(keys[i]) for i in sorted(changed_rows) if keys[i] in old_keys],
+        'columns_changed': sorted(changed_cols),
+        'derived_recomputed': [expr.name for expr in recompute],
+    }
+    write_manifest(master_csv, manifest)
+    return manifest
+
+
+def _build_variant(task):
+    long_path, selection = task
+    out_csv = Path(selection['out'])
+    build_master(Path(selection.get('long') or long_path), out_csv, selection)
+    return str(out_csv)
+
+
+def build_master_variants(long_path: Path, selections, workers: int = None):
+    """Build one master per selection (each with its own 'out') across a process pool."""
+    tasks = [(long_path, sel) for sel in selections]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        return [_build_variant(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_build_variant, tasks))
+
+
+def main():
     root = Path(__file__).resolve().parents[1]
-    long_csv = root / 'data' / 'estat_nrg_ind_market_long.csv'
-    out_csv = root / 'data' / 'master_dataset.csv'
-    build_master(long_csv, out_csv)
+    parser = argparse.ArgumentParser(description='Build the (geo, year) master dataset from the long CSV.')
+    parser.add_argument('--long', default=str(root / 'data' / 'estat_nrg_ind_market_long.csv'),
+                        help='long CSV (optionally .gz / .zst), partitioned long directory or .npcols table')
+    parser.add_argument('--out', default=str(root / 'data' / 'master_dataset.csv'),
+                        help='master CSV output, optionally .gz / .zst')
+    parser.add_argument('--indicators', nargs='+', help='CODE or CODE:UNIT (default: KEEP_INDICATORS)')
+    parser.add_argument('--geos', nargs='+', help='limit to these geo codes (default: all)')
+    parser.add_argument('--config', nargs='+', help='JSON selection file(s), each with its own "out"')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size for several --config files')
+    parser.add_argument('--freq', choices=['A', 'Q'], help='down-sample monthly/quarterly periods to this frequency')
+    parser.add_argument('--agg', choices=['mean', 'sum', 'last'], default='mean',
+                        help='aggregation for --freq (default: mean)')
+    parser.add_argument('--panel', action='store_true', help='also write <out>.npanel (geo x year x indicator)')
+    parser.add_argument('--sqlite', help='also load the master into this SQLite store')
+    parser.add_argument('--update', metavar='DELTA_CSV',
+                        help='apply a cleaner delta (<dataset>_delta.csv) to the existing --out master in place')
+    args = parser.parse_args()
+
+    if args.config:
+        selections = [load_selection(Path(c)) for c in args.config]
+        missing = [c for c, sel in zip(args.config, selections) if not sel['out']]
+        if missing:
+            parser.error(f'config without "out": {", ".join(missing)}')
+        for out_csv in build_master_variants(Path(args.long), selections, workers=args.workers):
+            print(f'Wrote master dataset to: {out_csv}')
+        return
+
+    out_csv = Path(args.out)
+    selection = make_selection(args.indicators, args.geos, freq=args.freq, agg=args.agg)
+    if args.update:
+        manifest = update_master(out_csv, Path(args.update), selection)
+        print(f"Updated master dataset: {out_csv} ({len(manifest['rows_changed'])} changed, "
+              f"{len(manifest['rows_added'])} added, {len(manifest['rows_removed'])} removed rows)")
+        return
+
+    panel_out = panel_path(out_csv) if args.panel else None
+    sqlite_db = Path(args.sqlite) if args.sqlite else None
+    build_master(Path(args.long), out_csv, selection, panel_out=panel_out, sqlite_db=sqlite_db)
     print(f'Wrote master dataset to: {out_csv}')
+    if panel_out is not None:
+        print(f'Wrote panel to: {panel_out}')
+    if sqlite_db is not None:
+        print(f'Loaded master into: {sqlite_db}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,12 @@
-import csv
-import os
 from pathlib import Path
-from collections import defaultdict
 import statistics
 
+import numpy as np
+
+from dataset import load_dataset
+from fixed_effects import two_way_fe
+from ols import ols
+
 
 ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT / 'data'
@@ -18,23 +21,33 @@ def ensure_dirs() -> None:
 
 
 def load_master():
-    rows = []
-    with open(MASTER, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for r in reader:
-            rows.append(r)
-    return rows
+    return load_dataset(MASTER)
 
 
 def to_float(value):
     try:
-        if value is None or value == '':
+        if value is None or value != value:
             return None
         return float(value)
     except Exception:
         return None
 
 
+def complete_columns(rows, vars_):
+    """Float columns of `vars_` restricted to rows where all of them are observed."""
+    mask = rows.complete(vars_)
+    return {k: rows[k][mask].tolist() for k in vars_}
+
+
+def geo_means(rows, var):
+    """(geos, means, counts) of `var` per non-empty geo, geos sorted."""
+    valid = ~np.isnan(rows[var]) & (rows['geo'] != '')
+    geos, idx = np.unique(rows['geo'][valid], return_inverse=True)
+    counts = np.bincount(idx, minlength=len(geos))
+    sums = np.bincount(idx, weights=rows[var][valid], minlength=len(geos))
+    return geos.tolist(), (sums / np.maximum(counts, 1)).tolist(), counts.tolist()
+
+
 def write_file(path: Path, content: str) -> None:
     path.write_text(content, encoding='utf-8')
 
@@ -86,9 +99,8 @@ def color_scale_blue(value, vmin, vmax):
 
 def figure_de_timeseries(rows):
     # Germany time-series for GRTL_NR
-    series = [(int(r['year']), to_float(r.get('GRTL_NR'))) for r in rows if r.get('geo') == 'DE' and r.get('year')]
-    series = [(y, v) for y, v in series if v is not None]
-    series.sort(key=lambda x: x[0])
+    de = (rows['geo'] == 'DE') & (rows['year'] != '') & ~np.isnan(rows['GRTL_NR'])
+    series = sorted(zip(rows.periods[de].tolist(), rows['GRTL_NR'][de].tolist()), key=lambda x: x[0])
     if not series:
         return
 
@@ -136,16 +148,10 @@ def figure_de_timeseries(rows):
 
 def figure_top_countries_bar(rows):
     # mean GRTL_NR by country, top 10
-    grp = defaultdict(list)
-    for r in rows:
-        g = r.get('geo')
-        v = to_float(r.get('GRTL_NR'))
-        if g and v is not None:
-            grp[g].append(v)
     stats = []
-    for g, arr in grp.items():
-        if len(arr) >= 5:
-            stats.append((g, statistics.mean(arr)))
+    for g, mean, n in zip(*geo_means(rows, 'GRTL_NR')):
+        if n >= 5:
+            stats.append((g, mean))
     stats.sort(key=lambda x: x[1], reverse=True)
     stats = stats[:10]
     if not stats:
@@ -185,13 +191,8 @@ def figure_top_countries_bar(rows):
 def figure_correlation_heatmap(rows):
     # compute correlations among 4 variables
     vars_ = ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC', 'GRTL_NR']
-    data = {k: [] for k in vars_}
     # collect only complete rows for these vars
-    for r in rows:
-        vals = [to_float(r.get(k)) for k in vars_]
-        if all(v is not None for v in vals):
-            for k, v in zip(vars_, vals):
-                data[k].append(v)
+    data = complete_columns(rows, vars_)
 
     def corr(a, b):
         n = len(a)
@@ -252,13 +253,8 @@ def figure_tile_grid_map(rows):
         ['MT','CY']
     ]
     # collect means
-    grp = defaultdict(list)
-    for r in rows:
-        g = r.get('geo')
-        v = to_float(r.get('GRTL_NR'))
-        if g and v is not None:
-            grp[g].append(v)
-    means = {g: (sum(vs)/len(vs) if vs else None) for g, vs in grp.items()}
+    geos, geo_mean, _ = geo_means(rows, 'GRTL_NR')
+    means = dict(zip(geos, geo_mean))
     vals = [v for v in means.values() if v is not None]
     if not vals:
         return
@@ -301,8 +297,7 @@ def latex_table_descriptives(rows):
     vars_ = ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC', 'GRTL_NR']
     stats = []
     for var in vars_:
-        vals = [to_float(r.get(var)) for r in rows]
-        vals = [v for v in vals if v is not None]
+        vals = rows[var][~np.isnan(rows[var])].tolist()
         if not vals:
             continue
         stats.append((var, len(vals), statistics.mean(vals), statistics.stdev(vals) if len(vals)>1 else 0.0, min(vals), max(vals)))
@@ -318,12 +313,7 @@ def latex_table_descriptives(rows):
 
 def latex_table_correlations(rows):
     vars_ = ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC', 'GRTL_NR']
-    data = {k: [] for k in vars_}
-    for r in rows:
-        vals = [to_float(r.get(k)) for k in vars_]
-        if all(v is not None for v in vals):
-            for k, v in zip(vars_, vals):
-                data[k].append(v)
+    data = complete_columns(rows, vars_)
     def corr(a, b):
         n = len(a)
         if n < 2:
@@ -367,11 +357,8 @@ def latex_table_regressions(rows):
         return (a, b, r2)
     y = []
     x_ecap, x_eg, x_gap = [], [], []
-    for r in rows:
-        yy = to_float(r.get('GRTL_NR'))
-        ecap = to_float(r.get('CMPY_ECAP5_PC'))
-        eg = to_float(r.get('CMPY_EG5_PC'))
-        gap = to_float(r.get('DERIV_energy_price_gap_PC'))
+    for yy, ecap, eg, gap in zip(*(map(to_float, rows[k].tolist()) for k in
+                                   ('GRTL_NR', 'CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC'))):
         if yy is not None:
             y.append(yy)
             x_ecap.append(ecap)
@@ -387,8 +374,9 @@ def latex_table_regressions(rows):
         if xgap is not None and yy is not None:
             pairs.append(('GAP', xgap, yy))
     # collect by model label
-    by = defaultdict(lambda: ([], []))
+    by = {}
     for label, xx, yy in pairs:
+        by.setdefault(label, ([], []))
         by[label][0].append(xx)
         by[label][1].append(yy)
     rows_out = []
@@ -406,10 +394,35 @@ def latex_table_regressions(rows):
     write_file(TABLES_DIR / 'table_regressions.tex', '\n'.join(lines))
 
 
+def latex_table_fixed_effects(rows):
+    # pooled OLS next to two-way (country and year) fixed effects, see fixed_effects.py;
+    # standard errors clustered by country, since rows of one country are not independent;
+    # CR1 small-sample factor as in xtreg/reghdfe (country effects nested in the clusters, year effects counted)
+    models = [['CMPY_ECAP5_PC'], ['CMPY_EG5_PC'], ['DERIV_energy_price_gap_PC'], ['CMPY_ECAP5_PC', 'CMPY_EG5_PC']]
+    lines = [
+        '\\begin{table}[ht]','\\centering',
+        '\\caption{GRTL\\_NR on price indicators: pooled OLS and two-way fixed effects (standard errors clustered by country in parentheses; CR1 correction $\\frac{G}{G-1}\\frac{n-1}{n-k-(T-1)}$, country effects nested in the clusters)}',
+        '\\label{tab:reg_fe}',
+        '\\begin{tabular}{llrrrr}','\\hline','Model & Variable & Pooled & Country and year FE & Within $R^2$ & N \\\\','\\hline'
+    ]
+    for m, xs in enumerate(models, 1):
+        sub = rows.take(rows.complete(['GRTL_NR'] + xs))
+        X = np.column_stack([sub[k] for k in xs])
+        pooled = ols(X, sub['GRTL_NR'], xs, cov='cluster', clusters=sub['geo'])
+        fe = two_way_fe(sub['GRTL_NR'], X, sub['geo'], sub.periods, xs, cov='cluster')
+        for j, name in enumerate(xs):
+            cells = [f'({m})' if j == 0 else '', name.replace('_', '\\_'),
+                     f'{pooled.coef[j + 1]:.2f} ({pooled.se[j + 1]:.2f})', f'{fe.coef[j]:.2f} ({fe.se[j]:.2f})',
+                     f'{fe.r2:.3f}' if j == 0 else '', str(fe.n) if j == 0 else '']
+            lines.append(' & '.join(cells) + ' \\\\')
+    lines += ['\\hline','\\end{tabular}','\\end{table}','']
+    write_file(TABLES_DIR / 'table_regressions_fe.tex', '\n'.join(lines))
+
+
 def main():
     ensure_dirs()
     rows = load_master()
-    if not rows:
+    if not len(rows):
         print('No data found at', MASTER)
         return
     # Figures
@@ -421,6 +434,7 @@ def main():
     latex_table_descriptives(rows)
     latex_table_correlations(rows)
     latex_table_regressions(rows)
+    latex_table_fixed_effects(rows)
     print('Publication assets generated in:', OUT_DIR)
     print('LaTeX tables generated in:', TABLES_DIR)
 
@@ -0,0 +1,105 @@
+"""Clean many Eurostat TSV / TSV.gz / TSV.zst extracts in parallel.
+
+Usage: python scripts/clean_eurostat_batch.py <dir-or-glob> [--out DIR] [--workers N] [--columnar] [--ext .csv.gz]
+
+Every input file is one task for a process pool and is cleaned with the
+streaming cleaner, so each worker holds one line at a time. Each dataset gets
+`<dataset>_wide<ext>` and `<dataset>_long<ext>` in the output directory and a
+combined `manifest.json` records what was produced.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from clean_eurostat_tsv import clean_eurostat_tsv_stream, dataset_name
+
+INPUT_PATTERNS = ('*.tsv', '*.tsv.gz', '*.tsv.zst')
+
+
+def find_inputs(source: str):
+    """Resolve a directory or glob pattern to a sorted list of TSV/TSV.gz/TSV.zst files."""
+    path = Path(source)
+    if path.is_dir():
+        files = [p for pattern in INPUT_PATTERNS for p in path.glob(pattern)]
+    else:
+        files = [Path(p) for p in glob.glob(source)]
+    return sorted(p for p in files if p.is_file())
+
+
+def _clean_one(task):
+    tsv_path, out_dir, columnar, ext = task
+    dataset = dataset_name(tsv_path)
+    stats = {}
+    t0 = time.perf_counter()
+    wide_csv, long_csv = clean_eurostat_tsv_stream(tsv_path, out_dir, dataset=dataset, stats=stats,
+                                                   columnar=columnar, ext=ext)
+    return {
+        'dataset': dataset,
+        'source': str(tsv_path),
+        'source_bytes': tsv_path.stat().st_size,
+        'wide_csv': wide_csv,
+        'long_csv': long_csv,
+        'seconds': round(time.perf_counter() - t0, 3),
+        **stats,
+    }
+
+
+def clean_eurostat_batch(inputs, out_dir: Path, workers: int = None, columnar: bool = False, ext: str = '.csv'):
+    """Clean each input file in its own worker process and write manifest.json.
+
+    Returns the path to the manifest. Largest files are submitted first so that
+    one big extract does not end up running alone at the end of the batch.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    inputs = sorted((Path(p) for p in inputs), key=lambda p: p.stat().st_size, reverse=True)
+    names = [dataset_name(p) for p in inputs]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ValueError(f'Duplicate dataset names in batch: {", ".join(duplicates)}')
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(inputs)))
+    t0 = time.perf_counter()
+    tasks = [(p, out_dir, columnar, ext) for p in inputs]
+    if workers == 1:
+        results = [_clean_one(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_clean_one, tasks))
+
+    manifest = {
+        'workers': workers,
+        'seconds': round(time.perf_counter() - t0, 3),
+        'datasets': sorted(results, key=lambda r: r['dataset']),
+    }
+    manifest_path = out_dir / 'manifest.json'
+    with manifest_path.open('w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean many Eurostat TSV extracts in parallel.')
+    parser.add_argument('source', help='directory or glob of .tsv / .tsv.gz / .tsv.zst files')
+    parser.add_argument('--out', default=str(Path(__file__).resolve().parents[1] / 'data'),
+                        help='output directory (default: data/)')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+    parser.add_argument('--columnar', action='store_true', help='also write <dataset>_long.npcols')
+    parser.add_argument('--ext', default='.csv', help="output extension, e.g. '.csv.gz' or '.csv.zst'")
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.source)
+    if not inputs:
+        print(f'No TSV files found for: {args.source}')
+        return
+    manifest_path = clean_eurostat_batch(inputs, Path(args.out), workers=args.workers,
+                                         columnar=args.columnar, ext=args.ext)
+    print(f'Cleaned {len(inputs)} dataset(s); manifest: {manifest_path}')
+
+
+if __name__ == '__main__':
+    main()
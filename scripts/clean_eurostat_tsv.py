@@ -1,30 +1,79 @@
+import argparse
 import csv
+import hashlib
+import io
+import json
+import os
 from pathlib import Path
 
+from compressed_io import open_text, strip_compression_suffix
+from periods import normalize_period
+
+REQUIRED_META_COLS = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo']
+DEFAULT_DATASET = 'estat_nrg_ind_market'
+
+
+def dataset_name(path: Path) -> str:
+    """Dataset code from a Eurostat file name, e.g. nrg_pc_204.tsv.gz -> nrg_pc_204."""
+    name = strip_compression_suffix(path.name)
+    if name.endswith('.tsv'):
+        name = name[:-len('.tsv')]
+    return name
+
+
+# Eurostat observation flags, one bit each, so a per-cell uint16 holds any combination
+FLAG_BITS = {
+    'b': 1 << 0,   # break in time series
+    'c': 1 << 1,   # confidential
+    'd': 1 << 2,   # definition differs
+    'e': 1 << 3,   # estimated
+    'f': 1 << 4,   # forecast
+    'n': 1 << 5,   # not significant
+    'p': 1 << 6,   # provisional
+    'r': 1 << 7,   # revised
+    's': 1 << 8,   # Eurostat estimate
+    'u': 1 << 9,   # low reliability
+    'z': 1 << 10,  # not applicable
+}
+
+
+def split_cell(raw: str):
+    """Split a TSV cell such as '12.3 p' or ': c' into (value, flags)."""
+    # Remove spaces used as padding and as the value/flag separator
+    s = raw.strip().replace(' ', '')
+    i = len(s)
+    while i and s[i - 1].isalpha():
+        i -= 1
+    value, flags = s[:i], s[i:]
+    if value == ':':
+        value = ''
+    # Keep value as-is (decimal dot). Return string to avoid locale issues
+    return value, flags
+
+
 def parse_value(raw: str):
-    s = raw.strip()
-    if s == ':' or s == '':
-        return ''
-    # Remove spaces used as padding
-    s = s.replace(' ', '')
-    # Keep as-is (decimal dot). Return string to avoid locale issues
-    return s
+    return split_cell(raw)[0]
 
 
-def clean_eurostat_tsv(tsv_path: Path, out_dir: Path):
-    out_dir.mkdir(parents=True, exist_ok=True)
+def flag_mask(flags: str) -> int:
+    """Bitmask for a flag string, e.g. 'ep' -> FLAG_BITS['e'] | FLAG_BITS['p']."""
+    mask = 0
+    for ch in flags:
+        mask |= FLAG_BITS.get(ch, 0)
+    return mask
 
-    with tsv_path.open('r', encoding='utf-8') as f:
-        lines = [line.rstrip('\n') for line in f]
 
-    if not lines:
-        raise ValueError('Input file is empty')
+def parse_header(header_line: str):
+    """Split the TSV header into meta column names and period columns.
 
+    Period labels are normalised ('2023M07' -> '2023-07', '2023-Q3' -> '2023Q3',
+    see periods.py); annual labels are unchanged.
+    """
     # Header: first token contains comma-separated meta header ending with geo\TIME_PERIOD
     # Remaining tokens are years separated by tabs
-    header_parts = lines[0].split('\t')
+    header_parts = header_line.rstrip('\n').split('\t')
     meta_header = header_parts[0]
-    years = [h.strip() for h in header_parts[1:] if h.strip()]
+    years = [normalize_period(h) for h in header_parts[1:] if h.strip()]
 
     # Parse meta header columns (split on commas, last part contains geo\TIME_PERIOD -> keep as 'geo')
     meta_cols = [h.strip() for h in meta_header.split(',')]
@@ -32,52 +81,74 @@ def clean_eurostat_tsv(tsv_path: Path, out_dir: Path):
     if meta_cols and meta_cols[-1].startswith('geo'):
         meta_cols[-1] = 'geo'
 
-    required_meta_cols = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo']
     # If names don't match, still force to expected names
     if len(meta_cols) != 5:
-        meta_cols = required_meta_cols
+        meta_cols = REQUIRED_META_COLS
+    return meta_cols, years
+
+
+def parse_row(line: str, years):
+    """Parse one data line into (record, values, flags) or None for blank/malformed rows."""
+    if not line.strip():
+        return None
+    parts = line.rstrip('\n').split('\t')
+    meta_vals = [m.strip() for m in parts[0].split(',')]
+    if len(meta_vals) != 5:
+        # Skip malformed rows
+        return None
+    record = dict(zip(REQUIRED_META_COLS, meta_vals))
+    cells = parts[1:]
+    values = []
+    flags = []
+    for idx in range(len(years)):
+        value, flag = split_cell(cells[idx]) if idx < len(cells) else ('', '')
+        values.append(value)
+        flags.append(flag)
+    return record, values, flags
+
+
+def clean_eurostat_tsv(tsv_path: Path, out_dir: Path, ext: str = '.csv'):
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    with open_text(tsv_path) as f:
+        lines = [line.rstrip('\n') for line in f]
+
+    if not lines:
+        raise ValueError('Input file is empty')
+
+    meta_cols, years = parse_header(lines[0])
+    required_meta_cols = REQUIRED_META_COLS
 
     rows_wide = []
     rows_long = []
 
     for line in lines[1:]:
-        if not line.strip():
-            continue
-        parts = line.split('\t')
-        meta = parts[0]
-        values = parts[1:]
-
-        meta_vals = [m.strip() for m in meta.split(',')]
-        if len(meta_vals) != 5:
-            # Skip malformed rows
+        parsed = parse_row(line, years)
+        if parsed is None:
             continue
-        record = dict(zip(required_meta_cols, meta_vals))
+        record, values, flags = parsed
 
         # Build wide row
         wide_row = {**record}
-        for idx, year in enumerate(years):
-            val = parse_value(values[idx]) if idx < len(values) else ''
+        for year, val, flag in zip(years, values, flags):
             wide_row[year] = val
-            if val != '':
-                rows_long.append({**record, 'year': year, 'value': val})
-            else:
-                # Keep explicit missing as empty in long as well
-                rows_long.append({**record, 'year': year, 'value': ''})
+            # Keep explicit missing as empty in long as well
+            rows_long.append({**record, 'year': year, 'value': val, 'flag': flag})
         rows_wide.append(wide_row)
 
     # Write wide CSV
     wide_cols = required_meta_cols + years
-    wide_csv = out_dir / 'estat_nrg_ind_market_wide.csv'
-    with wide_csv.open('w', encoding='utf-8', newline='') as wf:
+    wide_csv = out_dir / f'{DEFAULT_DATASET}_wide{ext}'
+    with open_text(wide_csv, 'w', newline='') as wf:
         writer = csv.DictWriter(wf, fieldnames=wide_cols)
         writer.writeheader()
         for r in rows_wide:
             writer.writerow(r)
 
     # Write long CSV
-    long_cols = required_meta_cols + ['year', 'value']
-    long_csv = out_dir / 'estat_nrg_ind_market_long.csv'
-    with long_csv.open('w', encoding='utf-8', newline='') as lf:
+    long_cols = required_meta_cols + ['year', 'value', 'flag']
+    long_csv = out_dir / f'{DEFAULT_DATASET}_long{ext}'
+    with open_text(long_csv, 'w', newline='') as lf:
         writer = csv.DictWriter(lf, fieldnames=long_cols)
         writer.writeheader()
         for r in rows_long:
@@ -86,10 +157,267 @@ def clean_eurostat_tsv(tsv_path: Path, out_dir: Path):
     return str(wide_csv), str(long_csv)
 
 
-if __name__ == '__main__':
+def clean_eurostat_tsv_stream(tsv_path: Path, out_dir: Path, dataset: str = DEFAULT_DATASET, stats: dict = None,
+                              columnar: bool = False, ext: str = '.csv', sqlite_db: Path = None,
+                              vintage: str = None):
+    """Streaming variant of clean_eurostat_tsv.
+
+    Reads the TSV line by line and writes each wide and long row as soon as it
+    is parsed, so peak memory does not grow with the size of the input. Output
+    files are byte-identical to the in-memory version. Outputs are named
+    `<dataset>_wide<ext>` / `<dataset>_long<ext>`, where an `ext` such as
+    '.csv.gz' or '.csv.zst' compresses them; if `stats` is given it is
+    filled with row and cell counts. With `columnar=True` the long rows are
+    also written as `<dataset>_long.npcols` (see columnar.py; needs numpy).
+    With `sqlite_db` they are also bulk-loaded into that SQLite store as
+    (dataset, vintage) (see sqlite_store.py).
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    wide_csv = out_dir / f'{dataset}_wide{ext}'
+    long_csv = out_dir / f'{dataset}_long{ext}'
+    n_rows = 0
+    n_missing = 0
+    n_flagged = 0
+    builder = None
+    if columnar:
+        from columnar import LongColumnsBuilder
+        builder = LongColumnsBuilder()
+    sink = None
+    if sqlite_db is not None:
+        from sqlite_store import LongRowSink, connect
+        sink = LongRowSink(connect(sqlite_db), dataset, vintage)
+
+    try:
+        with open_text(tsv_path) as f:
+            header = f.readline()
+            if not header:
+                raise ValueError('Input file is empty')
+            _, years = parse_header(header)
+
+            with open_text(wide_csv, 'w', newline='') as wf, open_text(long_csv, 'w', newline='') as lf:
+                wide_writer = csv.writer(wf)
+                long_writer = csv.writer(lf)
+                wide_writer.writerow(REQUIRED_META_COLS + years)
+                long_writer.writerow(REQUIRED_META_COLS + ['year', 'value', 'flag'])
+
+                for line in f:
+                    parsed = parse_row(line, years)
+                    if parsed is None:
+                        continue
+                    record, values, flags = parsed
+                    meta = [record[c] for c in REQUIRED_META_COLS]
+                    wide_writer.writerow(meta + values)
+                    long_rows = [meta + [year, val, flag] for year, val, flag in zip(years, values, flags)]
+                    long_writer.writerows(long_rows)
+                    if sink is not None:
+                        sink.add(long_rows)
+                    n_rows += 1
+                    n_missing += values.count('')
+                    n_flagged += len(flags) - flags.count('')
+                    if builder is not None:
+                        builder.add_series(record, years, values, flags)
+
+        if builder is not None:
+            builder.write(out_dir / f'{dataset}_long.npcols')
+        if sink is not None:
+            sink.close()
+    except BaseException:
+        if sink is not None:
+            sink.abort()
+        raise
+    finally:
+        if sink is not None:
+            sink.conn.close()
+
+    if stats is not None:
+        stats.update({
+            'series': n_rows,
+            'years': years,
+            'cells': n_rows * len(years),
+            'missing_cells': n_missing,
+            'flagged_cells': n_flagged,
+        })
+    return str(wide_csv), str(long_csv)
+
+
+INDEX_FORMAT_VERSION = 1
+LONG_COLS = REQUIRED_META_COLS + ['year', 'value', 'flag']
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _csv_bytes(rows) -> bytes:
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    return buf.getvalue().encode('utf-8')
+
+
+def _read_range(f, offset: int, length: int) -> bytes:
+    f.seek(offset)
+    return f.read(length)
+
+
+def _load_series_index(index_path: Path, wide_csv: Path, long_csv: Path):
+    """Previous series index, or None if it is missing or does not match the outputs on disk."""
+    if not (index_path.exists() and wide_csv.exists() and long_csv.exists()):
+        return None
+    with index_path.open('r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('format_version') != INDEX_FORMAT_VERSION:
+        return None
+    if index.get('wide_bytes') != wide_csv.stat().st_size or index.get('long_bytes') != long_csv.stat().st_size:
+        return None
+    return index
+
+
+def clean_eurostat_tsv_incremental(tsv_path: Path, out_dir: Path, dataset: str = DEFAULT_DATASET):
+    """Re-clean a new extract, re-parsing only the series whose content changed.
+
+    Each series key (`freq,siec,indic_nrgm,unit,geo`) is stored in
+    `<dataset>_series_index.json` with a hash of its TSV line and the byte
+    ranges of its rows in the wide and long CSVs. On the next run, unchanged
+    series are copied from the previous outputs as raw bytes. Only added or
+    changed lines are parsed. If the whole extract hashes the same as last
+    time, nothing is rewritten. Outputs are always plain CSV, since the
+    stored byte ranges need random access.
+
+    Every run writes `<dataset>_delta.csv`: the long rows of added, changed and
+    removed series with a `change` column. Returns a dict of counts.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    wide_csv = out_dir / f'{dataset}_wide.csv'
+    long_csv = out_dir / f'{dataset}_long.csv'
+    delta_csv = out_dir / f'{dataset}_delta.csv'
+    index_path = out_dir / f'{dataset}_series_index.json'
+
+    old = _load_series_index(index_path, wide_csv, long_csv)
+    source_hash = _file_digest(tsv_path)
+    counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+
+    if old is not None and old['source_hash'] == source_hash:
+        counts['unchanged'] = len(old['series'])
+        with delta_csv.open('w', encoding='utf-8', newline='') as df:
+            csv.writer(df).writerow(LONG_COLS + ['change'])
+        return counts
+
+    with open_text(tsv_path) as f:
+        header = f.readline()
+        if not header:
+            raise ValueError('Input file is empty')
+        _, years = parse_header(header)
+        if old is not None and old['years'] != years:
+            # Different year columns change every wide row; rebuild from scratch
+            old = None
+        old_series = old['series'] if old else {}
+        new_series = {}
+
+        wide_tmp = wide_csv.with_name(wide_csv.name + '.tmp')
+        long_tmp = long_csv.with_name(long_csv.name + '.tmp')
+        old_wide = wide_csv.open('rb') if old else None
+        old_long = long_csv.open('rb') if old else None
+        try:
+            with wide_tmp.open('wb') as wf, long_tmp.open('wb') as lf, \
+                    delta_csv.open('w', encoding='utf-8', newline='') as df:
+                delta_writer = csv.writer(df)
+                delta_writer.writerow(LONG_COLS + ['change'])
+                wf.write(_csv_bytes([REQUIRED_META_COLS + years]))
+                lf.write(_csv_bytes([LONG_COLS]))
+
+                for line in f:
+                    payload = line.rstrip('\r\n')
+                    if not payload.strip():
+                        continue
+                    key = ','.join(m.strip() for m in payload.split('\t', 1)[0].split(','))
+                    digest = _digest(payload.encode('utf-8'))
+                    prev = old_series.get(key)
+                    if prev is not None and prev[0] == digest:
+                        wide_bytes = _read_range(old_wide, prev[1], prev[2])
+                        long_bytes = _read_range(old_long, prev[3], prev[4])
+                        counts['unchanged'] += 1
+                    else:
+                        parsed = parse_row(line, years)
+                        if parsed is None:
+                            continue
+                        record, values, flags = parsed
+                        meta = [record[c] for c in REQUIRED_META_COLS]
+                        long_rows = [meta + [year, val, flag] for year, val, flag in zip(years, values, flags)]
+                        wide_bytes = _csv_bytes([meta + values])
+                        long_bytes = _csv_bytes(long_rows)
+                        change = 'added' if prev is None else 'changed'
+                        counts[change] += 1
+                        delta_writer.writerows(r + [change] for r in long_rows)
+                    new_series[key] = [digest, wf.tell(), len(wide_bytes), lf.tell(), len(long_bytes)]
+                    wf.write(wide_bytes)
+                    lf.write(long_bytes)
+
+                for key, prev in old_series.items():
+                    if key in new_series:
+                        continue
+                    counts['removed'] += 1
+                    old_rows = csv.reader(io.StringIO(_read_range(old_long, prev[3], prev[4]).decode('utf-8')))
+                    delta_writer.writerows(r + ['removed'] for r in old_rows)
+        finally:
+            if old_wide is not None:
+                old_wide.close()
+                old_long.close()
+
+    os.replace(wide_tmp, wide_csv)
+    os.replace(long_tmp, long_csv)
+    index = {
+        'format_version': INDEX_FORMAT_VERSION,
+        'source_hash': source_hash,
+        'years': years,
+        'wide_bytes': wide_csv.stat().st_size,
+        'long_bytes': long_csv.stat().st_size,
+        'series': new_series,
+    }
+    index_tmp = index_path.with_name(index_path.name + '.tmp')
+    with index_tmp.open('w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(index_tmp, index_path)
+    return counts
+
+
+def main():
     project_root = Path(__file__).resolve().parents[1]
-    tsv_file = project_root / 'estat_nrg_ind_market.tsv'
-    out_directory = project_root / 'data'
-    wide_path, long_path = clean_eurostat_tsv(tsv_file, out_directory)
+    parser = argparse.ArgumentParser(description='Clean a Eurostat TSV into wide and long CSVs.')
+    parser.add_argument('tsv', nargs='?', default=str(project_root / 'estat_nrg_ind_market.tsv'),
+                        help='input .tsv / .tsv.gz / .tsv.zst (default: estat_nrg_ind_market.tsv)')
+    parser.add_argument('--out', default=str(project_root / 'data'), help='output directory (default: data/)')
+    parser.add_argument('--stream', action='store_true', help='constant-memory streaming mode')
+    parser.add_argument('--columnar', action='store_true', help='also write <dataset>_long.npcols (implies --stream)')
+    parser.add_argument('--incremental', action='store_true', help='re-parse only changed series')
+    parser.add_argument('--ext', default='.csv', help="output extension, e.g. '.csv.gz' or '.csv.zst'")
+    parser.add_argument('--sqlite', help='also bulk-load long rows into this SQLite store (implies --stream)')
+    parser.add_argument('--vintage', help='vintage tag for --sqlite (default: today)')
+    args = parser.parse_args()
+
+    tsv_file = Path(args.tsv)
+    out_directory = Path(args.out)
+    if args.incremental:
+        counts = clean_eurostat_tsv_incremental(tsv_file, out_directory)
+        print(f'Incremental clean: {counts}')
+        wide_path = out_directory / f'{DEFAULT_DATASET}_wide.csv'
+        long_path = out_directory / f'{DEFAULT_DATASET}_long.csv'
+    elif args.stream or args.columnar or args.sqlite:
+        wide_path, long_path = clean_eurostat_tsv_stream(
+            tsv_file, out_directory, columnar=args.columnar, ext=args.ext,
+            sqlite_db=Path(args.sqlite) if args.sqlite else None, vintage=args.vintage)
+    else:
+        wide_path, long_path = clean_eurostat_tsv(tsv_file, out_directory, ext=args.ext)
     print(f'Wrote wide CSV to: {wide_path}')
     print(f'Wrote long CSV to: {long_path}')
+
+
+if __name__ == '__main__':
+    main()
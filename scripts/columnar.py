@@ -0,0 +1,245 @@
+"""Columnar, memory-mappable storage for cleaned Eurostat long data.
+
+Usage: python scripts/columnar.py <long.csv> [out.npcols]
+
+A table is a directory (`*.npcols`) holding one `.npy` file per column plus
+`meta.json`. Dimension columns (`freq`, `siec`, `indic_nrgm`, `unit`, `geo`)
+are dictionary-encoded: `<dim>.npy` holds small integer codes and
+`<dim>.levels.npy` the distinct labels. `year` holds period codes (see
+periods.py; int16 for annual data, int32 once quarters or months appear), `value` is float64
+with NaN for missing cells and `flags` is a uint16 bitmask of Eurostat
+observation flags (see clean_eurostat_tsv.FLAG_BITS).
+
+A series index (`series_*.npy`, built on first use) orders row ids by
+(indic_nrgm, unit, geo, year) with offsets per (indic_nrgm, unit) pair, so
+`rows_for('GRTL', 'NR')` returns one contiguous slice without scanning. Loaders open the arrays with `mmap_mode='r'`, so
+nothing is parsed on load.
+
+Requires numpy.
+"""
+import csv
+import json
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+from clean_eurostat_tsv import flag_mask
+from compressed_io import open_text, strip_compression_suffix
+from periods import parse_period
+
+DIM_COLS = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo']
+FORMAT_VERSION = 1
+SERIES_INDEX_FILES = ('series_keys.npy', 'series_offsets.npy', 'series_order.npy')
+
+
+def to_float(value: str) -> float:
+    try:
+        return float(value) if value != '' else float('nan')
+    except ValueError:
+        return float('nan')
+
+
+def period_dtype(codes):
+    """int16 while every code is a year, int32 for quarterly/monthly codes."""
+    return np.int16 if not len(codes) or int(np.max(codes)) < 2 ** 15 else np.int32
+
+
+def code_dtype(n_levels: int):
+    if n_levels < 2 ** 7:
+        return np.int8
+    if n_levels < 2 ** 15:
+        return np.int16
+    return np.int32
+
+
+class LongColumnsBuilder:
+    """Accumulate long rows series by series in compact typed buffers."""
+
+    def __init__(self):
+        self._levels = {d: {} for d in DIM_COLS}
+        self._codes = {d: array('i') for d in DIM_COLS}
+        self._year = array('i')
+        self._period_codes = {}
+        self._value = array('d')
+        self._flags = array('H')
+
+    def __len__(self):
+        return len(self._value)
+
+    def add_series(self, record: dict, years, values, flags=None):
+        """Append one wide row: `record` holds the dimensions, `values`/`flags` one cell per period."""
+        n = len(years)
+        for d in DIM_COLS:
+            levels = self._levels[d]
+            code = levels.setdefault(record[d], len(levels))
+            self._codes[d].extend(array('i', [code]) * n)
+        codes = self._period_codes
+        for y in years:
+            code = codes.get(y)
+            if code is None:
+                code = codes[y] = parse_period(y)
+            self._year.append(code)
+        self._value.extend(to_float(v) for v in values)
+        if flags is None:
+            self._flags.extend(array('H', [0]) * n)
+        else:
+            self._flags.extend(flag_mask(f) for f in flags)
+
+    def add_row(self, row: dict):
+        """Append one long row (dimensions plus `year`, `value` and optional `flag`)."""
+        self.add_series(row, [row['year']], [row['value']], [row.get('flag') or ''])
+
+    def write(self, out_path: Path):
+        columns = {}
+        levels = {}
+        for d in DIM_COLS:
+            labels = list(self._levels[d])
+            levels[d] = labels
+            columns[d] = np.frombuffer(self._codes[d], dtype=np.int32).astype(code_dtype(len(labels)))
+        periods = np.frombuffer(self._year, dtype=np.int32)
+        columns['year'] = periods.astype(period_dtype(periods))
+        columns['value'] = np.frombuffer(self._value, dtype=np.float64)
+        columns['flags'] = np.frombuffer(self._flags, dtype=np.uint16)
+        return write_columnar(out_path, columns, levels)
+
+
+def write_columnar(out_path: Path, columns: dict, levels: dict = None):
+    """Write `columns` (name -> 1-D array) as a `.npcols` directory.
+
+    `levels` maps dictionary-encoded column names to their label lists.
+    """
+    levels = levels or {}
+    out_path.mkdir(parents=True, exist_ok=True)
+    # A rewritten table invalidates its series index
+    for name in SERIES_INDEX_FILES:
+        (out_path / name).unlink(missing_ok=True)
+    n_rows = None
+    for name, arr in columns.items():
+        arr = np.ascontiguousarray(arr)
+        if n_rows is None:
+            n_rows = len(arr)
+        elif len(arr) != n_rows:
+            raise ValueError(f'Column {name!r} has {len(arr)} rows, expected {n_rows}')
+        np.save(out_path / f'{name}.npy', arr)
+    for name, labels in levels.items():
+        np.save(out_path / f'{name}.levels.npy', np.asarray(labels, dtype=str))
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'rows': n_rows or 0,
+        'columns': list(columns),
+        'encoded': list(levels),
+    }
+    with (out_path / 'meta.json').open('w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    return out_path
+
+
+class ColumnarTable:
+    """Read-only view of a `.npcols` directory."""
+
+    def __init__(self, path: Path, mmap: bool = True):
+        self.path = Path(path)
+        with (self.path / 'meta.json').open('r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        mode = 'r' if mmap else None
+        self.columns = {c: np.load(self.path / f'{c}.npy', mmap_mode=mode) for c in self.meta['columns']}
+        self.levels = {c: np.load(self.path / f'{c}.levels.npy') for c in self.meta['encoded']}
+        self._mmap = mmap
+        self._index = None
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def code_of(self, name: str, label: str) -> int:
+        """Integer code of `label` in an encoded column, or -1 if absent."""
+        hits = np.flatnonzero(self.levels[name] == label)
+        return int(hits[0]) if len(hits) else -1
+
+    def decode(self, name: str, mask=None):
+        """Labels of an encoded column (optionally only where `mask` is true)."""
+        codes = self.columns[name] if mask is None else self.columns[name][mask]
+        return self.levels[name][codes]
+
+    def series_index(self):
+        """(keys, offsets, order): rows order[offsets[i]:offsets[i + 1]] share series key keys[i].
+
+        A key is `indic_code * n_units + unit_code`. The index is loaded from
+        the table directory, or built and saved there on first use.
+        """
+        if self._index is not None:
+            return self._index
+        paths = [self.path / name for name in SERIES_INDEX_FILES]
+        if all(p.exists() for p in paths):
+            self._index = tuple(np.load(p, mmap_mode='r' if self._mmap else None) for p in paths)
+            return self._index
+        n_units = len(self.levels['unit'])
+        indic = np.asarray(self.columns['indic_nrgm'], dtype=np.int64)
+        unit = np.asarray(self.columns['unit'], dtype=np.int64)
+        order = np.lexsort((self.columns['year'], self.columns['geo'], unit, indic))
+        sorted_keys = (indic * n_units + unit)[order]
+        keys, starts = np.unique(sorted_keys, return_index=True)
+        offsets = np.append(starts, len(order)).astype(np.int64)
+        self._index = (keys, offsets, order.astype(np.int64))
+        try:
+            for p, arr in zip(paths, self._index):
+                np.save(p, arr)
+        except OSError:
+            # Read-only table: keep the index in memory only
+            pass
+        return self._index
+
+    def rows_for(self, indicator: str, unit: str = None):
+        """Row ids of one indicator (optionally one unit), ordered by geo and year."""
+        keys, offsets, order = self.series_index()
+        ic = self.code_of('indic_nrgm', indicator)
+        uc = self.code_of('unit', unit) if unit is not None else 0
+        if ic < 0 or uc < 0:
+            return np.empty(0, dtype=np.int64)
+        n_units = len(self.levels['unit'])
+        lo_key = ic * n_units + uc
+        hi_key = lo_key + 1 if unit is not None else (ic + 1) * n_units
+        lo, hi = np.searchsorted(keys, [lo_key, hi_key])
+        return np.asarray(order[offsets[lo]:offsets[hi]])
+
+    def has_flag(self, letters: str):
+        """Boolean mask of cells carrying any of the given flags, e.g. has_flag('ep')."""
+        if 'flags' not in self.columns:
+            return np.zeros(len(self), dtype=bool)
+        return (self.columns['flags'] & flag_mask(letters)) != 0
+
+
+def load_columnar(path: Path, mmap: bool = True) -> ColumnarTable:
+    return ColumnarTable(path, mmap=mmap)
+
+
+def is_columnar(path: Path) -> bool:
+    return Path(path).is_dir() and (Path(path) / 'meta.json').exists()
+
+
+def columnar_path(long_csv: Path) -> Path:
+    """Default `.npcols` location next to a (possibly compressed) long CSV."""
+    return long_csv.with_name(strip_compression_suffix(long_csv.name)).with_suffix('.npcols')
+
+
+def long_csv_to_columnar(long_csv: Path, out_path: Path = None):
+    """Convert an existing long CSV into the columnar layout."""
+    out_path = out_path or columnar_path(long_csv)
+    builder = LongColumnsBuilder()
+    with open_text(long_csv, newline='') as f:
+        for row in csv.DictReader(f):
+            builder.add_row(row)
+    return builder.write(out_path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.splitlines()[2])
+        sys.exit(1)
+    src = Path(sys.argv[1])
+    dst = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f'Wrote columnar table to: {long_csv_to_columnar(src, dst)}')
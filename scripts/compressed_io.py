@@ -0,0 +1,69 @@
+"""Transparent gzip / zstd text streams chosen by file extension.
+
+`open_text(path, mode)` returns a text file object for `path`:
+
+- `*.gz`: gzip (standard library)
+- `*.zst` / `*.zstd`: Zstandard (requires the optional `zstandard` package)
+- anything else: a plain file
+
+Compressed files are (de)compressed incrementally as the stream is read or
+written, never fully up front. Pass `newline=''` when the stream feeds the
+csv module.
+"""
+import gzip
+import io
+from pathlib import Path
+
+GZIP_SUFFIXES = ('.gz',)
+ZSTD_SUFFIXES = ('.zst', '.zstd')
+COMPRESSED_SUFFIXES = GZIP_SUFFIXES + ZSTD_SUFFIXES
+
+
+def compression_of(path: Path):
+    """'gzip', 'zstd' or None, from the last suffix of `path`."""
+    suffix = Path(path).suffix.lower()
+    if suffix in GZIP_SUFFIXES:
+        return 'gzip'
+    if suffix in ZSTD_SUFFIXES:
+        return 'zstd'
+    return None
+
+
+def strip_compression_suffix(name: str) -> str:
+    """'x_long.csv.gz' -> 'x_long.csv'."""
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ImportError('Reading or writing .zst files requires the zstandard package '
+                          '(pip install zstandard)') from exc
+    return zstandard
+
+
+def open_text(path: Path, mode: str = 'r', encoding: str = 'utf-8', newline=None):
+    """Open `path` for text reading ('r'), writing ('w') or appending ('a'), compressing by extension.
+
+    Appending to a compressed file adds a new gzip member or zstd frame;
+    readers here decode all of them as one stream.
+    """
+    if mode not in ('r', 'w', 'a'):
+        raise ValueError(f"mode must be 'r', 'w' or 'a', got {mode!r}")
+    path = Path(path)
+    kind = compression_of(path)
+    if kind == 'gzip':
+        return gzip.open(path, mode + 't', encoding=encoding, newline=newline)
+    if kind == 'zstd':
+        zstandard = _zstd()
+        raw = path.open(mode + 'b')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding=encoding, newline=newline)
+    return path.open(mode, encoding=encoding, newline=newline)
@@ -0,0 +1,209 @@
+"""Shared typed loader for the master dataset.
+
+Usage: python scripts/dataset.py [master.csv]   (prints the schema)
+
+`load_dataset()` parses `data/master_dataset.csv` once into typed NumPy
+columns: `geo`, `year` and any non-numeric column as str arrays, every other
+column as float64 with NaN for missing cells. Column kinds are detected over
+the whole column (not a sample of rows) and kept as the dataset's schema.
+
+Parsed columns are cached twice:
+
+- in process, so scripts that call the loader repeatedly parse once
+- on disk, as `<data>/.cache/<name>.<digest>.npz` keyed by a BLAKE2 hash of
+  the file's bytes; any edit to the CSV changes the key, and a run of every
+  analysis script after a rebuild parses the CSV exactly once
+
+`load_dataset(db=...)` reads the same typed columns from a master variant in
+the SQLite store instead (see sqlite_store.load_master_dataset).
+
+Requires numpy.
+"""
+import csv
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from compressed_io import open_text
+from periods import parse_periods
+
+ROOT = Path(__file__).resolve().parent.parent
+MASTER = ROOT / 'data' / 'master_dataset.csv'
+KEY_COLS = ('geo', 'year')
+CACHE_DIR_NAME = '.cache'
+CACHE_VERSION = 1
+TEXT, FLOAT = 'text', 'float'
+
+_MEMO = {}
+
+
+class Dataset:
+    """Typed columns of one master CSV, in file order."""
+
+    def __init__(self, columns: dict, schema: dict, source: Path = None):
+        self.columns = columns
+        self.schema = schema
+        self.source = source
+        self._periods = None
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    @property
+    def numeric_columns(self):
+        return [c for c, kind in self.schema.items() if kind == FLOAT]
+
+    @property
+    def periods(self) -> np.ndarray:
+        """int period codes of the `year` column (see periods.py)."""
+        if self._periods is None:
+            self._periods = parse_periods(self.columns['year'].tolist())
+        return self._periods
+
+    def missing(self, name: str) -> int:
+        col = self.columns[name]
+        return int(np.isnan(col).sum()) if self.schema[name] == FLOAT else int((col == '').sum())
+
+    def complete(self, names) -> np.ndarray:
+        """Boolean row mask: all of `names` observed."""
+        mask = np.ones(len(self), dtype=bool)
+        for name in names:
+            mask &= ~np.isnan(self.columns[name])
+        return mask
+
+    def take(self, rows) -> 'Dataset':
+        """Row subset by boolean mask or index array."""
+        subset = Dataset({c: v[rows] for c, v in self.columns.items()}, self.schema, self.source)
+        if self._periods is not None:
+            subset._periods = self._periods[rows]
+        return subset
+
+    def to_frame(self):
+        """pandas DataFrame with the dtypes `pd.read_csv` would give (annual years as int)."""
+        import pandas as pd
+        frame = pd.DataFrame(self.columns)
+        if len(self) and (self.periods < 10000).all():
+            frame['year'] = self.periods.astype(np.int64)
+        return frame
+
+
+def _parse_column(values):
+    """(kind, array): float64 if every non-empty cell parses as a number, else str."""
+    arr = np.array(values, dtype=object)
+    numeric = arr.copy()
+    numeric[numeric == ''] = 'nan'
+    try:
+        return FLOAT, numeric.astype(np.float64)
+    except ValueError:
+        return TEXT, np.array(values, dtype=str)
+
+
+def parse_master(path: Path) -> Dataset:
+    with open_text(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        rows = list(reader)
+    columns, schema = {}, {}
+    for j, name in enumerate(header):
+        values = [r[j] if j < len(r) else '' for r in rows]
+        if name in KEY_COLS:
+            schema[name], columns[name] = TEXT, np.array(values, dtype=str)
+        else:
+            schema[name], columns[name] = _parse_column(values)
+    return Dataset(columns, schema, Path(path))
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    with Path(path).open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cache_path(path: Path, digest: str) -> Path:
+    path = Path(path)
+    return path.parent / CACHE_DIR_NAME / f"{path.name.split('.', 1)[0]}.{digest}.npz"
+
+
+def _write_cache(dataset: Dataset, out: Path):
+    out.parent.mkdir(parents=True, exist_ok=True)
+    for stale in out.parent.glob(out.name.split('.', 1)[0] + '.*.npz'):
+        stale.unlink()
+    meta = {'version': CACHE_VERSION, 'names': dataset.names, 'schema': dataset.schema}
+    tmp = out.with_name(out.name + '.tmp.npz')
+    np.savez(tmp, __meta__=np.array(json.dumps(meta)),
+             **{f'col{i}': dataset.columns[c] for i, c in enumerate(dataset.names)})
+    tmp.replace(out)
+
+
+def _read_cache(cached: Path, source: Path):
+    with np.load(cached, allow_pickle=False) as data:
+        meta = json.loads(str(data['__meta__']))
+        if meta.get('version') != CACHE_VERSION:
+            return None
+        columns = {c: data[f'col{i}'] for i, c in enumerate(meta['names'])}
+    return Dataset(columns, meta['schema'], source)
+
+
+def load_dataset(path: Path = MASTER, cache: bool = True, db: Path = None,
+                 variant: str = 'master_dataset') -> Dataset:
+    """Typed master dataset, from the in-process or on-disk cache when the file is unchanged.
+
+    With `db`, the master `variant` is read from that SQLite store (see
+    sqlite_store.py) and `path` is ignored.
+    """
+    if db is not None:
+        from sqlite_store import connect, load_master_dataset
+        if not Path(db).exists():
+            raise FileNotFoundError(f'No SQLite store at {db}')
+        conn = connect(Path(db))
+        try:
+            dataset = load_master_dataset(conn, variant)
+        finally:
+            conn.close()
+        dataset.source = Path(db)
+        return dataset
+    path = Path(path).resolve()
+    if not cache:
+        return parse_master(path)
+    digest = file_digest(path)
+    key = (str(path), digest)
+    if key in _MEMO:
+        return _MEMO[key]
+    cached = cache_path(path, digest)
+    dataset = None
+    if cached.exists():
+        try:
+            dataset = _read_cache(cached, path)
+        except (OSError, ValueError, KeyError):
+            dataset = None
+    if dataset is None:
+        dataset = parse_master(path)
+        try:
+            _write_cache(dataset, cached)
+        except OSError:
+            pass  # read-only data dir: still usable, just uncached
+    _MEMO[key] = dataset
+    return dataset
+
+
+if __name__ == '__main__':
+    src = Path(sys.argv[1]) if len(sys.argv) > 1 else MASTER
+    ds = load_dataset(src)
+    print(f'{src}: {len(ds)} rows')
+    for name, kind in ds.schema.items():
+        print(f'  {name:<28} {kind:<5} missing={ds.missing(name)}')
@@ -0,0 +1,170 @@
+"""Column-wise evaluation of declarative derived indicators.
+
+A registry maps output column names to arithmetic expressions over master
+columns, e.g.
+
+    DERIVED_INDICATORS = {
+        'DERIV_energy_price_gap_PC': 'CMPY_ECAP5_PC - CMPY_EG5_PC',
+        'DERIV_grid_per_capacity': 'GRTL_NR / ECAP_CN_MW',
+    }
+
+Expressions may use column names, numbers, + - * / **, unary minus,
+parentheses and the functions in FUNCTIONS. They are parsed once with `ast`
+and evaluated over whole float64 NumPy columns, so each indicator costs one
+vectorized pass. Missing values are NaN and propagate. Division by zero and
+other non-finite results also become NaN. Derived indicators may refer to
+other derived indicators; they are evaluated in dependency order.
+
+A name that is neither an available column nor a registry entry is an error
+(`check_inputs`), so a typo cannot silently produce an empty column. Inputs
+that a selection may legitimately leave out are opted in by name with
+`allow_missing`; they evaluate as all-NaN columns.
+
+Requires numpy.
+"""
+import ast
+
+import numpy as np
+
+FUNCTIONS = {
+    'abs': np.abs,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'min': np.minimum,
+    'max': np.maximum,
+}
+
+_BINOPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+
+def to_float_array(values) -> np.ndarray:
+    """float64 array from CSV strings; '' and unparseable cells become NaN."""
+    arr = np.array(values, dtype=object)
+    arr[arr == ''] = 'nan'
+    try:
+        return arr.astype(np.float64)
+    except ValueError:
+        def conv(v):
+            try:
+                return float(v)
+            except (TypeError, ValueError):
+                return np.nan
+        return np.fromiter((conv(v) for v in arr), dtype=np.float64, count=len(arr))
+
+
+def format_array(arr: np.ndarray, fmt: str = '{:.3f}', exact: bool = False):
+    """Strings for the CSV writer; NaN becomes ''.
+
+    With `exact=True`, values that `fmt` would round are written with repr()
+    instead, so source values survive a float round trip unchanged.
+    """
+    out = []
+    for x in arr.tolist():
+        if x != x:
+            out.append('')
+            continue
+        s = fmt.format(x)
+        out.append(repr(x) if exact and float(s) != x else s)
+    return out
+
+
+class DerivedExpression:
+    """One parsed registry entry."""
+
+    def __init__(self, name: str, expression: str):
+        self.name = name
+        self.expression = expression
+        self._tree = ast.parse(expression, mode='eval').body
+        self.inputs = set()
+        self._check(self._tree)
+
+    def _check(self, node):
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINOPS:
+            self._check(node.left)
+            self._check(node.right)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            self._check(node.operand)
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+                and not node.keywords:
+            for arg in node.args:
+                self._check(arg)
+        elif isinstance(node, ast.Name):
+            self.inputs.add(node.id)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            pass
+        else:
+            raise ValueError(f'Unsupported syntax in derived indicator {self.name!r}: {ast.dump(node)}')
+
+    def evaluate(self, columns: dict, n_rows: int) -> np.ndarray:
+        def ev(node):
+            if isinstance(node, ast.BinOp):
+                return _BINOPS[type(node.op)](ev(node.left), ev(node.right))
+            if isinstance(node, ast.UnaryOp):
+                return -ev(node.operand) if isinstance(node.op, ast.USub) else ev(node.operand)
+            if isinstance(node, ast.Call):
+                return FUNCTIONS[node.func.id](*(ev(a) for a in node.args))
+            if isinstance(node, ast.Name):
+                col = columns.get(node.id)
+                return col if col is not None else np.full(n_rows, np.nan)
+            return float(node.value)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            out = np.broadcast_to(np.asarray(ev(self._tree), dtype=np.float64), (n_rows,)).copy()
+        out[~np.isfinite(out)] = np.nan
+        return out
+
+
+def compile_registry(registry: dict):
+    """Parse a registry and return its expressions in dependency order."""
+    exprs = {name: DerivedExpression(name, text) for name, text in registry.items()}
+    ordered = []
+    state = {}
+
+    def visit(name, chain):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f'Cyclic derived indicators: {" -> ".join(chain + [name])}')
+        state[name] = 'visiting'
+        for dep in sorted(exprs[name].inputs):
+            if dep in exprs:
+                visit(dep, chain + [name])
+        state[name] = 'done'
+        ordered.append(exprs[name])
+
+    for name in exprs:
+        visit(name, [])
+    return ordered
+
+
+def check_inputs(exprs, available, allow_missing=()):
+    """Raise ValueError if an expression uses a name that is not in `available`,
+    not another expression's output and not listed in `allow_missing`."""
+    known = set(available) | {expr.name for expr in exprs} | set(allow_missing)
+    problems = [f"{expr.name} ({', '.join(sorted(expr.inputs - known))})"
+                for expr in exprs if expr.inputs - known]
+    if problems:
+        raise ValueError(f"Derived indicators use unknown columns: {'; '.join(problems)}. "
+                         f"Check the expressions, or list the columns in allow_missing to evaluate them as NaN.")
+
+
+def evaluate_derived(registry: dict, columns: dict, n_rows: int, allow_missing=()) -> dict:
+    """Evaluate every registry entry over `columns` (name -> float64 array).
+
+    Returns name -> float64 array for the derived columns only. Inputs must be
+    columns or registry entries (see `check_inputs`); names in
+    `allow_missing` that are not present evaluate as all-NaN columns.
+    """
+    exprs = compile_registry(registry)
+    check_inputs(exprs, columns, allow_missing)
+    available = dict(columns)
+    derived = {}
+    for expr in exprs:
+        derived[expr.name] = available[expr.name] = expr.evaluate(available, n_rows)
+    return derived
@@ -4,13 +4,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import warnings
+
+from dataset import load_dataset
+
 warnings.filterwarnings('ignore')
 
 def load_data():
-    """Load the master dataset"""
-    data_path = Path(__file__).parent.parent / 'data' / 'master_dataset.csv'
-    df = pd.read_csv(data_path)
-    return df
+    """Load the master dataset (parsed once by the shared loader, see dataset.py)"""
+    return load_dataset().to_frame()
 
 def basic_info(df):
     """Generate basic dataset information"""
@@ -0,0 +1,206 @@
+"""Format-detecting bulk reader for Eurostat extracts.
+
+Usage: python scripts/eurostat_reader.py <file> [out.npcols]
+
+Understands both layouts a download can come in:
+
+- `tsv`: the Eurostat bulk TSV (`freq,siec,indic_nrgm,unit,geo\\TIME_PERIOD`
+  header, tab-separated years, `:` for missing, optional flags after a space)
+- `csv`: the readable-header CSV (`Frequency,SIEC,Indicator_Energy_Market,
+  Unit,Geography,2013,...`, plain commas, empty for missing)
+
+Either may be gzip- or zstd-compressed. Both are mapped to one EurostatFrame:
+dimension columns as string arrays, a (series x year) float64 value matrix with NaN for missing, and a matching
+uint16 flag bitmask matrix. The file body is split in one bulk str.split and
+converted with a single numpy astype, so there is no per-cell Python loop on
+the fast path.
+
+Requires numpy.
+"""
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+from clean_eurostat_tsv import FLAG_BITS, REQUIRED_META_COLS, parse_header, split_cell
+from columnar import code_dtype, period_dtype, write_columnar
+from compressed_io import open_text
+from periods import normalize_period, parse_periods
+
+# Header names seen in the readable CSV variant, mapped to the TSV dimension codes
+HEADER_ALIASES = {
+    'frequency': 'freq',
+    'freq': 'freq',
+    'siec': 'siec',
+    'indicator_energy_market': 'indic_nrgm',
+    'indic_nrgm': 'indic_nrgm',
+    'unit': 'unit',
+    'geography': 'geo',
+    'geo': 'geo',
+}
+
+
+class EurostatFrame(NamedTuple):
+    meta: dict          # dimension name -> array of labels, one per series
+    years: list         # period labels of the value columns
+    values: np.ndarray  # float64, shape (series, years), NaN = missing
+    flags: np.ndarray   # uint16 bitmask, same shape as values
+    skipped: int = 0    # malformed rows left out (see _split_cells)
+
+
+def detect_format(header_line: str) -> str:
+    """Return 'tsv' for the Eurostat bulk TSV and 'csv' for the readable-header CSV."""
+    first_field = header_line.split('\t', 1)[0]
+    if '\t' in header_line and ('\\' in first_field or 'TIME_PERIOD' in first_field):
+        return 'tsv'
+    if ',' in header_line and '\t' not in header_line:
+        return 'csv'
+    raise ValueError(f'Unrecognised Eurostat header: {header_line[:80]!r}')
+
+
+def _csv_header(header_line: str):
+    fields = [h.strip() for h in header_line.split(',')]
+    n_meta = next((i for i, h in enumerate(fields) if h[:1].isdigit()), len(fields))
+    meta_cols = [HEADER_ALIASES.get(h.lower(), h) for h in fields[:n_meta]]
+    if sorted(meta_cols) != sorted(REQUIRED_META_COLS):
+        # Same fallback as the TSV cleaner: force the expected names by position
+        meta_cols = REQUIRED_META_COLS
+    return meta_cols, [normalize_period(h) for h in fields[n_meta:] if h]
+
+
+def _split_cells(body: str, n_meta: int, n_values: int, sep: str, meta_sep: str = None):
+    """Split the whole body into (an (rows, n_meta + n_values) object array of str, rows skipped).
+
+    With `meta_sep` (the TSV layout) rows are read like
+    `clean_eurostat_tsv.parse_row`: rows whose first field does not hold
+    exactly n_meta labels are skipped, missing trailing values are padded
+    with '' and surplus ones ignored. Without it (CSV) rows with any other
+    field count are skipped, since a short row cannot be realigned. Blank
+    lines are dropped without counting. The bulk split runs when every line
+    is well-formed; only otherwise are lines handled one by one.
+    """
+    body = body.replace('\r\n', '\n').strip('\n')
+    n_cols = n_meta + n_values
+    if not body:
+        return np.empty((0, n_cols), dtype=object), 0
+    lines = body.split('\n')
+    arr = np.array(lines)
+    n_fields = np.char.count(arr, sep) + 1
+    if meta_sep:
+        n_meta_fields = np.char.count(np.char.partition(arr, sep)[:, 0], meta_sep) + 1
+        ok = (n_meta_fields == n_meta) & (n_fields == n_values + 1)
+    else:
+        ok = n_fields == n_cols
+    if ok.all():
+        flat = body.replace(meta_sep, sep) if meta_sep else body
+        tokens = flat.replace('\n', sep).split(sep)
+        return np.array(tokens, dtype=object).reshape(-1, n_cols), 0
+
+    tokens = []
+    skipped = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        parts = line.split(sep)
+        if meta_sep:
+            meta = parts[0].split(meta_sep)
+            if len(meta) != n_meta:
+                skipped += 1
+                continue
+            values = parts[1:n_values + 1]
+            parts = meta + values + [''] * (n_values - len(values))
+        elif len(parts) != n_cols:
+            skipped += 1
+            continue
+        tokens.extend(parts)
+    return np.array(tokens, dtype=object).reshape(-1, n_cols), skipped
+
+
+def _parse_values(cells: np.ndarray):
+    """Convert value cells to (float64 values, uint16 flag bits).
+
+    float() accepts surrounding whitespace, so unflagged cells convert in one
+    astype call. Flags make that fail; only then are cells split on the space
+    between value and flag with numpy string ops.
+    """
+    cells = cells.copy()
+    cells[cells == ''] = 'nan'
+    try:
+        return cells.astype(np.float64), np.zeros(cells.shape, dtype=np.uint16)
+    except ValueError:
+        pass
+    parts = np.char.partition(np.char.strip(cells.astype(str)), ' ')
+    value_text, flag_text = parts[..., 0], np.char.strip(parts[..., 2])
+    try:
+        values = value_text.astype(np.float64)
+    except ValueError:
+        # Odd cells such as '12.3p' without a separating space: per-cell slow path
+        # on the original text (undo the ':' -> 'nan' so 'nan' is not read as flags)
+        raw = np.char.replace(cells.astype(str), 'nan', ':')
+        values = np.vectorize(lambda s: float(split_cell(s)[0] or 'nan'), otypes=[np.float64])(raw)
+        flag_text = np.vectorize(lambda s: split_cell(s)[1], otypes=[str])(raw)
+    bits = np.zeros(cells.shape, dtype=np.uint16)
+    for letter, bit in FLAG_BITS.items():
+        bits[np.char.find(flag_text, letter) >= 0] |= bit
+    return values, bits
+
+
+def read_eurostat(path: Path) -> EurostatFrame:
+    """Read a Eurostat TSV or readable-header CSV (optionally .gz / .zst) into an EurostatFrame."""
+    with open_text(path) as f:
+        header = f.readline()
+        if not header:
+            raise ValueError('Input file is empty')
+        body = f.read()
+
+    fmt = detect_format(header)
+    if fmt == 'tsv':
+        meta_cols, years = REQUIRED_META_COLS, parse_header(header)[1]
+        # Meta fields are comma-separated inside the first tab field and values
+        # never contain commas, so once rows are checked one separator covers the
+        # whole line. ':' only ever marks a missing value, so it can become 'nan'
+        # before splitting.
+        cells, skipped = _split_cells(body.replace(':', 'nan'), len(meta_cols), len(years), '\t', ',')
+    else:
+        meta_cols, years = _csv_header(header)
+        cells, skipped = _split_cells(body, len(meta_cols), len(years), ',')
+
+    n_meta = len(meta_cols)
+    meta_text = np.char.strip(cells[:, :n_meta].astype(str))
+    values, flags = _parse_values(cells[:, n_meta:])
+    return EurostatFrame(
+        meta={c: meta_text[:, i] for i, c in enumerate(meta_cols)},
+        years=years,
+        values=values,
+        flags=flags,
+        skipped=skipped,
+    )
+
+
+def frame_to_columnar(frame: EurostatFrame, out_path: Path):
+    """Write an EurostatFrame as a long `.npcols` table (series-major, like the long CSV)."""
+    n_series, n_years = frame.values.shape
+    columns = {}
+    levels = {}
+    for d in REQUIRED_META_COLS:
+        labels, codes = np.unique(frame.meta[d], return_inverse=True)
+        levels[d] = labels.tolist()
+        columns[d] = np.repeat(codes.astype(code_dtype(len(labels))), n_years)
+    periods = parse_periods(frame.years)
+    columns['year'] = np.tile(periods.astype(period_dtype(periods)), n_series)
+    columns['value'] = frame.values.ravel()
+    columns['flags'] = frame.flags.ravel()
+    return write_columnar(out_path, columns, levels)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__.splitlines()[2])
+        sys.exit(1)
+    src = Path(sys.argv[1])
+    frame = read_eurostat(src)
+    print(f'Read {frame.values.shape[0]} series x {len(frame.years)} periods from {src}'
+          + (f' ({frame.skipped} malformed rows skipped)' if frame.skipped else ''))
+    if len(sys.argv) > 2:
+        print(f'Wrote columnar table to: {frame_to_columnar(frame, Path(sys.argv[2]))}')
@@ -0,0 +1,181 @@
+"""Streaming sort-merge join of external panels onto the master dataset.
+
+Usage: python scripts/merge_panels.py <left.csv> <right.csv> <out.csv> [--on geo year]
+           [--right-on nuts_code year] [--how left|inner|outer] [--prefix soep_] [--sort-right]
+
+Both inputs must be sorted by their key columns, compared as strings (the
+order `build_master` writes: geo, then year). Keys may differ in name between
+the sides, e.g. the master's (geo, year) against (nuts_code, year) in a
+regional source (see HARMONIZATION_KEYS.md). The join reads both files once, in
+step. Only the left rows of the current key are buffered, so a left panel
+(one row per geo and year) can be joined to right-hand microdata with tens of
+thousands of rows per key, and neither side is loaded into memory. Unsorted
+input raises; `sort_csv` (or `--sort-right`) does an external merge sort first.
+"""
+import argparse
+import csv
+import heapq
+import tempfile
+from itertools import groupby
+from pathlib import Path
+
+from compressed_io import open_text
+
+DEFAULT_KEY = ('geo', 'year')
+SORT_CHUNK_ROWS = 500_000
+
+
+def _checked_keys(rows, key_cols, name):
+    """Yield (key, row) pairs, raising if the keys go backwards."""
+    prev = None
+    for row in rows:
+        key = tuple(row[c] for c in key_cols)
+        if prev is not None and key < prev:
+            raise ValueError(f'{name} is not sorted by {", ".join(key_cols)}: {key} after {prev}')
+        prev = key
+        yield key, row
+
+
+def sort_merge_join(left, right, on=DEFAULT_KEY, right_on=None, how='left', prefix=''):
+    """Join two key-sorted row streams (dicts) and yield merged row dicts.
+
+    `how` is 'inner', 'left' (every left row, once per matching right row or
+    once with empty right columns) or 'outer' (also unmatched right rows,
+    with their key written into the `on` columns). Right-hand columns other
+    than the key get `prefix`; a name clash with a left column raises.
+    """
+    if how not in ('inner', 'left', 'outer'):
+        raise ValueError(f'Unsupported join: {how!r}')
+    on = list(on)
+    right_on = list(right_on or on)
+    if len(on) != len(right_on):
+        raise ValueError('on and right_on need the same number of columns')
+
+    left_groups = groupby(_checked_keys(left, on, 'left input'), key=lambda kr: kr[0])
+    empty_right = None
+
+    def next_left():
+        for key, group in left_groups:
+            return key, [row for _, row in group]
+        return None, None
+
+    def right_part(row):
+        return {prefix + c: v for c, v in row.items() if c not in right_on}
+
+    lk, lrows = next_left()
+    matched = False
+    for rk, rrow in _checked_keys(right, right_on, 'right input'):
+        extra = right_part(rrow)
+        if empty_right is None:
+            empty_right = dict.fromkeys(extra, '')
+            if lrows and set(extra) & set(lrows[0]):
+                clash = sorted(set(extra) & set(lrows[0]))
+                raise ValueError(f'Column name clash, use a prefix: {", ".join(clash)}')
+        while lk is not None and lk < rk:
+            if how != 'inner' and not matched:
+                for lrow in lrows:
+                    yield {**lrow, **empty_right}
+            lk, lrows = next_left()
+            matched = False
+        if lk == rk:
+            matched = True
+            for lrow in lrows:
+                yield {**lrow, **extra}
+        elif how == 'outer':
+            yield {**dict(zip(on, rk)), **extra}
+
+    while lk is not None:
+        if how != 'inner' and not matched:
+            for lrow in lrows:
+                yield {**lrow, **(empty_right or {})}
+        lk, lrows = next_left()
+        matched = False
+
+
+def _read_rows(path: Path):
+    with open_text(path, newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def _header(path: Path):
+    with open_text(path, newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def sort_csv(in_csv: Path, out_csv: Path, key_cols=DEFAULT_KEY, chunk_rows: int = SORT_CHUNK_ROWS):
+    """External merge sort of a CSV by `key_cols` (as strings), in chunks of `chunk_rows`."""
+    key_cols = list(key_cols)
+    header = _header(in_csv)
+    idx = [header.index(c) for c in key_cols]
+
+    def row_key(row):
+        return [row[i] for i in idx]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = []
+        with open_text(in_csv, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            while True:
+                chunk = [row for _, row in zip(range(chunk_rows), reader)]
+                if not chunk:
+                    break
+                chunk.sort(key=row_key)
+                run = Path(tmp) / f'run{len(runs)}.csv'
+                with run.open('w', encoding='utf-8', newline='') as rf:
+                    csv.writer(rf).writerows(chunk)
+                runs.append(run)
+
+        handles = [run.open('r', encoding='utf-8', newline='') for run in runs]
+        try:
+            with open_text(out_csv, 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(header)
+                writer.writerows(heapq.merge(*(csv.reader(h) for h in handles), key=row_key))
+        finally:
+            for h in handles:
+                h.close()
+    return out_csv
+
+
+def merge_panel_files(left_csv: Path, right_csv: Path, out_csv: Path, on=DEFAULT_KEY, right_on=None,
+                      how: str = 'left', prefix: str = ''):
+    """Stream-join two sorted CSVs into `out_csv`; returns the number of rows written."""
+    right_on = list(right_on or on)
+    left_cols = _header(left_csv)
+    right_cols = [prefix + c for c in _header(right_csv) if c not in right_on]
+    clash = sorted(set(left_cols) & set(right_cols))
+    if clash:
+        raise ValueError(f'Column name clash, use a prefix: {", ".join(clash)}')
+    n = 0
+    with open_text(out_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=left_cols + right_cols, restval='')
+        writer.writeheader()
+        for row in sort_merge_join(_read_rows(left_csv), _read_rows(right_csv), on, right_on, how, prefix):
+            writer.writerow(row)
+            n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sort-merge join an external panel onto a key-sorted panel.')
+    parser.add_argument('left', help='left CSV, e.g. data/master_dataset.csv (sorted by --on)')
+    parser.add_argument('right', help='external CSV (sorted by --right-on, or use --sort-right)')
+    parser.add_argument('out', help='joined CSV output, optionally .gz / .zst')
+    parser.add_argument('--on', nargs='+', default=list(DEFAULT_KEY), help='left key columns (default: geo year)')
+    parser.add_argument('--right-on', nargs='+', help='right key columns (default: same as --on)')
+    parser.add_argument('--how', choices=['inner', 'left', 'outer'], default='left')
+    parser.add_argument('--prefix', default='', help='prefix for right-hand columns, e.g. soep_')
+    parser.add_argument('--sort-right', action='store_true', help='external-sort the right input first')
+    args = parser.parse_args()
+
+    right = Path(args.right)
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.sort_right:
+            right = sort_csv(right, Path(tmp) / 'right_sorted.csv', args.right_on or args.on)
+        n = merge_panel_files(Path(args.left), right, Path(args.out), args.on, args.right_on, args.how, args.prefix)
+    print(f'Wrote {n} joined rows to: {args.out}')
+
+
+if __name__ == '__main__':
+    main()
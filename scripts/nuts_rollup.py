@@ -0,0 +1,284 @@
+"""NUTS hierarchy and pre-aggregated regional rollups.
+
+Usage:
+    python scripts/nuts_rollup.py build <panel.csv> <out.ncube> [--weight COLUMN]
+    python scripts/nuts_rollup.py update <cube.ncube> <changes.csv>
+    python scripts/nuts_rollup.py export <cube.ncube> <out.csv> [--level 1]
+
+Input is a regional panel keyed by (nuts_code, year) with one column per
+indicator, all rows at the same NUTS level (usually NUTS-3). A NUTS code
+carries its ancestors as prefixes (DE111 -> DE11 -> DE1 -> DE), so the
+hierarchy follows from the codes themselves (see `hierarchy_rows`).
+
+The cube (`*.ncube` directory) stores, for the base level and every level
+above it up to the country:
+
+- `level<k>.codes.npy`: NUTS codes at level k (0 = country), sorted
+- `level<k>.npy`: float64 (code, year, indicator, component) array with the
+  additive components sum, count, sum(w*x) and sum(w) of non-missing values
+- `base.npy` / `weights.npy`: the base-level values and weights, for updates
+
+Means and weighted means are ratios of stored components, so a query at any
+level reads the precomputed level array instead of re-aggregating base rows.
+`update_cube` applies changed base rows as component deltas to their
+ancestors only.
+
+Requires numpy.
+"""
+import argparse
+import csv
+import json
+from pathlib import Path
+
+import numpy as np
+
+from compressed_io import open_text
+from derived_indicators import format_array, to_float_array
+
+FORMAT_VERSION = 1
+KEY_COLS = ('nuts_code', 'year')
+COMPONENTS = ('sum', 'count', 'wx', 'w')
+STATS = ('sum', 'count', 'mean', 'wmean')
+
+
+def nuts_level(code: str) -> int:
+    """0 for a country code, 1-3 for NUTS-1/2/3."""
+    return len(code) - 2
+
+
+def hierarchy_rows(codes):
+    """(nuts_code, nuts_level, parent, country) for `codes` and all their ancestors."""
+    seen = set()
+    for code in codes:
+        for k in range(nuts_level(code), -1, -1):
+            seen.add(code[:2 + k])
+    return [(c, nuts_level(c), c[:-1] if nuts_level(c) else '', c[:2]) for c in sorted(seen)]
+
+
+def _components(values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """(..., indicator, 4) additive components of values (..., indicator) and weights (...)."""
+    ok = np.isfinite(values)
+    w = np.where(np.isfinite(weights), weights, 0.0)[..., None]
+    x = np.where(ok, values, 0.0)
+    return np.stack([x, ok.astype(np.float64), np.where(ok, w * x, 0.0), np.where(ok, w, 0.0)], axis=-1)
+
+
+def _rollup(codes: np.ndarray, comp: np.ndarray, level: int):
+    """Sum components of sorted child codes into their level-`level` ancestors."""
+    prefixes = np.array([c[:2 + level] for c in codes.tolist()])
+    parents, starts = np.unique(prefixes, return_index=True)
+    return parents, np.add.reduceat(comp, starts, axis=0)
+
+
+class NutsCube:
+    """Pre-aggregated (code, year, indicator) cube at every NUTS level."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with (self.path / 'meta.json').open('r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.base_level = self.meta['base_level']
+        self.years = np.load(self.path / 'years.npy')
+        self.indicators = np.load(self.path / 'indicators.npy').tolist()
+        self.codes = {k: np.load(self.path / f'level{k}.codes.npy') for k in range(self.base_level + 1)}
+        self._levels = {}
+        self._code_index = {}
+
+    def components(self, level: int) -> np.ndarray:
+        if level not in self._levels:
+            self._levels[level] = np.load(self.path / f'level{level}.npy', mmap_mode='r')
+        return self._levels[level]
+
+    def stat(self, level: int, stat: str = 'mean') -> np.ndarray:
+        """(code, year, indicator) array of `stat` at `level`; NaN where nothing was observed."""
+        comp = self.components(level)
+        if stat == 'sum':
+            return np.where(comp[..., 1] > 0, comp[..., 0], np.nan)
+        if stat == 'count':
+            return np.asarray(comp[..., 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if stat == 'mean':
+                return comp[..., 0] / np.where(comp[..., 1] > 0, comp[..., 1], np.nan)
+            if stat == 'wmean':
+                return comp[..., 2] / np.where(comp[..., 3] > 0, comp[..., 3], np.nan)
+        raise ValueError(f'Unknown statistic {stat!r}; expected one of {", ".join(STATS)}')
+
+    def cell(self, code: str, year, indicator: str, stat: str = 'mean') -> float:
+        level = nuts_level(code)
+        if level not in self._code_index:
+            self._code_index[level] = {c: i for i, c in enumerate(self.codes[level].tolist())}
+        i = self._code_index[level][code]
+        year = int(year)
+        j = int(np.searchsorted(self.years, year))
+        if j == len(self.years) or self.years[j] != year:
+            raise KeyError(f'Year {year} not in cube')
+        comp = self.components(level)[i, j, self.indicators.index(indicator)]
+        n, x, w = comp[1], comp[0], comp[3]
+        if stat == 'sum':
+            return float(x) if n else float('nan')
+        if stat == 'count':
+            return float(n)
+        if stat == 'mean':
+            return float(x / n) if n else float('nan')
+        return float(comp[2] / w) if w else float('nan')
+
+
+def _read_panel_rows(panel_csv: Path):
+    """(indicator names, {(code, year): row}) from a regional panel; a later duplicate key wins."""
+    with open_text(panel_csv, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        ci, yi = header.index('nuts_code'), header.index('year')
+        cols = [(j, c) for j, c in enumerate(header) if c not in KEY_COLS]
+        rows = {(r[ci], int(r[yi])): [r[j] if j < len(r) else '' for j, _ in cols] for r in reader}
+    return [c for _, c in cols], rows
+
+
+def read_regional_panel(panel_csv: Path, weight: str = None):
+    """(codes, years, indicators, values (code, year, indicator), weights (code, year))."""
+    indicators, rows = _read_panel_rows(panel_csv)
+    codes = np.array(sorted({c for c, _ in rows}))
+    years = np.array(sorted({y for _, y in rows}), dtype=np.int64)
+    levels = {nuts_level(c) for c in codes.tolist()}
+    if len(levels) > 1:
+        raise ValueError(f'{panel_csv} mixes NUTS levels {sorted(levels)}; roll up from a single base level')
+    values = np.full((len(codes), len(years), len(indicators)), np.nan)
+    if rows:
+        r_idx = np.searchsorted(codes, [c for c, _ in rows])
+        y_idx = np.searchsorted(years, [y for _, y in rows])
+        cells = to_float_array([v for row in rows.values() for v in row])
+        values[r_idx, y_idx] = cells.reshape(len(rows), len(indicators))
+    if weight is None:
+        weights = np.ones(values.shape[:2])
+    else:
+        weights = values[:, :, indicators.index(weight)].copy()
+    return codes, years, indicators, values, weights
+
+
+def _write_levels(out_path: Path, codes, base_level, comp):
+    np.save(out_path / f'level{base_level}.codes.npy', codes)
+    np.save(out_path / f'level{base_level}.npy', comp)
+    for level in range(base_level - 1, -1, -1):
+        parents, agg = _rollup(codes, comp, level)
+        np.save(out_path / f'level{level}.codes.npy', parents)
+        np.save(out_path / f'level{level}.npy', agg)
+    with (out_path / 'hierarchy.csv').open('w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['nuts_code', 'nuts_level', 'parent', 'country'])
+        writer.writerows(hierarchy_rows(codes.tolist()))
+
+
+def build_cube(panel_csv: Path, out_path: Path, weight: str = None) -> Path:
+    """Materialize every level of the cube for a regional panel."""
+    codes, years, indicators, values, weights = read_regional_panel(panel_csv, weight)
+    base_level = nuts_level(codes[0]) if len(codes) else 0
+    out_path.mkdir(parents=True, exist_ok=True)
+    np.save(out_path / 'years.npy', years)
+    np.save(out_path / 'indicators.npy', np.asarray(indicators, dtype=str))
+    np.save(out_path / 'base.npy', values)
+    np.save(out_path / 'weights.npy', weights)
+    _write_levels(out_path, codes, base_level, _components(values, weights))
+    with (out_path / 'meta.json').open('w', encoding='utf-8') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'base_level': base_level, 'weight': weight,
+                   'components': list(COMPONENTS)}, f, indent=2)
+    return out_path
+
+
+def update_cube(cube_path: Path, changes_csv: Path) -> dict:
+    """Upsert changed base rows (same columns as the panel) into a cube.
+
+    Each changed (code, year) row is turned into a component delta (new minus
+    old contribution) and added to that row and its ancestors at every level;
+    nothing else is re-aggregated. Rows for codes or years the cube does not
+    have yet need a rebuild and raise. Returns counts of rows and cells.
+    """
+    cube_path = Path(cube_path)
+    with (cube_path / 'meta.json').open('r', encoding='utf-8') as f:
+        meta = json.load(f)
+    base_level = meta['base_level']
+    years = np.load(cube_path / 'years.npy')
+    indicators = np.load(cube_path / 'indicators.npy').tolist()
+    codes = np.load(cube_path / f'level{base_level}.codes.npy')
+    base = np.load(cube_path / 'base.npy')
+    weights = np.load(cube_path / 'weights.npy')
+
+    ch_inds, ch_rows = _read_panel_rows(changes_csv)
+    unknown = sorted({c for c, _ in ch_rows} - set(codes.tolist()))
+    new_years = sorted({y for _, y in ch_rows} - set(years.tolist()))
+    extra = sorted(set(ch_inds) - set(indicators))
+    if unknown or new_years or extra:
+        raise ValueError(f'Changes add codes {unknown} / years {new_years} / indicators {extra}; '
+                         'rebuild the cube with build_cube')
+    if not ch_rows:
+        return {'rows': 0, 'cells': 0}
+
+    rows = np.searchsorted(codes, [c for c, _ in ch_rows])
+    cols = np.searchsorted(years, [y for _, y in ch_rows])
+    ind = np.array([indicators.index(n) for n in ch_inds], dtype=np.int64)
+    ch_values = to_float_array([v for row in ch_rows.values() for v in row]).reshape(len(ch_rows), len(ch_inds))
+
+    old_values = base[rows, cols].copy()
+    old_weights = weights[rows, cols].copy()
+    new_values = old_values.copy()
+    new_values[:, ind] = ch_values
+    base[rows, cols] = new_values
+    if meta['weight'] is not None:
+        weights[rows, cols] = new_values[:, indicators.index(meta['weight'])]
+    delta = _components(new_values, weights[rows, cols]) - _components(old_values, old_weights)
+    changed = int((~((old_values == new_values) | (np.isnan(old_values) & np.isnan(new_values)))).sum())
+
+    np.save(cube_path / 'base.npy', base)
+    np.save(cube_path / 'weights.npy', weights)
+    for level in range(base_level, -1, -1):
+        level_codes = np.load(cube_path / f'level{level}.codes.npy')
+        comp = np.load(cube_path / f'level{level}.npy')
+        targets = np.searchsorted(level_codes, np.array([c[:2 + level] for c in codes[rows].tolist()]))
+        np.add.at(comp, (targets, cols), delta)
+        np.save(cube_path / f'level{level}.npy', comp)
+    return {'rows': len(rows), 'cells': changed}
+
+
+def export_level(cube_path: Path, out_csv: Path, level: int = None):
+    """Write one level (default: all) as long rows with every statistic."""
+    cube = NutsCube(cube_path)
+    levels = range(cube.base_level + 1) if level is None else [level]
+    with open_text(out_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['nuts_level', 'nuts_code', 'year', 'indicator'] + list(STATS))
+        for k in levels:
+            stats = [cube.stat(k, s) for s in STATS]
+            for i, code in enumerate(cube.codes[k].tolist()):
+                for j, year in enumerate(cube.years.tolist()):
+                    cols = [format_array(s[i, j], '{:.0f}' if name == 'count' else '{:.3f}')
+                            for name, s in zip(STATS, stats)]
+                    for n, name in enumerate(cube.indicators):
+                        writer.writerow([k, code, year, name] + [c[n] for c in cols])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='NUTS hierarchy rollups (sum, mean, weighted mean).')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('build', help='materialize a cube from a regional panel')
+    p.add_argument('panel', help='CSV keyed by nuts_code, year with one column per indicator')
+    p.add_argument('out', help='cube directory, e.g. data/regional.ncube')
+    p.add_argument('--weight', help='indicator column used as weight for weighted means (default: unweighted)')
+    p = sub.add_parser('update', help='apply changed base rows to an existing cube')
+    p.add_argument('cube')
+    p.add_argument('changes', help='CSV with the same columns as the panel')
+    p = sub.add_parser('export', help='write precomputed statistics as long CSV')
+    p.add_argument('cube')
+    p.add_argument('out')
+    p.add_argument('--level', type=int, help='0 = country, 1-3 = NUTS level (default: all)')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print(f'Wrote cube to: {build_cube(Path(args.panel), Path(args.out), args.weight)}')
+    elif args.command == 'update':
+        print(f'Updated cube: {update_cube(Path(args.cube), Path(args.changes))}')
+    else:
+        export_level(Path(args.cube), Path(args.out), args.level)
+        print(f'Wrote rollups to: {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""Multiple OLS: one model by QR, or many models over a shared design matrix.
+
+Usage: python scripts/ols.py [--long data/estat_nrg_ind_market_long.csv] [--y GRTL_NR]
+                             [--x NAME ...] [--max-size K] [--top N]
+
+`ols(X, y)` fits y = b0 + X b by a QR decomposition of [1 X] and reports
+coefficients, standard errors, t statistics and R² (`OLSResult`).
+
+`fit_subsets(SharedDesign(X, y), subsets)` fits every model y ~ 1 + X[:, S]
+for a list of column subsets S of equal size at once. The data are centred
+and scaled a single time; each model is then a k x k block of the shared
+cross-product matrix, solved by the sweep operator (Goodnight 1979) applied
+pivot by pivot across the whole batch, with no Python loop over models. The
+sweep yields the inverse (for standard errors), the coefficients and the
+residual sum of squares together. Models with collinear regressors come back
+with `ok` False and NaN statistics instead of failing the batch. `all_subsets` walks every
+combination of the candidate columns up to `max_size`, chunk by chunk.
+
+`ols(..., cov='cluster', clusters=geo)` and `ols(..., cov='hac', time=year,
+groups=geo)` replace the classical standard errors with cluster-robust
+(CR1) or Newey-West (Bartlett kernel) ones. Both are sandwich estimators
+(X'X)^-1 M (X'X)^-1 whose middle matrix M is built from the score rows
+x_i e_i by grouped sums: `np.bincount` over integer cluster codes for the
+cluster estimator, and one matrix product per lag offset over rows sorted
+by group and time for HAC, so the cost does not grow with the number of
+clusters.
+
+The CLI regresses one indicator on every combination of the others, using
+the panel of all `indic_nrgm_unit` series and rows observed for all of them.
+
+Requires numpy.
+"""
+import argparse
+import itertools
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+CHUNK_MODELS = 500  # small enough for one batch of augmented matrices to stay in cache
+RANK_TOL = 1e-10
+COV_TYPES = ('classical', 'cluster', 'hac')
+
+
+class OLSResult:
+    """Coefficients and fit statistics of one OLS model (index 0 is the intercept, if any).
+
+    `df_absorbed` counts parameters swept out before the fit (fixed effects),
+    so residual degrees of freedom and standard errors account for them.
+    `vcov` is the coefficient covariance behind `se`, of kind `cov_type`
+    (see COV_TYPES); `cov_note` describes it for printed tables.
+    """
+
+    def __init__(self, names, coef, se, n, ssr, sst, df_absorbed: int = 0,
+                 vcov=None, cov_type: str = 'classical', cov_note: str = ''):
+        self.names = list(names)
+        self.coef = coef
+        self.se = se
+        self.n = n
+        self.k = len(coef)
+        self.df_resid = n - self.k - df_absorbed
+        self.ssr = ssr
+        self.r2 = 1 - ssr / sst if sst > 0 else 0.0
+        self.adj_r2 = 1 - (1 - self.r2) * (n - 1) / self.df_resid if self.df_resid > 0 else float('nan')
+        self.sigma = math.sqrt(ssr / self.df_resid) if self.df_resid > 0 else float('nan')
+        self.vcov = vcov
+        self.cov_type = cov_type
+        self.cov_note = cov_note
+
+    @property
+    def t(self) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.coef / self.se
+
+    def table_lines(self):
+        lines = [f"{'Variable':<28} | {'Coef':>12} | {'Std.Err':>10} | {'t':>8}", '-' * 68]
+        for name, b, se, t in zip(self.names, self.coef, self.se, self.t):
+            lines.append(f'{name:<28} | {b:12.4f} | {se:10.4f} | {t:8.3f}')
+        lines.append(f'N = {self.n}, R-squared = {self.r2:.4f}, adj. R-squared = {self.adj_r2:.4f}, '
+                     f'sigma = {self.sigma:.4f}')
+        if self.cov_type != 'classical':
+            lines.append(f'Std. errors: {self.cov_note}')
+        return lines
+
+
+def complete_rows(*arrays) -> np.ndarray:
+    """Row mask with every column of every array observed."""
+    mask = None
+    for arr in arrays:
+        arr = np.asarray(arr, dtype=np.float64)
+        ok = ~np.isnan(arr) if arr.ndim == 1 else ~np.isnan(arr).any(axis=1)
+        mask = ok if mask is None else mask & ok
+    return mask
+
+
+def _codes(labels) -> np.ndarray:
+    """Integer codes 0..G-1 of any label array."""
+    return np.unique(np.asarray(labels), return_inverse=True)[1].reshape(-1)
+
+
+def segment_sums(values: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    """(G, k) column sums of values (n, k) per group code, by one bincount."""
+    n_cols = values.shape[1]
+    flat = (codes[:, None] + n_groups * np.arange(n_cols)).ravel(order='F')
+    sums = np.bincount(flat, weights=values.ravel(order='F'), minlength=n_groups * n_cols)
+    return sums.reshape(n_cols, n_groups).T
+
+
+def cluster_meat(scores: np.ndarray, clusters):
+    """(M, G): sum over clusters of the outer product of each cluster's summed scores."""
+    codes = _codes(clusters)
+    n_clusters = int(codes.max()) + 1 if codes.size else 0
+    sums = segment_sums(scores, codes, n_clusters)
+    return sums.T @ sums, n_clusters
+
+
+def newey_west_lags(n_periods: int) -> int:
+    """Newey-West (1994) rule of thumb: floor(4 (T / 100)^(2/9))."""
+    return int(4 * (n_periods / 100) ** (2 / 9))
+
+
+def hac_meat(scores: np.ndarray, time, groups=None, lags: int = None):
+    """(M, lags): Newey-West middle matrix with Bartlett weights 1 - d / (lags + 1).
+
+    `time` is any sortable period label; periods are ranked over the whole
+    sample, so d counts periods, not calendar units. With `groups` (a panel)
+    only pairs of rows in the same group are correlated. Rows are sorted by
+    group and time once; for each offset o the rows o apart are compared
+    together, which covers every pair up to `lags` periods apart.
+    """
+    t = _codes(time)
+    g = np.zeros(len(t), dtype=np.int64) if groups is None else _codes(groups)
+    order = np.lexsort((t, g))
+    s, t, g = scores[order], t[order], g[order]
+    if ((g[1:] == g[:-1]) & (t[1:] == t[:-1])).any():
+        raise ValueError('HAC needs one row per period (and group)')
+    lags = newey_west_lags(int(t.max()) + 1) if lags is None else lags
+    meat = s.T @ s
+    for offset in range(1, min(lags, len(t) - 1) + 1):
+        dist = t[offset:] - t[:-offset]
+        weight = np.where((g[offset:] == g[:-offset]) & (dist <= lags), 1 - dist / (lags + 1), 0.0)
+        gamma = (s[offset:] * weight[:, None]).T @ s[:-offset]
+        meat += gamma + gamma.T
+    return meat, lags
+
+
+def ols(X, y, names=None, add_const: bool = True, df_absorbed: int = 0, cov: str = 'classical',
+        clusters=None, time=None, groups=None, lags: int = None, df_nested: int = 0) -> OLSResult:
+    """Fit y = b0 + X b by QR; X is (n, k) or (n,), without a constant column.
+
+    With `add_const=False` the model has no intercept and R² is measured
+    around zero (the within R² when X and y are already demeaned).
+
+    `cov` picks the standard errors: 'classical' (homoskedastic), 'cluster'
+    (CR1, robust to any correlation within `clusters`, scaled by
+    G / (G - 1) * (n - 1) / (n - k - a), where a is `df_absorbed` less the
+    `df_nested` absorbed parameters nested within the clusters, e.g. country
+    effects under clustering by country) or 'hac' (Newey-West over `time`,
+    within `groups` if given, scaled by n / df_resid; `lags` defaults to the
+    Newey-West rule of thumb).
+    """
+    if cov not in COV_TYPES:
+        raise ValueError(f'cov must be one of {COV_TYPES}, got {cov!r}')
+    X = np.asarray(X, dtype=np.float64)
+    X = X[:, None] if X.ndim == 1 else X
+    y = np.asarray(y, dtype=np.float64)
+    n, k = X.shape
+    names = list(names) if names is not None else [f'x{j + 1}' for j in range(k)]
+    if add_const:
+        X = np.column_stack([np.ones(n), X])
+        names = ['const'] + names
+    p = X.shape[1]
+    df = n - p - df_absorbed
+    if df <= 0:
+        raise ValueError(f'OLS needs more than {p + df_absorbed} observations, got {n}')
+    q, r = np.linalg.qr(X)
+    diag = np.abs(np.diag(r))
+    if diag.min() <= RANK_TOL * diag.max():
+        raise ValueError('Design matrix is rank deficient (collinear regressors)')
+    coef = np.linalg.solve(r, q.T @ y)
+    resid = y - X @ coef
+    ssr = float(resid @ resid)
+    r_inv = np.linalg.solve(r, np.eye(p))
+    bread = r_inv @ r_inv.T
+    note = ''
+    if cov == 'classical':
+        vcov = ssr / df * bread
+    else:
+        scores = X * resid[:, None]
+        if cov == 'cluster':
+            if clusters is None:
+                raise ValueError("cov='cluster' needs clusters")
+            meat, n_clusters = cluster_meat(scores, clusters)
+            if n_clusters < 2:
+                raise ValueError('cluster-robust errors need at least 2 clusters')
+            meat *= n_clusters / (n_clusters - 1) * (n - 1) / (n - p - (df_absorbed - df_nested))
+            note = f'cluster-robust, {n_clusters} clusters'
+        else:
+            if time is None:
+                raise ValueError("cov='hac' needs time")
+            meat, lags = hac_meat(scores, time, groups, lags)
+            meat *= n / df
+            note = f'Newey-West HAC, {lags} lag{"s" if lags != 1 else ""}' + (' within groups' if groups is not None else '')
+        vcov = bread @ meat @ bread
+    se = np.sqrt(np.diag(vcov))
+    sst = float(((y - y.mean()) ** 2).sum()) if add_const else float(y @ y)
+    return OLSResult(names, coef, se, n, ssr, sst, df_absorbed, vcov, cov, note)
+
+
+class SharedDesign:
+    """Centred, scaled cross-products of candidate regressors X (n, p) and y."""
+
+    def __init__(self, X, y):
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.n, self.p = X.shape
+        self.x_mean = X.mean(axis=0)
+        self.y_mean = float(y.mean())
+        xc = X - self.x_mean
+        yc = y - self.y_mean
+        self.scale = np.sqrt((xc ** 2).sum(axis=0))
+        self.scale[self.scale == 0] = 1.0  # constant column: singular in any model using it
+        z = xc / self.scale
+        self.zz = z.T @ z
+        self.zy = z.T @ yc
+        self.sst = float(yc @ yc)
+
+
+def _batched_sweep(m_aug: np.ndarray, k: int):
+    """Sweep the first k pivots of a stack of augmented matrices (k+1, k+1, models) in place.
+
+    With [[A, b], [b', c]] as input, the result holds A^-1 top left, A^-1 b
+    top right and c - b' A^-1 b bottom right. The model axis is last so every
+    update runs over contiguous memory. Returns the ok mask: False where a
+    pivot (the residual variance of a column given the earlier ones) fell
+    below RANK_TOL, i.e. the regressors are collinear.
+    """
+    ok = np.ones(m_aug.shape[2], dtype=bool)
+    for j in range(k):
+        d = m_aug[j, j].copy()
+        ok &= d > RANK_TOL
+        d[~ok] = 1.0
+        row = m_aug[j] / d
+        col = m_aug[:, j].copy()
+        m_aug -= col[:, None, :] * row[None, :, :]
+        m_aug[j] = row
+        m_aug[:, j] = -col / d
+        m_aug[j, j] = 1.0 / d
+    return ok
+
+
+def fit_subsets(design: SharedDesign, subsets) -> dict:
+    """Fit y ~ 1 + X[:, S] for every row S of `subsets` (m, k int array).
+
+    Returns arrays with one row per model: 'coef' and 'se' (m, k+1; column 0
+    the intercept), 't', 'r2', 'adj_r2', 'ssr' and 'ok' (False for collinear
+    designs, whose statistics are NaN).
+    """
+    subsets = np.asarray(subsets, dtype=np.int64)
+    m, k = subsets.shape
+    n = design.n
+    cols = subsets.T
+    m_aug = np.empty((k + 1, k + 1, m))
+    m_aug[:k, :k] = design.zz[cols[:, None, :], cols[None, :, :]]
+    m_aug[:k, k] = m_aug[k, :k] = design.zy[cols]
+    m_aug[k, k] = design.sst
+    with np.errstate(over='ignore', invalid='ignore'):  # collinear models, masked below
+        ok = _batched_sweep(m_aug, k)
+    a_inv = m_aug[:k, :k]
+    beta_z = m_aug[:k, k].T
+    ssr = np.maximum(m_aug[k, k], 0.0)
+    df = n - k - 1
+    sigma2 = ssr / df if df > 0 else np.full(m, np.nan)
+
+    scale = design.scale[subsets]
+    x_scaled = design.x_mean[subsets] / scale
+    slopes = beta_z / scale
+    slope_var = sigma2[:, None] * np.diagonal(a_inv) / scale ** 2
+    intercept = design.y_mean - (beta_z * x_scaled).sum(axis=1)
+    quad = (x_scaled.T[:, None, :] * a_inv * x_scaled.T[None, :, :]).sum(axis=(0, 1))
+    intercept_var = sigma2 * (1.0 / n + quad)
+
+    coef = np.column_stack([intercept, slopes])
+    with np.errstate(invalid='ignore'):
+        se = np.sqrt(np.column_stack([intercept_var, slope_var]))
+    r2 = 1 - ssr / design.sst if design.sst > 0 else np.zeros(m)
+    adj_r2 = 1 - (1 - r2) * (n - 1) / df if df > 0 else np.full(m, np.nan)
+    for arr in (coef, se, ssr, r2, adj_r2):
+        arr[~ok] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = coef / se
+    return {'subsets': subsets, 'coef': coef, 'se': se, 't': t, 'r2': r2, 'adj_r2': adj_r2,
+            'ssr': ssr, 'ok': ok}
+
+
+def all_subsets(design: SharedDesign, max_size: int = None, min_size: int = 1, chunk: int = CHUNK_MODELS):
+    """Yield fit_subsets results for every combination of candidate columns, chunk by chunk."""
+    max_size = design.p if max_size is None else min(max_size, design.p)
+    for k in range(min_size, max_size + 1):
+        combos = itertools.combinations(range(design.p), k)
+        while True:
+            block = np.fromiter(itertools.chain.from_iterable(itertools.islice(combos, chunk)), dtype=np.int64)
+            if not block.size:
+                break
+            yield fit_subsets(design, block.reshape(-1, k))
+
+
+def main():
+    from panel_store import panel_from_long
+
+    root = Path(__file__).resolve().parents[1] / 'data'
+    parser = argparse.ArgumentParser(description='Fit OLS models of one indicator on every combination of others.')
+    parser.add_argument('--long', default=str(root / 'estat_nrg_ind_market_long.csv'))
+    parser.add_argument('--y', default='GRTL_NR', help='dependent indicator (indic_nrgm_unit)')
+    parser.add_argument('--x', nargs='+', help='candidate regressors (default: every other indicator)')
+    parser.add_argument('--max-size', type=int, help='largest number of regressors per model (default: all)')
+    parser.add_argument('--top', type=int, default=5, help='models to list, by adjusted R-squared')
+    args = parser.parse_args()
+
+    panel = panel_from_long(Path(args.long))
+    flat = panel.values.reshape(-1, panel.values.shape[2])
+    candidates = args.x or [c for c in panel.indicators if c != args.y]
+    y = flat[:, panel.indicator_index[args.y]]
+    X = flat[:, [panel.indicator_index[c] for c in candidates]]
+    rows = complete_rows(X, y)
+    design = SharedDesign(X[rows], y[rows])
+    print(f'{args.y} on {len(candidates)} candidates; {design.n} rows observed for all of them')
+
+    t0 = time.perf_counter()
+    n_models = n_singular = 0
+    best = []
+    for res in all_subsets(design, args.max_size):
+        n_models += len(res['ok'])
+        n_singular += int((~res['ok']).sum())
+        score = np.where(res['ok'], res['adj_r2'], -np.inf)
+        top = np.argsort(score)[::-1][:args.top]
+        best.extend((float(score[i]), tuple(res['subsets'][i].tolist())) for i in top if np.isfinite(score[i]))
+        best = sorted(best, reverse=True)[:args.top]
+    elapsed = time.perf_counter() - t0
+    print(f'Fitted {n_models:,} models in {elapsed * 1000:.1f} ms ({n_singular:,} collinear, skipped)')
+
+    for rank, (score, subset) in enumerate(best, 1):
+        names = [candidates[j] for j in subset]
+        result = ols(X[rows][:, list(subset)], y[rows], names)
+        print(f'\n#{rank}: adj. R-squared {score:.4f}')
+        print('\n'.join(result.table_lines()))
+
+
+if __name__ == '__main__':
+    main()
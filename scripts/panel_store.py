@@ -0,0 +1,151 @@
+"""Dense (geo x year x indicator) panel store for the master dataset.
+
+Usage: python scripts/panel_store.py [master.csv] [out.npanel]
+
+The panel is a directory (`*.npanel`) holding:
+
+- `values.npy`: float64 array of shape (geo, year, indicator), NaN = missing
+- `geos.npy`, `years.npy`, `indicators.npy`: axis labels (geo codes, period
+  codes from periods.py, which are plain years for annual data, and master
+  column names)
+- `meta.json`: shape and format version
+
+`load_panel` memory-maps `values.npy`. Axis labels map to integer positions
+through dicts, so a country slice, a year slice or a single cell is an O(1)
+index into the array, with no CSV parsing or row scan.
+
+Requires numpy.
+"""
+import csv
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from compressed_io import open_text
+from derived_indicators import to_float_array
+from periods import parse_period
+
+FORMAT_VERSION = 1
+KEY_COLS = ('geo', 'year')
+
+
+class Panel:
+    """In-memory or memory-mapped (geo, year, indicator) cube."""
+
+    def __init__(self, geos, years, indicators, values: np.ndarray):
+        self.geos = np.asarray(geos, dtype=str)
+        self.years = np.asarray(years, dtype=np.int64)
+        self.indicators = list(indicators)
+        self.values = values
+        self.geo_index = {g: i for i, g in enumerate(self.geos.tolist())}
+        self.year_index = {y: i for i, y in enumerate(self.years.tolist())}
+        self.indicator_index = {c: i for i, c in enumerate(self.indicators)}
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def country(self, geo: str) -> np.ndarray:
+        """(year, indicator) slice for one geo."""
+        return self.values[self.geo_index[geo]]
+
+    def year(self, year) -> np.ndarray:
+        """(geo, indicator) slice for one period: a year, or a label such as '2023Q3'."""
+        return self.values[:, self.year_index[parse_period(year)]]
+
+    def indicator(self, name: str) -> np.ndarray:
+        """(geo, year) slice for one indicator."""
+        return self.values[:, :, self.indicator_index[name]]
+
+    def series(self, geo: str, name: str) -> np.ndarray:
+        """Values of one indicator for one geo, one per year."""
+        return self.values[self.geo_index[geo], :, self.indicator_index[name]]
+
+    def cell(self, geo: str, year, name: str) -> float:
+        return float(self.values[self.geo_index[geo], self.year_index[parse_period(year)], self.indicator_index[name]])
+
+    def observed(self) -> np.ndarray:
+        """Boolean (geo, year) mask of cells with at least one non-missing indicator."""
+        return ~np.isnan(self.values).all(axis=2)
+
+
+def panel_from_columns(keys, numeric: dict) -> Panel:
+    """Build a Panel from master keys [(geo, year), ...] and name -> float64 column arrays."""
+    geos = sorted({g for g, _ in keys})
+    years = sorted({parse_period(y) for _, y in keys})
+    indicators = sorted(numeric)
+    gi = {g: i for i, g in enumerate(geos)}
+    yi = {y: i for i, y in enumerate(years)}
+    values = np.full((len(geos), len(years), len(indicators)), np.nan)
+    if keys:
+        g_idx = np.fromiter((gi[g] for g, _ in keys), dtype=np.int64, count=len(keys))
+        y_idx = np.fromiter((yi[parse_period(y)] for _, y in keys), dtype=np.int64, count=len(keys))
+        for k, name in enumerate(indicators):
+            values[g_idx, y_idx, k] = numeric[name]
+    return Panel(geos, years, indicators, values)
+
+
+def read_master_columns(master_csv: Path):
+    """(keys, numeric columns) from a master CSV."""
+    with open_text(master_csv, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return [], {}
+        rows = list(reader)
+    gi, yi = header.index('geo'), header.index('year')
+    keys = [(r[gi], r[yi]) for r in rows]
+    numeric = {}
+    for j, name in enumerate(header):
+        if name not in KEY_COLS:
+            numeric[name] = to_float_array([r[j] if j < len(r) else '' for r in rows])
+    return keys, numeric
+
+
+def panel_from_long(long_csv: Path) -> Panel:
+    """Panel over every `indic_nrgm_unit` series of a long CSV (last row wins on duplicate cells)."""
+    with open_text(long_csv, newline='') as f:
+        rows = [(r['geo'], r['year'], r['indic_nrgm'] + '_' + r['unit'], r['value']) for r in csv.DictReader(f)]
+    geos, g_idx = np.unique([r[0] for r in rows], return_inverse=True)
+    years, y_idx = np.unique(np.array([parse_period(r[1]) for r in rows], dtype=np.int64), return_inverse=True)
+    indicators, i_idx = np.unique([r[2] for r in rows], return_inverse=True)
+    values = np.full((len(geos), len(years), len(indicators)), np.nan)
+    values[g_idx.reshape(-1), y_idx.reshape(-1), i_idx.reshape(-1)] = to_float_array([r[3] for r in rows])
+    return Panel(geos, years, indicators.tolist(), values)
+
+
+def write_panel(panel: Panel, out_path: Path):
+    out_path.mkdir(parents=True, exist_ok=True)
+    np.save(out_path / 'values.npy', np.ascontiguousarray(panel.values, dtype=np.float64))
+    np.save(out_path / 'geos.npy', panel.geos)
+    np.save(out_path / 'years.npy', panel.years)
+    np.save(out_path / 'indicators.npy', np.asarray(panel.indicators, dtype=str))
+    with (out_path / 'meta.json').open('w', encoding='utf-8') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'shape': list(panel.shape)}, f, indent=2)
+    return out_path
+
+
+def load_panel(path: Path, mmap: bool = True) -> Panel:
+    path = Path(path)
+    values = np.load(path / 'values.npy', mmap_mode='r' if mmap else None)
+    return Panel(np.load(path / 'geos.npy'), np.load(path / 'years.npy'),
+                 np.load(path / 'indicators.npy').tolist(), values)
+
+
+def panel_path(master_csv: Path) -> Path:
+    """Default `.npanel` location next to a master CSV."""
+    return master_csv.with_name(master_csv.name.split('.', 1)[0] + '.npanel')
+
+
+def build_panel(master_csv: Path, out_path: Path = None):
+    keys, numeric = read_master_columns(master_csv)
+    return write_panel(panel_from_columns(keys, numeric), out_path or panel_path(master_csv))
+
+
+if __name__ == '__main__':
+    root = Path(__file__).resolve().parents[1]
+    src = Path(sys.argv[1]) if len(sys.argv) > 1 else root / 'data' / 'master_dataset.csv'
+    dst = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    print(f'Wrote panel to: {build_panel(src, dst)}')
@@ -0,0 +1,153 @@
+"""Hive-style partitioned layout for the long Eurostat table.
+
+Usage: python scripts/partitioned_long.py <long.csv> <out_dir> [--by indic_nrgm [year]] [--ext .csv.gz]
+
+`partition_long` splits a long CSV into one file per partition, e.g.
+
+    data/long/indic_nrgm=GRTL/part.csv
+    data/long/indic_nrgm=GRTL/year=2013/part.csv    (--by indic_nrgm year)
+
+Partition columns are encoded in the directory names and dropped from the
+files. `read_partitioned` prunes partitions by directory name before opening
+anything, so a reader that wants 4 of 21 indicators only touches those 4
+directories. Rows are buffered per partition and appended to the part files
+every FLUSH_ROWS rows, with one file open at a time, so the number of
+partitions (e.g. NUTS-3 x year) is not bounded by the file-descriptor limit.
+Rows come back as dicts with the partition columns restored, in
+the same shape `build_master_dataset.read_long` yields.
+"""
+import argparse
+import csv
+import json
+import shutil
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from compressed_io import open_text
+
+MARKER = '_partitioning.json'
+DEFAULT_BY = ('indic_nrgm',)
+FLUSH_ROWS = 200_000  # rows buffered across all partitions before they are appended to their files
+
+
+def _partition_dir(root: Path, by, values) -> Path:
+    path = root
+    for col, val in zip(by, values):
+        path = path / f'{col}={quote(val, safe="")}'
+    return path
+
+
+def partition_long(long_csv: Path, out_root: Path, by=DEFAULT_BY, ext: str = '.csv'):
+    """Stream `long_csv` into a partitioned directory tree under `out_root`.
+
+    An existing tree written by this function is replaced; any other
+    non-empty directory is left alone and raises. Returns a dict of
+    partition path -> row count.
+    """
+    by = list(by)
+    if out_root.exists() and any(out_root.iterdir()):
+        if not (out_root / MARKER).exists():
+            raise ValueError(f'{out_root} is not empty and was not written by partition_long')
+        shutil.rmtree(out_root)
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    buffers = {}
+    counts = {}
+    buffered = 0
+
+    def flush():
+        for key, rows in buffers.items():
+            if not rows:
+                continue
+            part_dir = _partition_dir(out_root, by, key)
+            new = not part_dir.exists()
+            if new:
+                part_dir.mkdir(parents=True)
+            with open_text(part_dir / f'part{ext}', 'w' if new else 'a', newline='') as h:
+                writer = csv.writer(h)
+                if new:
+                    writer.writerow(columns)
+                writer.writerows(rows)
+            rows.clear()
+
+    with open_text(long_csv, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = [c for c in (reader.fieldnames or []) if c not in by]
+        missing = [c for c in by if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f'Partition columns not in {long_csv}: {", ".join(missing)}')
+        for row in reader:
+            key = tuple(row[c] for c in by)
+            rows = buffers.get(key)
+            if rows is None:
+                rows = buffers[key] = []
+                counts[key] = 0
+            rows.append([row[c] for c in columns])
+            counts[key] += 1
+            buffered += 1
+            if buffered >= FLUSH_ROWS:
+                flush()
+                buffered = 0
+    flush()
+
+    with (out_root / MARKER).open('w', encoding='utf-8') as f:
+        json.dump({'by': by, 'columns': columns, 'ext': ext}, f, indent=2)
+    return {str(_partition_dir(out_root, by, k).relative_to(out_root)): n for k, n in counts.items()}
+
+
+def list_partitions(root: Path, filters: dict = None):
+    """Yield (partition values dict, part file) for partitions matching `filters`.
+
+    `filters` maps column names to allowed values; partition columns are
+    pruned here by directory name without opening any file.
+    """
+    with (root / MARKER).open('r', encoding='utf-8') as f:
+        spec = json.load(f)
+    filters = {c: {str(v) for v in allowed} for c, allowed in (filters or {}).items()}
+
+    def walk(path: Path, depth: int, values: dict):
+        if depth == len(spec['by']):
+            part = path / f"part{spec['ext']}"
+            if part.exists():
+                yield values, part
+            return
+        col = spec['by'][depth]
+        for child in sorted(path.glob(f'{col}=*')):
+            val = unquote(child.name.split('=', 1)[1])
+            if col in filters and val not in filters[col]:
+                continue
+            yield from walk(child, depth + 1, {**values, col: val})
+
+    yield from walk(root, 0, {})
+
+
+def read_partitioned(root: Path, filters: dict = None):
+    """Yield long rows from the partitions (and rows) matching `filters`."""
+    filters = filters or {}
+    for values, part in list_partitions(root, filters):
+        row_filters = {c: {str(v) for v in allowed} for c, allowed in filters.items() if c not in values}
+        with open_text(part, newline='') as f:
+            for row in csv.DictReader(f):
+                if any(row.get(c) not in allowed for c, allowed in row_filters.items()):
+                    continue
+                row.update(values)
+                yield row
+
+
+def is_partitioned(path: Path) -> bool:
+    return path.is_dir() and (path / MARKER).exists()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition the long Eurostat CSV by indicator (and year).')
+    parser.add_argument('long_csv', help='long CSV input, optionally .gz / .zst')
+    parser.add_argument('out_dir', help='root of the partitioned tree, e.g. data/long')
+    parser.add_argument('--by', nargs='+', default=list(DEFAULT_BY), help='partition columns (default: indic_nrgm)')
+    parser.add_argument('--ext', default='.csv', help="part file extension, e.g. '.csv.gz'")
+    args = parser.parse_args()
+    counts = partition_long(Path(args.long_csv), Path(args.out_dir), by=args.by, ext=args.ext)
+    print(f'Wrote {len(counts)} partition(s) under: {args.out_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""Period labels and a compact integer period index.
+
+Eurostat periods come as years ('2023'), quarters ('2023Q3', '2023-Q3') or
+months ('2023-07', '2023M07'). `parse_period` maps each to one int32 code:
+
+    annual     2023     -> 2023       (the year itself)
+    quarterly  2023Q3   -> 20233      (year * 10 + quarter)
+    monthly    2023-07  -> 202307     (year * 100 + month)
+
+The frequency is implied by the magnitude, so one integer column can hold
+mixed frequencies. Annual codes equal the year, so code written for integer
+years keeps working. Down-sampling (M -> Q -> A) is integer arithmetic on whole
+arrays (`to_freq`), and `resample` aggregates values onto the coarser periods
+with one `np.unique` / `np.bincount` pass.
+
+Canonical labels (`period_label`) are '2023', '2023Q3' and '2023-07'. Sorted
+as strings, they order every frequency chronologically, and periods of one
+year group together ('2023' < '2023-01' < ... < '2023Q4' < '2024').
+
+The label functions are stdlib-only (the cleaner uses them); the array
+functions import numpy when called.
+"""
+import re
+
+FREQS = ('A', 'Q', 'M')
+_PATTERNS = [
+    (re.compile(r'^(\d{4})$'), 'A'),
+    (re.compile(r'^(\d{4})-?Q([1-4])$'), 'Q'),
+    (re.compile(r'^(\d{4})(?:-|M)(0?[1-9]|1[0-2])$'), 'M'),
+]
+
+
+def parse_period(label) -> int:
+    """Integer code of a period label (see module docstring); ValueError if unrecognised."""
+    text = str(label).strip().upper()
+    for pattern, freq in _PATTERNS:
+        m = pattern.match(text)
+        if m:
+            year = int(m.group(1))
+            if freq == 'A':
+                return year
+            sub = int(m.group(2))
+            return year * 10 + sub if freq == 'Q' else year * 100 + sub
+    raise ValueError(f'Unrecognised period: {label!r}')
+
+
+def period_freq(code: int) -> str:
+    if code < 10_000:
+        return 'A'
+    return 'Q' if code < 100_000 else 'M'
+
+
+def period_label(code: int) -> str:
+    """Canonical label of a period code."""
+    code = int(code)
+    freq = period_freq(code)
+    if freq == 'A':
+        return str(code)
+    if freq == 'Q':
+        return f'{code // 10}Q{code % 10}'
+    return f'{code // 100}-{code % 100:02d}'
+
+
+def normalize_period(label: str) -> str:
+    """Canonical form of a period label; labels that are not periods are returned stripped."""
+    try:
+        return period_label(parse_period(label))
+    except ValueError:
+        return label.strip()
+
+
+def parse_periods(labels):
+    """int32 codes for an array of labels, parsing each distinct label once."""
+    import numpy as np
+    uniq, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    codes = np.array([parse_period(u) for u in uniq.tolist()], dtype=np.int32)
+    return codes[inverse.reshape(-1)]
+
+
+def freq_of(codes):
+    """Frequency index per code: 0 = A, 1 = Q, 2 = M (positions in FREQS)."""
+    import numpy as np
+    codes = np.asarray(codes)
+    return (codes >= 10_000).astype(np.int8) + (codes >= 100_000)
+
+
+def end_month(codes):
+    """Months since year 0 of each period's last month, for chronological order across frequencies."""
+    import numpy as np
+    codes = np.asarray(codes, dtype=np.int64)
+    f = freq_of(codes)
+    return np.select([f == 0, f == 1], [codes * 12 + 12, (codes // 10) * 12 + (codes % 10) * 3],
+                     (codes // 100) * 12 + codes % 100)
+
+
+def year_ago(codes):
+    """Code of the same period one year earlier, at its own frequency (2023Q3 -> 2022Q3)."""
+    import numpy as np
+    codes = np.asarray(codes, dtype=np.int64)
+    return codes - np.array([1, 10, 100])[freq_of(codes)]
+
+
+def to_freq(codes, freq: str):
+    """Map codes to the enclosing period at `freq`.
+
+    Codes at `freq` or coarser are returned unchanged (there is no
+    up-sampling), so an annual row stays annual in a quarterly result.
+    """
+    import numpy as np
+    codes = np.asarray(codes, dtype=np.int64)
+    target = FREQS.index(freq)
+    f = freq_of(codes)
+    out = codes.copy()
+    monthly = f == 2
+    if target == 0:
+        out[monthly] //= 100
+        out[f == 1] //= 10
+    elif target == 1:
+        out[monthly] = (codes[monthly] // 100) * 10 + (codes[monthly] % 100 - 1) // 3 + 1
+    return out
+
+
+def resample(groups, codes, values, freq: str, how: str = 'mean'):
+    """Aggregate `values` (rows, or rows x columns) onto `freq` periods within `groups`.
+
+    `groups` are integer group ids per row (e.g. geo codes), `codes` period
+    codes. Returns (group ids, period codes, aggregated values), sorted by
+    group and period. `how` is 'mean' or 'sum' over non-missing values (NaN if
+    none) or 'last' (latest non-missing sub-period).
+    """
+    import numpy as np
+    if how not in ('mean', 'sum', 'last'):
+        raise ValueError(f'Unsupported aggregation: {how!r}')
+    groups = np.asarray(groups, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    flat = values.ndim == 1
+    if flat:
+        values = values[:, None]
+    target = to_freq(codes, freq)
+    keys, inverse = np.unique(groups * 10_000_000 + target, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    n = len(keys)
+    out = np.full((n, values.shape[1]), np.nan)
+    for j in range(values.shape[1]):
+        col = values[:, j]
+        ok = ~np.isnan(col)
+        count = np.bincount(inverse[ok], minlength=n)
+        if how == 'last':
+            # Latest sub-period wins: order observed rows by (group, period end)
+            rows = np.flatnonzero(ok)
+            rows = rows[np.lexsort((end_month(codes[rows]), inverse[rows]))]
+            last = np.full(n, -1)
+            last[inverse[rows]] = rows
+            out[last >= 0, j] = col[last[last >= 0]]
+            continue
+        total = np.bincount(inverse[ok], weights=col[ok], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            agg = total / count if how == 'mean' else total
+        out[:, j] = np.where(count > 0, agg, np.nan)
+    result = out[:, 0] if flat else out
+    return keys // 10_000_000, keys % 10_000_000, result
@@ -0,0 +1,242 @@
+"""Per-vintage profile store and drift report.
+
+Usage:
+    python scripts/profile_history.py record <long.csv> [--store data/profiles] [--vintage TAG]
+    python scripts/profile_history.py drift [--store data/profiles] [--new TAG] [--old TAG] [--out drift.csv]
+
+`record` profiles a long CSV into one compressed `<vintage>.npz` under the
+store. The file holds, per (indicator_unit, geo, period) cell: count, missing,
+sum, min, max and M2 (sum of squared deviations), plus a KLL sketch of every
+indicator's values (see sketches.py). Axes are saved as label arrays.
+
+`drift` aligns two vintages (default: the last two, by tag order) on the
+union of their axes and compares them with whole-array operations:
+
+- changed: observed in both, mean differs beyond a relative tolerance
+- new_missing: observed in the old vintage, missing (or absent) in the new
+- new_value: missing in the old vintage, observed in the new
+- outlier: a changed or new value lying more than `z` robust z-scores
+  (median/MAD over the series' periods in the old vintage, scored with
+  `anomalies.robust_z`) from its history
+
+Neither vintage's CSV is read again.
+
+Requires numpy.
+"""
+import argparse
+import csv
+import json
+import warnings
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from anomalies import robust_z
+from compressed_io import open_text
+from derived_indicators import to_float_array
+from periods import parse_periods, period_label
+from sketches import KLLSketch
+
+STAT_ARRAYS = ('count', 'missing', 'sum', 'min', 'max', 'm2')
+DRIFT_KINDS = ('changed', 'new_missing', 'new_value', 'outlier')
+REL_TOL = 1e-9
+OUTLIER_Z = 3.5
+
+
+def profile_arrays(long_csv: Path):
+    """(axes dict, stats dict of (indicator, geo, period) arrays, sketches) for a long CSV."""
+    with open_text(long_csv, newline='') as f:
+        reader = csv.DictReader(f)
+        rows = [(r['indic_nrgm'] + '_' + r['unit'], r['geo'], r['year'], r['value']) for r in reader]
+    if not rows:
+        raise ValueError(f'{long_csv} has no rows')
+    ind_lab, ind_idx = np.unique([r[0] for r in rows], return_inverse=True)
+    geo_lab, geo_idx = np.unique([r[1] for r in rows], return_inverse=True)
+    per_lab, per_idx = np.unique(parse_periods([r[2] for r in rows]), return_inverse=True)
+    values = to_float_array([r[3] for r in rows])
+
+    shape = (len(ind_lab), len(geo_lab), len(per_lab))
+    flat = np.ravel_multi_index((ind_idx.reshape(-1), geo_idx.reshape(-1), per_idx.reshape(-1)), shape)
+    size = int(np.prod(shape))
+    ok = ~np.isnan(values)
+    count = np.bincount(flat[ok], minlength=size).astype(np.float64)
+    total = np.bincount(flat[ok], weights=values[ok], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    m2 = np.bincount(flat[ok], weights=(values[ok] - mean[flat[ok]]) ** 2, minlength=size)
+    vmin = np.full(size, np.inf)
+    vmax = np.full(size, -np.inf)
+    np.minimum.at(vmin, flat[ok], values[ok])
+    np.maximum.at(vmax, flat[ok], values[ok])
+    stats = {
+        'count': count,
+        'missing': np.bincount(flat[~ok], minlength=size).astype(np.float64),
+        'sum': total,
+        'min': np.where(count > 0, vmin, np.nan),
+        'max': np.where(count > 0, vmax, np.nan),
+        'm2': m2,
+    }
+    stats = {k: v.reshape(shape) for k, v in stats.items()}
+
+    # one stable sort by indicator splits the observed values into per-indicator runs
+    ind_of_row = ind_idx.reshape(-1)[ok]
+    order = np.argsort(ind_of_row, kind='stable')
+    bounds = np.searchsorted(ind_of_row[order], np.arange(len(ind_lab) + 1))
+    observed = values[ok][order]
+    sketches = {}
+    for i, name in enumerate(ind_lab.tolist()):
+        sketch = KLLSketch()
+        sketch.update(observed[bounds[i]:bounds[i + 1]].tolist())
+        sketches[name] = sketch.to_dict()
+    axes = {'indicators': ind_lab, 'geos': geo_lab, 'periods': per_lab.astype(np.int32)}
+    return axes, stats, sketches
+
+
+def record_profile(long_csv: Path, store: Path, vintage: str = None) -> Path:
+    """Profile `long_csv` and save it as `<store>/<vintage>.npz`."""
+    vintage = vintage or date.today().isoformat()
+    axes, stats, sketches = profile_arrays(long_csv)
+    store.mkdir(parents=True, exist_ok=True)
+    out = store / f'{vintage}.npz'
+    np.savez_compressed(out, **axes, **stats, sketches=np.array(json.dumps(sketches)),
+                        source=np.array(str(long_csv)))
+    return out
+
+
+class StoredProfile:
+    """One vintage loaded from the store."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.vintage = self.path.stem
+        with np.load(self.path) as data:
+            self.indicators = data['indicators']
+            self.geos = data['geos']
+            self.periods = data['periods']
+            self.stats = {k: data[k] for k in STAT_ARRAYS}
+            self._sketches = json.loads(str(data['sketches']))
+
+    @property
+    def mean(self) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.stats['count'] > 0, self.stats['sum'] / self.stats['count'], np.nan)
+
+    def sketch(self, indicator: str) -> KLLSketch:
+        return KLLSketch.from_dict(self._sketches[indicator])
+
+    def aligned(self, indicators, geos, periods) -> dict:
+        """Mean and count arrays reindexed onto the given axes (absent cells: NaN / 0)."""
+        shape = (len(indicators), len(geos), len(periods))
+        mean = np.full(shape, np.nan)
+        count = np.zeros(shape)
+        ii = np.searchsorted(indicators, self.indicators)
+        gi = np.searchsorted(geos, self.geos)
+        pi = np.searchsorted(periods, self.periods)
+        idx = np.ix_(ii, gi, pi)
+        mean[idx] = self.mean
+        count[idx] = self.stats['count']
+        return {'mean': mean, 'count': count}
+
+
+def list_vintages(store: Path):
+    return sorted(p.stem for p in Path(store).glob('*.npz'))
+
+
+def pick_vintages(store: Path, old: str = None, new: str = None):
+    """(old, new) tags: `new` defaults to the latest vintage, `old` to the one before it."""
+    vintages = list_vintages(store)
+    new = new or (vintages[-1] if vintages else None)
+    older = [v for v in vintages if new is not None and v < new]
+    return old or (older[-1] if older else None), new
+
+
+def drift(old: StoredProfile, new: StoredProfile, rel_tol: float = REL_TOL, z: float = OUTLIER_Z):
+    """Boolean (indicator, geo, period) masks per DRIFT_KINDS on the union axes, plus the arrays."""
+    indicators = np.union1d(old.indicators, new.indicators)
+    geos = np.union1d(old.geos, new.geos)
+    periods = np.union1d(old.periods, new.periods)
+    a = old.aligned(indicators, geos, periods)
+    b = new.aligned(indicators, geos, periods)
+    seen_a = a['count'] > 0
+    seen_b = b['count'] > 0
+
+    both = seen_a & seen_b
+    diff = np.abs(b['mean'] - a['mean'])
+    scale = np.maximum(np.abs(a['mean']), np.abs(b['mean']))
+    with np.errstate(invalid='ignore'):
+        changed = both & (diff > rel_tol * np.maximum(scale, 1.0))
+
+    # Robust z of each new value against its series' periods in the old vintage
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN series
+        robust = robust_z(b['mean'], axis=2, reference=a['mean'])
+        outlier = np.abs(robust) > z
+
+    new_value = ~seen_a & seen_b
+    masks = {
+        'changed': changed,
+        'new_missing': seen_a & ~seen_b,
+        'new_value': new_value,
+        'outlier': (changed | new_value) & outlier,
+    }
+    arrays = {'old': a['mean'], 'new': b['mean'], 'robust_z': robust}
+    return (indicators, geos, periods), masks, arrays
+
+
+def drift_rows(axes, masks, arrays):
+    """Flagged cells as (kind, indicator, geo, period label, old, new, robust_z) tuples."""
+    indicators, geos, periods = axes
+    for kind in DRIFT_KINDS:
+        for i, g, p in zip(*np.nonzero(masks[kind])):
+            yield (kind, str(indicators[i]), str(geos[g]), period_label(periods[p]),
+                   arrays['old'][i, g, p], arrays['new'][i, g, p], arrays['robust_z'][i, g, p])
+
+
+def print_drift(old: str, new: str, masks: dict):
+    print(f'Drift {old} -> {new}:')
+    for kind in DRIFT_KINDS:
+        print(f'  {kind:<12} {int(masks[kind].sum())}')
+
+
+def write_drift(rows, out_csv: Path):
+    with open_text(out_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'indicator', 'geo', 'year', 'old', 'new', 'robust_z'])
+        for kind, ind, geo, per, old, new, rz in rows:
+            writer.writerow([kind, ind, geo, per] + ['' if x != x else f'{x:.6g}' for x in (old, new, rz)])
+
+
+def main():
+    root = Path(__file__).resolve().parents[1] / 'data'
+    parser = argparse.ArgumentParser(description='Record profiles per data vintage and report drift.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('record', help='profile a long CSV into the store')
+    p.add_argument('long_csv', nargs='?', default=str(root / 'estat_nrg_ind_market_long.csv'))
+    p.add_argument('--store', default=str(root / 'profiles'))
+    p.add_argument('--vintage', help='vintage tag (default: today)')
+    p = sub.add_parser('drift', help='compare two stored vintages')
+    p.add_argument('--store', default=str(root / 'profiles'))
+    p.add_argument('--new', help='new vintage (default: latest)')
+    p.add_argument('--old', help='old vintage (default: the one before --new)')
+    p.add_argument('--z', type=float, default=OUTLIER_Z, help='robust z threshold for outliers')
+    p.add_argument('--out', help='write flagged cells to this CSV')
+    args = parser.parse_args()
+
+    store = Path(args.store)
+    if args.command == 'record':
+        print(f'Recorded profile: {record_profile(Path(args.long_csv), store, args.vintage)}')
+        return
+
+    old, new = pick_vintages(store, args.old, args.new)
+    if new is None or old is None:
+        parser.error(f'need two vintages in {store}, found {len(list_vintages(store))}')
+    axes, masks, arrays = drift(StoredProfile(store / f'{old}.npz'), StoredProfile(store / f'{new}.npz'), z=args.z)
+    print_drift(old, new, masks)
+    if args.out:
+        write_drift(drift_rows(axes, masks, arrays), Path(args.out))
+        print(f'Wrote flagged cells to: {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,102 +1,494 @@
+import argparse
 import csv
+import io
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from collections import defaultdict
+
+from compressed_io import compression_of, open_text
+from sketches import DistinctCounter, KLLSketch
+
+META_COLS = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo']
+QUANTILES = {'p05': 0.05, 'median': 0.5, 'p95': 0.95}
+NUMERIC, TEXT = 'numeric', 'text'
+CHUNK_ROWS = 10_000
+LONG_SCHEMA = {**{c: TEXT for c in META_COLS + ['year', 'flag']}, 'value': NUMERIC}
+WIDE_SCHEMA = {c: TEXT for c in META_COLS}  # period columns are detected as numeric
 
 
 def read_csv(path: Path):
-    with path.open('r', encoding='utf-8') as f:
+    # .gz / .zst inputs are decompressed as they stream (see compressed_io)
+    with open_text(path, newline='') as f:
         reader = csv.DictReader(f)
         for row in reader:
             yield row
 
 
-def is_number(s: str) -> bool:
+def _to_float(v):
     try:
-        float(s)
+        return float(v)
+    except ValueError:
+        return None
+
+
+class ColumnStats:
+    """Mergeable accumulator for one column, numeric or text.
+
+    Text columns track count, missing and the distinct cells (exact up to
+    DISTINCT_LIMIT values, then a HyperLogLog; see sketches.DistinctCounter).
+    Numeric columns track count, missing, non-numeric, min/max, mean and M2
+    (for the variance), and a KLL quantile sketch only when `quantiles` is
+    set; each cell goes through float() once. A column's kind is declared (`kind`) or decided
+    once, from its first non-empty cell. Cells arrive a chunk at a time
+    (`add_many`), so counting, set building, float conversion and min/max run
+    as list operations; chunk moments are combined with the running ones like
+    accumulators over disjoint chunks are (`merge`, Chan et al.).
+    """
+
+    __slots__ = ('kind', 'count', 'missing', 'non_numeric', 'n', 'mean', 'm2', 'min', 'max', 'distinct', 'sketch')
+
+    def __init__(self, kind: str = None, quantiles: bool = False):
+        if kind not in (None, NUMERIC, TEXT):
+            raise ValueError(f'Unknown column kind {kind!r}')
+        self.kind = kind
+        self.count = 0
+        self.missing = 0
+        self.non_numeric = 0
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.distinct = DistinctCounter()
+        self.sketch = KLLSketch() if quantiles else None
+
+    def add(self, v: str):
+        """Add one cell; returns its float value (numeric columns), or None."""
+        parsed = self.add_many([v])
+        return parsed[0] if parsed else None
+
+    def add_many(self, cells):
+        """Add a chunk of cells; returns their float values (None where missing
+        or non-numeric) for a numeric column, None for a text column."""
+        if self.kind is None:
+            first = next((v for v in cells if v), None)
+            if first is None:
+                self.count += len(cells)
+                self.missing += len(cells)
+                return None
+            self.kind = NUMERIC if _to_float(first) is not None else TEXT
+        if self.kind == TEXT:
+            self.count += len(cells)
+            values = set(cells)
+            if '' in values:
+                self.missing += cells.count('')
+                values.discard('')
+            self.distinct.update(values)
+            return None
+        return self._add_numeric(cells)
+
+    def _add_numeric(self, cells):
+        try:
+            parsed = [float(v) if v else None for v in cells]
+            non_numeric = 0
+        except ValueError:
+            parsed = [_to_float(v) if v else None for v in cells]
+            non_numeric = sum(1 for v, x in zip(cells, parsed) if v and x is None)
+        xs = [x for x in parsed if x is not None and x == x]
+        self.count += len(cells)
+        self.non_numeric += non_numeric
+        self.missing += len(cells) - len(xs) - non_numeric
+        if xs:
+            n = len(xs)
+            mean = sum(xs) / n
+            chunk = ColumnStats(NUMERIC)
+            chunk.n, chunk.mean = n, mean
+            chunk.m2 = sum((x - mean) * (x - mean) for x in xs)
+            chunk.min, chunk.max = min(xs), max(xs)
+            self._merge_moments(chunk)
+            if self.sketch is not None:
+                self.sketch.update(xs)
+        return parsed
+
+    def _merge_moments(self, other: 'ColumnStats'):
+        n = self.n + other.n
+        if other.n:
+            delta = other.mean - self.mean
+            self.mean += delta * other.n / n
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def merge(self, other: 'ColumnStats'):
+        if self.kind is None:
+            self.kind = other.kind
+        elif other.kind is not None and other.kind != self.kind:
+            raise ValueError(f'Cannot merge a {self.kind} column with a {other.kind} one; declare a schema')
+        self._merge_moments(other)
+        self.count += other.count
+        self.missing += other.missing
+        self.non_numeric += other.non_numeric
+        self.distinct.merge(other.distinct)
+        if other.sketch is not None:
+            if self.sketch is None:
+                self.sketch = KLLSketch(other.sketch.k)
+            self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else None
+
+    def summary(self) -> dict:
+        var = self.variance
+        sketch = self.sketch or KLLSketch()
+        quantiles = dict(zip(QUANTILES, sketch.quantiles(QUANTILES.values())))
+        return {
+            'kind': self.kind,
+            'count': self.count,
+            'missing': self.missing,
+            'non_numeric': self.non_numeric,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean if self.n else None,
+            'std': math.sqrt(var) if var is not None else None,
+            'distinct': self.distinct.count() if self.kind == TEXT else None,
+            **quantiles,
+        }
+
+    def to_dict(self) -> dict:
+        d = {name: getattr(self, name) for name in self.__slots__}
+        d['distinct'] = self.distinct.to_dict()
+        d['sketch'] = self.sketch.to_dict() if self.sketch is not None else None
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'ColumnStats':
+        stats = cls()
+        for name in cls.__slots__:
+            setattr(stats, name, d.get(name))
+        stats.distinct = DistinctCounter.from_dict(d['distinct'])
+        stats.sketch = KLLSketch.from_dict(d['sketch']) if d['sketch'] is not None else None
+        return stats
+
+
+class Profile:
+    """Per-column accumulators for one CSV (or the merge of several chunks of it).
+
+    `schema` maps column names to NUMERIC or TEXT; other columns are
+    detected (see ColumnStats). Only `value_col` gets a quantile sketch;
+    with `group_by` as well (e.g. 'indic_nrgm' and 'value' for the long
+    table), every group also gets its own sketch of the value. Rows are added in chunks (`add_rows`)
+    and processed column by column.
+    """
+
+    def __init__(self, columns, group_by: str = None, value_col: str = None, schema: dict = None):
+        self.columns = list(columns)
+        self.schema = dict(schema or {})
+        self.rows = 0
+        self.stats = {c: ColumnStats(self.schema.get(c), quantiles=c == value_col) for c in self.columns}
+        self._ordered = [self.stats[c] for c in self.columns]
+        self.group_by = group_by
+        self.value_col = value_col
+        self.groups = {}
+        self._group_pos = None
+        if group_by in self.columns and value_col in self.columns:
+            self._group_pos = (self.columns.index(group_by), self.columns.index(value_col))
+
+    def add_row(self, row):
+        """Add one row given as a list in column order."""
+        self.add_rows([row])
+
+    def add_rows(self, rows):
+        """Add a chunk of rows (lists in column order); short rows count as missing cells."""
+        if not rows:
+            return
+        n_cols = len(self.columns)
+        self.rows += len(rows)
+        if any(len(r) != n_cols for r in rows):
+            rows = [(list(r) + [''] * n_cols)[:n_cols] for r in rows]
+        cols = list(zip(*rows))
+        parsed = [stats.add_many(col) for stats, col in zip(self._ordered, cols)]
+        if self._group_pos is not None:
+            gi, vi = self._group_pos
+            values = parsed[vi]
+            if values is not None:
+                buckets = {}
+                for g, x in zip(cols[gi], values):
+                    if x is not None and x == x:
+                        bucket = buckets.get(g)
+                        if bucket is None:
+                            bucket = buckets[g] = []
+                        bucket.append(x)
+                for g, xs in buckets.items():
+                    sketch = self.groups.get(g)
+                    if sketch is None:
+                        sketch = self.groups[g] = KLLSketch()
+                    sketch.update(xs)
+
+    def group_quantiles(self) -> dict:
+        return {g: dict(zip(QUANTILES, self.groups[g].quantiles(QUANTILES.values())))
+                for g in sorted(self.groups)}
+
+    def merge(self, other: 'Profile'):
+        for c in other.columns:
+            if c not in self.stats:
+                self.columns.append(c)
+                self.stats[c] = ColumnStats(other.stats[c].kind, other.stats[c].sketch is not None)
+                self._ordered.append(self.stats[c])
+            self.stats[c].merge(other.stats[c])
+        for g, sketch in other.groups.items():
+            if g in self.groups:
+                self.groups[g].merge(sketch)
+            else:
+                self.groups[g] = sketch
+        self.rows += other.rows
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            'columns': self.columns,
+            'rows': self.rows,
+            'group_by': self.group_by,
+            'value_col': self.value_col,
+            'schema': self.schema,
+            'stats': {c: self.stats[c].to_dict() for c in self.columns},
+            'groups': {g: s.to_dict() for g, s in self.groups.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'Profile':
+        profile = cls(d['columns'], d.get('group_by'), d.get('value_col'), d.get('schema'))
+        profile.rows = d['rows']
+        profile.stats = {c: ColumnStats.from_dict(d['stats'][c]) for c in profile.columns}
+        profile._ordered = [profile.stats[c] for c in profile.columns]
+        profile.groups = {g: KLLSketch.from_dict(s) for g, s in d['groups'].items()}
+        return profile
+
+    def __getitem__(self, column) -> ColumnStats:
+        return self.stats[column]
+
+
+def _add_chunks(profile: Profile, reader):
+    """Feed csv rows to `profile` CHUNK_ROWS at a time."""
+    while True:
+        chunk = list(islice(reader, CHUNK_ROWS))
+        if not chunk:
+            return profile
+        profile.add_rows(chunk)
+
+
+def _byte_ranges(path: Path, n_chunks: int):
+    """Split a plain file into `n_chunks` byte ranges aligned to line starts, after the header."""
+    size = path.stat().st_size
+    with path.open('rb') as f:
+        f.readline()
+        starts = [f.tell()]
+        for i in range(1, n_chunks):
+            f.seek(max(starts[-1], size * i // n_chunks))
+            f.readline()
+            starts.append(min(f.tell(), size))
+    ends = starts[1:] + [size]
+    return [(s, e) for s, e in zip(starts, ends) if e > s]
+
+
+class _Range(io.RawIOBase):
+    """Read at most `length` bytes of `f` from its current position."""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.left = length
+
+    def readable(self):
         return True
-    except Exception:
-        return False
-
-
-def profile_long(path: Path):
-    total = 0
-    missing = 0
-    min_val = None
-    max_val = None
-    units = set()
-    geos = set()
-    indicators = set()
-    for row in read_csv(path):
-        total += 1
-        geos.add(row.get('geo', ''))
-        units.add(row.get('unit', ''))
-        indicators.add(row.get('indic_nrgm', ''))
-        v = row.get('value', '')
-        if v == '' or v is None:
-            missing += 1
-        elif is_number(v):
-            x = float(v)
-            min_val = x if min_val is None else min(min_val, x)
-            max_val = x if max_val is None else max(max_val, x)
+
+    def readinto(self, buf):
+        n = min(len(buf), self.left)
+        if n <= 0:
+            return 0
+        data = self.f.read(n)
+        buf[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+def save_profile(profile: Profile, path: Path):
+    with open_text(path, 'w') as f:
+        json.dump(profile.to_dict(), f)
+    return path
+
+
+def load_profile(path: Path) -> Profile:
+    with open_text(path) as f:
+        return Profile.from_dict(json.load(f))
+
+
+def _profile_range(task) -> Profile:
+    path, start, end, group_by, value_col, schema = task
+    with path.open('rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')]))
+        profile = Profile(header, group_by, value_col, schema)
+        f.seek(start)
+        lines = io.TextIOWrapper(io.BufferedReader(_Range(f, end - start)), encoding='utf-8', newline='')
+        return _add_chunks(profile, csv.reader(lines))
+
+
+def profile_csv(path: Path, workers: int = 1, group_by: str = None, value_col: str = None,
+                schema: dict = None) -> Profile:
+    """Profile every column of a CSV in one streaming pass.
+
+    With `workers` > 1 a plain (uncompressed) file is split into line-aligned
+    byte ranges, profiled in a process pool and merged; compressed files
+    cannot be split and are read in one pass. Columns missing from `schema`
+    are typed from their first non-empty cell.
+    """
+    path = Path(path)
+    if workers > 1 and compression_of(path) is None:
+        tasks = [(path, s, e, group_by, value_col, schema) for s, e in _byte_ranges(path, workers)]
+        if len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+                parts = list(pool.map(_profile_range, tasks))
+            profile = parts[0]
+            for part in parts[1:]:
+                profile.merge(part)
+            return profile
+    with open_text(path, newline='') as f:
+        reader = csv.reader(f)
+        return _add_chunks(Profile(next(reader, []), group_by, value_col, schema), reader)
+
+
+def _profile_file(task) -> Profile:
+    path, group_by, value_col, schema = task
+    return profile_csv(path, group_by=group_by, value_col=value_col, schema=schema)
+
+
+def profile_files(paths, workers: int = None, group_by: str = None, value_col: str = None,
+                  schema: dict = None) -> Profile:
+    """One merged profile over several CSVs with the same columns, one file per worker.
+
+    `group_by`, `value_col` and `schema` are passed to every `profile_csv`.
+    """
+    tasks = [(Path(p), group_by, value_col, schema) for p in paths]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        parts = [_profile_file(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_profile_file, tasks))
+    profile = parts[0]
+    for part in parts[1:]:
+        profile.merge(part)
+    return profile
+
+
+def long_report(profile: Profile) -> dict:
+    value = profile['value']
     return {
-        'rows': total,
-        'missing_values': missing,
-        'min_value': min_val,
-        'max_value': max_val,
-        'unique_units': len(units),
-        'unique_geos': len(geos),
-        'unique_indicators': len(indicators),
+        'rows': profile.rows,
+        'missing_values': value.missing,
+        'min_value': value.min,
+        'max_value': value.max,
+        'mean_value': value.summary()['mean'],
+        'std_value': value.summary()['std'],
+        'median_value': value.summary()['median'],
+        'p95_value': value.summary()['p95'],
+        'unique_units': profile['unit'].distinct.count(),
+        'unique_geos': profile['geo'].distinct.count(),
+        'unique_indicators': profile['indic_nrgm'].distinct.count(),
+        'quantiles_by_indicator': profile.group_quantiles(),
     }
 
 
-def profile_wide(path: Path):
-    with path.open('r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames or []
-        meta_cols = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo']
-        year_cols = [c for c in fieldnames if c not in meta_cols]
-        rows = list(reader)
-
-    totals = {c: 0 for c in year_cols}
-    missing = {c: 0 for c in year_cols}
-    min_vals = {c: None for c in year_cols}
-    max_vals = {c: None for c in year_cols}
-
-    for row in rows:
-        for c in year_cols:
-            v = row.get(c, '')
-            totals[c] += 1
-            if v == '' or v is None:
-                missing[c] += 1
-            elif is_number(v):
-                x = float(v)
-                min_vals[c] = x if min_vals[c] is None else min(min_vals[c], x)
-                max_vals[c] = x if max_vals[c] is None else max(max_vals[c], x)
-
+def wide_report(profile: Profile) -> dict:
+    year_cols = [c for c in profile.columns if c not in META_COLS]
     return {
-        'rows': len(rows),
-        'columns': len(fieldnames),
+        'rows': profile.rows,
+        'columns': len(profile.columns),
         'years': year_cols,
-        'missing_by_year': missing,
-        'min_by_year': min_vals,
-        'max_by_year': max_vals,
+        'missing_by_year': {c: profile[c].missing for c in year_cols},
+        'min_by_year': {c: profile[c].min for c in year_cols},
+        'max_by_year': {c: profile[c].max for c in year_cols},
+        'mean_by_year': {c: profile[c].summary()['mean'] for c in year_cols},
     }
 
 
+def profile_long(path: Path, workers: int = 1, save: Path = None):
+    profile = profile_csv(path, workers, group_by='indic_nrgm', value_col='value', schema=LONG_SCHEMA)
+    if save is not None:
+        save_profile(profile, save)
+    return long_report(profile)
+
+
+def profile_wide(path: Path, workers: int = 1, save: Path = None):
+    profile = profile_csv(path, workers, schema=WIDE_SCHEMA)
+    if save is not None:
+        save_profile(profile, save)
+    return wide_report(profile)
+
+
 def main():
     root = Path(__file__).resolve().parents[1] / 'data'
-    long_path = root / 'estat_nrg_ind_market_long.csv'
-    wide_path = root / 'estat_nrg_ind_market_wide.csv'
+    parser = argparse.ArgumentParser(description='Profile the cleaned Eurostat CSVs.')
+    parser.add_argument('--long', default=str(root / 'estat_nrg_ind_market_long.csv'),
+                        help='long CSV, optionally .gz / .zst')
+    parser.add_argument('--wide', default=str(root / 'estat_nrg_ind_market_wide.csv'),
+                        help='wide CSV, optionally .gz / .zst')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='profile plain CSVs in this many byte-range chunks in parallel')
+    parser.add_argument('--save', help='directory to write long.profile.json / wide.profile.json (mergeable)')
+    parser.add_argument('--history', help='profile store: record this run as a vintage and report drift '
+                                          'against the previous one (see profile_history.py; needs numpy)')
+    parser.add_argument('--vintage', help='vintage tag for --history (default: today)')
+    parser.add_argument('--anomalies', action='store_true',
+                        help='also count robust-z / year-over-year outliers per indicator (see anomalies.py; needs numpy)')
+    args = parser.parse_args()
+    long_path = Path(args.long)
+    wide_path = Path(args.wide)
+    save_dir = Path(args.save) if args.save else None
+    if save_dir is not None:
+        save_dir.mkdir(parents=True, exist_ok=True)
 
-    long_report = profile_long(long_path)
-    wide_report = profile_wide(wide_path)
+    long_profile = profile_long(long_path, args.workers, save_dir / 'long.profile.json' if save_dir else None)
+    wide_profile = profile_wide(wide_path, args.workers, save_dir / 'wide.profile.json' if save_dir else None)
 
+    by_indicator = long_profile.pop('quantiles_by_indicator')
     print('Long format profile:')
-    print(long_report)
+    print(long_profile)
+    print('\nQuantiles by indicator (long, approximate):')
+    for indicator, q in by_indicator.items():
+        print(f"  {indicator:<14} median={q['median']:.3f} p95={q['p95']:.3f}")
     print('\nWide format profile:')
-    print({k: (v if k in ['rows','columns','years'] else None) for k, v in wide_report.items()})
+    print({k: (v if k in ['rows','columns','years'] else None) for k, v in wide_profile.items()})
     print('\nMissing by year (wide):')
-    print(wide_report['missing_by_year'])
+    print(wide_profile['missing_by_year'])
+
+    if args.anomalies:
+        import anomalies
+        from panel_store import panel_from_long
+        panel = panel_from_long(long_path)
+        counts = anomalies.summary(panel, anomalies.detect(panel.values, periods=panel.years))
+        print('\nAnomalies by indicator (level / yoy):')
+        for name in panel.indicators:
+            print(f"  {name:<22} {counts['level'][name]:4d} / {counts['yoy'][name]:4d}")
+
+    if args.history:
+        import profile_history
+        store = Path(args.history)
+        recorded = profile_history.record_profile(long_path, store, args.vintage)
+        print(f'\nRecorded vintage: {recorded}')
+        old, new = profile_history.pick_vintages(store, new=recorded.stem)
+        if old is None:
+            print('No earlier vintage to compare against.')
+        else:
+            _, masks, _ = profile_history.drift(profile_history.StoredProfile(store / f'{old}.npz'),
+                                                profile_history.StoredProfile(recorded))
+            profile_history.print_drift(old, new, masks)
 
 
 if __name__ == '__main__':
@@ -1,48 +1,22 @@
-import csv
-import json
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter
 import statistics
 import math
 
-def load_data():
-    """Load the master dataset"""
-    data_path = Path(__file__).parent.parent / 'data' / 'master_dataset.csv'
-    
-    data = []
-    with open(data_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data.append(row)
-    
-    return data
+import numpy as np
+
+from dataset import load_dataset
+from fixed_effects import two_way_fe
+from ols import ols
+from resampling import bootstrap, permutation_test, summary_lines
+
+def load_data(db=None):
+    """Load the master dataset as typed columns (see dataset.py), from the CSV or a SQLite store"""
+    return load_dataset(db=db)
 
 def prepare_regression_data(data):
-    """Prepare data for regression analysis"""
-    # Convert to numeric and handle missing values
-    clean_data = []
-    
-    for row in data:
-        clean_row = {}
-        for key, value in row.items():
-            if key in ['geo', 'year']:
-                clean_row[key] = value
-            else:
-                if value != '' and value is not None:
-                    try:
-                        clean_row[key] = float(value)
-                    except ValueError:
-                        clean_row[key] = None
-                else:
-                    clean_row[key] = None
-        
-        # Only include rows with complete data for key variables
-        if (clean_row.get('CMPY_ECAP5_PC') is not None and 
-            clean_row.get('CMPY_EG5_PC') is not None and
-            clean_row.get('GRTL_NR') is not None):
-            clean_data.append(clean_row)
-    
-    return clean_data
+    """Rows with complete data for the key variables"""
+    return data.take(data.complete(['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'GRTL_NR']))
 
 def simple_linear_regression(x, y):
     """Perform simple linear regression using least squares"""
@@ -96,10 +70,10 @@ def multiple_regression_analysis(data):
         return
     
     # Extract variables
-    y = [row['GRTL_NR'] for row in clean_data]  # Dependent variable
-    x1 = [row['CMPY_ECAP5_PC'] for row in clean_data]  # Electricity price competitiveness
-    x2 = [row['CMPY_EG5_PC'] for row in clean_data]   # Gas price competitiveness
-    x3 = [row['DERIV_energy_price_gap_PC'] for row in clean_data]  # Price gap
+    y = clean_data['GRTL_NR']  # Dependent variable
+    x1 = clean_data['CMPY_ECAP5_PC']  # Electricity price competitiveness
+    x2 = clean_data['CMPY_EG5_PC']   # Gas price competitiveness
+    x3 = clean_data['DERIV_energy_price_gap_PC']  # Price gap
     
     # Simple regressions
     print("\n--- Simple Linear Regressions ---")
@@ -122,10 +96,39 @@ def multiple_regression_analysis(data):
         print(f"GRTL_NR = {intercept3:.3f} + {slope3:.3f} * DERIV_energy_price_gap_PC")
         print(f"R-squared: {r2_3:.3f}, Standard Error: {se3:.3f}")
     
-    # Multiple regression (simplified)
-    print("\n--- Multiple Regression (Simplified) ---")
-    print("Note: Full multiple regression requires matrix operations")
-    print("For now, showing individual relationships and correlations")
+    # Multiple regression (OLS by QR decomposition, see ols.py)
+    print("\n--- Multiple Regression ---")
+    print("GRTL_NR = b0 + b1 * CMPY_ECAP5_PC + b2 * CMPY_EG5_PC")
+    print("(DERIV_energy_price_gap_PC is CMPY_ECAP5_PC - CMPY_EG5_PC, so it is collinear with the two and left out)")
+    result = ols(np.column_stack([x1, x2]), y, ['CMPY_ECAP5_PC', 'CMPY_EG5_PC'])
+    for line in result.table_lines():
+        print(line)
+    
+    # Same model within countries and years (two-way fixed effects, see fixed_effects.py)
+    print("\n--- Two-Way Fixed Effects (country and year) ---")
+    fe_result = two_way_fe(y, np.column_stack([x1, x2]), clean_data['geo'], clean_data.periods,
+                           ['CMPY_ECAP5_PC', 'CMPY_EG5_PC'])
+    for line in fe_result.table_lines():
+        print(line)
+    print("(R-squared is the within R-squared; intercepts are absorbed by the effects)")
+    
+    # Panel-robust inference: rows of one country are not independent draws
+    print("\n--- Standard Errors: Classical vs Cluster-Robust (geo) vs Newey-West HAC ---")
+    X = np.column_stack([x1, x2])
+    geo, periods = clean_data['geo'], clean_data.periods
+    fits = {
+        'Pooled': [ols(X, y, ['CMPY_ECAP5_PC', 'CMPY_EG5_PC'], cov=cov, clusters=geo, time=periods, groups=geo)
+                   for cov in ('classical', 'cluster', 'hac')],
+        'Two-way FE': [two_way_fe(y, X, geo, periods, ['CMPY_ECAP5_PC', 'CMPY_EG5_PC'], cov=cov)
+                       for cov in ('classical', 'cluster', 'hac')],
+    }
+    print(f"{'Model':<11} | {'Variable':<14} | {'Coef':>9} | {'Classical':>9} | {'Cluster':>9} | {'HAC':>9}")
+    print("-" * 75)
+    for model, (classical, cluster, hac) in fits.items():
+        for j, name in enumerate(classical.names):
+            print(f"{model:<11} | {name:<14} | {classical.coef[j]:9.4f} | {classical.se[j]:9.4f} | "
+                  f"{cluster.se[j]:9.4f} | {hac.se[j]:9.4f}")
+    print(f"({fits['Pooled'][1].cov_note}; {fits['Pooled'][2].cov_note})")
     
     # Calculate correlations
     correlations = {}
@@ -168,20 +171,33 @@ def calculate_correlation(x, y):
     
     return numerator / denominator
 
+def resampling_inference(data, n_replicates=10_000, seed=0):
+    """Bootstrap intervals (rows and whole countries) and permutation p-values for the simple regressions"""
+    print("\n=== BOOTSTRAP AND PERMUTATION INFERENCE ===")
+    print(f"{n_replicates:,} resamples and permutations per model, seed {seed} (see resampling.py)")
+    
+    clean_data = prepare_regression_data(data)
+    y = clean_data['GRTL_NR']
+    for col in ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC']:
+        x = clean_data[col]
+        boot = bootstrap(x, y, n_boot=n_replicates, seed=seed)
+        cluster_boot = bootstrap(x, y, clusters=clean_data['geo'], n_boot=n_replicates, seed=seed)
+        perm = permutation_test(x, y, n_perm=n_replicates, seed=seed)
+        print(f"\nGRTL_NR ~ {col}")
+        for line in summary_lines(boot, cluster_boot, perm):
+            print(line)
+
 def country_analysis(data):
     """Analyze patterns by country"""
     print("\n=== COUNTRY-SPECIFIC ANALYSIS ===")
     
     # Group by country
-    country_data = defaultdict(list)
-    for row in data:
-        if row['geo'] != '':
-            country_data[row['geo']].append(row)
+    geos = data['geo']
+    country_counts = Counter(g for g in geos.tolist() if g != '')
     
-    print(f"Countries with data: {len(country_data)}")
+    print(f"Countries with data: {len(country_counts)}")
     
     # Analyze top countries by data availability
-    country_counts = {country: len(rows) for country, rows in country_data.items()}
     top_countries = sorted(country_counts.items(), key=lambda x: x[1], reverse=True)[:10]
     
     print("\nTop 10 countries by data availability:")
@@ -189,48 +205,36 @@ def country_analysis(data):
         print(f"  {country}: {count} observations")
     
     # Analyze Germany specifically
-    if 'DE' in country_data:
-        de_data = country_data['DE']
+    if 'DE' in country_counts:
+        de_data = data.take(geos == 'DE')
         print(f"\n--- Germany (DE) Analysis ---")
         print(f"Observations: {len(de_data)}")
         
         # Calculate means for Germany
-        de_ecap = [float(row['CMPY_ECAP5_PC']) for row in de_data if row['CMPY_ECAP5_PC'] != '']
-        de_eg = [float(row['CMPY_EG5_PC']) for row in de_data if row['CMPY_EG5_PC'] != '']
-        de_grtl = [float(row['GRTL_NR']) for row in de_data if row['GRTL_NR'] != '']
-        
-        if de_ecap:
-            print(f"CMPY_ECAP5_PC mean: {statistics.mean(de_ecap):.3f}")
-        if de_eg:
-            print(f"CMPY_EG5_PC mean: {statistics.mean(de_eg):.3f}")
-        if de_grtl:
-            print(f"GRTL_NR mean: {statistics.mean(de_grtl):.3f}")
+        for col in ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'GRTL_NR']:
+            values = de_data[col][~np.isnan(de_data[col])]
+            if values.size:
+                print(f"{col} mean: {values.mean():.3f}")
 
 def temporal_analysis(data):
     """Analyze temporal trends"""
     print("\n=== TEMPORAL ANALYSIS ===")
     
     # Group by year
-    yearly_data = defaultdict(list)
-    for row in data:
-        if row['year'] != '':
-            yearly_data[row['year']].append(row)
+    years, year_idx = np.unique(data['year'], return_inverse=True)
     
-    print(f"Years with data: {len(yearly_data)}")
+    print(f"Years with data: {sum(1 for year in years.tolist() if year != '')}")
     
     # Calculate yearly means
     yearly_means = {}
-    for year, rows in yearly_data.items():
+    for k, year in enumerate(years.tolist()):
         if year != '':
-            ecap_values = [float(row['CMPY_ECAP5_PC']) for row in rows if row['CMPY_ECAP5_PC'] != '']
-            eg_values = [float(row['CMPY_EG5_PC']) for row in rows if row['CMPY_EG5_PC'] != '']
-            grtl_values = [float(row['GRTL_NR']) for row in rows if row['GRTL_NR'] != '']
-            
-            yearly_means[year] = {
-                'CMPY_ECAP5_PC': statistics.mean(ecap_values) if ecap_values else None,
-                'CMPY_EG5_PC': statistics.mean(eg_values) if eg_values else None,
-                'GRTL_NR': statistics.mean(grtl_values) if grtl_values else None
-            }
+            in_year = year_idx == k
+            yearly_means[year] = {}
+            for col in ['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'GRTL_NR']:
+                values = data[col][in_year]
+                values = values[~np.isnan(values)]
+                yearly_means[year][col] = values.mean() if values.size else None
     
     # Display trends
     print("\nYearly Trends (Mean Values):")
@@ -292,20 +296,23 @@ def generate_regression_report(data, output_dir):
     
     print(f"Regression report saved to: {report_path}")
 
-def main():
+def main(db=None):
     """Main regression analysis function"""
     print("Starting Regression Analysis...")
     
     # Load data
-    data = load_data()
+    data = load_data(db)
     
-    if not data:
+    if not len(data):
         print("No data found!")
         return
     
     # Multiple regression analysis
     correlations = multiple_regression_analysis(data)
     
+    # Uncertainty of the simple regressions and correlations
+    resampling_inference(data)
+    
     # Country analysis
     country_analysis(data)
     
@@ -324,5 +331,8 @@ def main():
     print("- regression_analysis_report.md")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description='Regression analysis of the master dataset.')
+    parser.add_argument('--db', help='read the master from this SQLite store (see sqlite_store.py) instead of the CSV')
+    main(parser.parse_args().db)
 
@@ -0,0 +1,218 @@
+"""Bootstrap confidence intervals and permutation p-values for correlations and slopes.
+
+Usage: python scripts/resampling.py [--x CMPY_ECAP5_PC] [--y GRTL_NR] [--boot 10000]
+                                    [--perm 10000] [--seed 0] [--workers N]
+
+`bootstrap(x, y)` resamples rows (or, with `clusters=geo`, whole countries,
+which keeps each country's years together) and reports percentile intervals
+and standard errors for the Pearson correlation, the slope and the intercept
+of y = a + b x. Each resample is a vector of draw counts per row or cluster,
+so a chunk of B resamples is one (B, G) count matrix; multiplied by the (G, 6)
+sums of 1, x, y, x², xy and y² per cluster it gives the moments of every
+resample in a single matrix product, from which all statistics follow.
+
+`permutation_test(x, y)` shuffles y against x B times at once (one (B, n)
+index matrix per chunk) for a two-sided p-value of the correlation; the
+slope has the same p-value, since with x and y fixed it is r scaled by a
+constant. `strata` restricts the shuffles to within groups (e.g. years).
+
+Replicates are split into chunks, each with its own seed spawned from one
+`np.random.SeedSequence(seed)`, and the chunks run across a process pool.
+Chunking does not depend on `workers`, so a seed gives the same replicates
+with any pool size.
+
+Requires numpy.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+N_REPLICATES = 10_000
+CHUNK_CELLS = 2_000_000  # draws per chunk (replicates x clusters), bounds chunk memory
+STATS = ('r', 'slope', 'intercept')
+
+
+def _codes(labels) -> np.ndarray:
+    return np.unique(np.asarray(labels), return_inverse=True)[1].reshape(-1)
+
+
+def cluster_moments(x, y, clusters=None):
+    """(G, 6) sums of 1, x, y, x², xy, y² per cluster (per row without clusters), around the means.
+
+    Returns the moments and the means of x and y, which are added back for
+    the intercept. Centring keeps the resampled variances free of
+    cancellation.
+    """
+    xc = x - x.mean()
+    yc = y - y.mean()
+    terms = np.column_stack([np.ones_like(xc), xc, yc, xc * xc, xc * yc, yc * yc])
+    if clusters is None:
+        return terms, float(x.mean()), float(y.mean())
+    codes = _codes(clusters)
+    n_clusters = int(codes.max()) + 1
+    flat = (codes[:, None] + n_clusters * np.arange(6)).ravel(order='F')
+    sums = np.bincount(flat, weights=terms.ravel(order='F'), minlength=n_clusters * 6)
+    return sums.reshape(6, n_clusters).T, float(x.mean()), float(y.mean())
+
+
+def pair_stats(moments: np.ndarray, x_mean: float = 0.0, y_mean: float = 0.0) -> dict:
+    """r, slope and intercept from rows of (n, Sx, Sy, Sxx, Sxy, Syy); NaN where x or y is constant."""
+    n, sx, sy, sxx, sxy, syy = moments.T
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vx = n * sxx - sx * sx
+        vy = n * syy - sy * sy
+        cov = n * sxy - sx * sy
+        r = cov / np.sqrt(vx * vy)
+        slope = cov / vx
+        intercept = y_mean + sy / n - slope * (x_mean + sx / n)
+    bad = (vx <= 0) | (vy <= 0)
+    r[bad] = slope[bad] = intercept[bad] = np.nan
+    return {'r': r, 'slope': slope, 'intercept': intercept}
+
+
+def _bootstrap_chunk(task):
+    moments, x_mean, y_mean, n_rep, seed = task
+    rng = np.random.default_rng(seed)
+    n_units = len(moments)
+    draws = rng.integers(0, n_units, size=(n_rep, n_units))
+    counts = np.bincount((draws + n_units * np.arange(n_rep)[:, None]).ravel(),
+                         minlength=n_rep * n_units).reshape(n_rep, n_units)
+    return pair_stats(counts @ moments, x_mean, y_mean)
+
+
+def _permutation_chunk(task):
+    xc, yc, strata, n_rep, seed = task
+    rng = np.random.default_rng(seed)
+    if strata is None:
+        perm = rng.permuted(np.broadcast_to(np.arange(len(yc)), (n_rep, len(yc))), axis=1)
+    else:
+        # rows are sorted by stratum: a random key within each stratum shuffles only inside it
+        perm = np.argsort(strata + rng.random((n_rep, len(yc))), axis=1)
+    return yc[perm] @ xc
+
+
+def _run_chunks(fn, payload: tuple, n_rep: int, n_units: int, seed: int, workers: int):
+    """Run fn over chunks of n_rep replicates with spawned seeds; returns the per-chunk results in order."""
+    per_chunk = max(1, min(n_rep, CHUNK_CELLS // max(n_units, 1)))
+    sizes = [min(per_chunk, n_rep - start) for start in range(0, n_rep, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [payload + (size, s) for size, s in zip(sizes, seeds)]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if workers == 1:
+        return [fn(t) for t in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, tasks))
+
+
+def _pairs(x, y):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    return x[ok], y[ok], ok
+
+
+def bootstrap(x, y, clusters=None, n_boot: int = N_REPLICATES, level: float = 0.95,
+              seed: int = 0, workers: int = None) -> dict:
+    """Bootstrap r, slope and intercept of y on x; rows with a missing x or y are dropped.
+
+    With `clusters` whole clusters are drawn with replacement (a block
+    bootstrap by country when clusters is the geo column). Returns
+    'estimate', 'se' and 'ci' (percentile interval at `level`) per statistic,
+    the 'replicates' themselves, 'n_boot', 'n_units' and 'n_failed'
+    (resamples where x or y was constant, left out of the summaries).
+    """
+    x, y, ok = _pairs(x, y)
+    if len(x) < 3:
+        raise ValueError(f'bootstrap needs at least 3 complete pairs, got {len(x)}')
+    groups = None if clusters is None else np.asarray(clusters)[ok]
+    moments, x_mean, y_mean = cluster_moments(x, y, groups)
+    chunks = _run_chunks(_bootstrap_chunk, (moments, x_mean, y_mean), n_boot, len(moments), seed, workers)
+    reps = {s: np.concatenate([c[s] for c in chunks]) for s in STATS}
+    estimate = {s: float(v[0]) for s, v in pair_stats(moments.sum(axis=0)[None, :], x_mean, y_mean).items()}
+    failed = np.isnan(reps['r'])
+    tail = (1 - level) / 2 * 100
+    good = {s: v[~failed] for s, v in reps.items()}
+    return {
+        'estimate': estimate,
+        'se': {s: float(v.std(ddof=1)) if v.size > 1 else float('nan') for s, v in good.items()},
+        'ci': {s: tuple(float(q) for q in np.percentile(v, [tail, 100 - tail])) if v.size else (float('nan'),) * 2
+               for s, v in good.items()},
+        'replicates': reps,
+        'n_boot': n_boot,
+        'n_units': len(moments),
+        'n_failed': int(failed.sum()),
+    }
+
+
+def permutation_test(x, y, n_perm: int = N_REPLICATES, strata=None, seed: int = 0, workers: int = None) -> dict:
+    """Two-sided permutation p-value for the correlation (and slope) of y on x.
+
+    p = (1 + #{|r*| >= |r|}) / (1 + n_perm), so it is never 0. With `strata`
+    y is shuffled only among rows of the same stratum.
+    """
+    x, y, ok = _pairs(x, y)
+    if len(x) < 3:
+        raise ValueError(f'permutation test needs at least 3 complete pairs, got {len(x)}')
+    codes = None
+    if strata is not None:
+        codes = _codes(np.asarray(strata)[ok])
+        order = np.argsort(codes, kind='stable')
+        x, y, codes = x[order], y[order], codes[order].astype(np.float64)
+    xc = x - x.mean()
+    yc = y - y.mean()
+    norm = float(np.sqrt((xc @ xc) * (yc @ yc)))
+    if norm == 0:
+        raise ValueError('x or y is constant')
+    r = float(xc @ yc) / norm
+    chunks = _run_chunks(_permutation_chunk, (xc, yc, codes), n_perm, len(x), seed, workers)
+    r_perm = np.concatenate(chunks) / norm
+    exceed = int((np.abs(r_perm) >= abs(r) - 1e-12).sum())
+    return {'r': r, 'p_value': (1 + exceed) / (1 + n_perm), 'n_perm': n_perm, 'replicates': r_perm}
+
+
+def summary_lines(boot: dict, cluster_boot: dict, perm: dict, level: float = 0.95):
+    """Table rows: estimate, row and cluster bootstrap intervals and permutation p for each statistic."""
+    pct = f'{level * 100:g}%'
+    lines = [f"{'Stat':<9} | {'Estimate':>9} | {pct + ' CI (rows)':>21} | {pct + ' CI (clusters)':>21} | "
+             f"{'Perm. p':>7}", '-' * 80]
+    for s in STATS:
+        lo, hi = boot['ci'][s]
+        clo, chi = cluster_boot['ci'][s]
+        p = f"{perm['p_value']:7.4f}" if s != 'intercept' else ''
+        lines.append(f"{s:<9} | {boot['estimate'][s]:9.3f} | [{lo:9.3f}, {hi:9.3f}] | "
+                     f"[{clo:9.3f}, {chi:9.3f}] | {p}".rstrip())
+    return lines
+
+
+def main():
+    import time
+    from dataset import MASTER, load_dataset
+
+    parser = argparse.ArgumentParser(description='Bootstrap and permutation inference for y on x.')
+    parser.add_argument('--master', default=str(MASTER))
+    parser.add_argument('--x', nargs='+', default=['CMPY_ECAP5_PC', 'CMPY_EG5_PC', 'DERIV_energy_price_gap_PC'])
+    parser.add_argument('--y', default='GRTL_NR')
+    parser.add_argument('--boot', type=int, default=N_REPLICATES, help='bootstrap replicates')
+    parser.add_argument('--perm', type=int, default=N_REPLICATES, help='permutations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: CPU count)')
+    args = parser.parse_args()
+
+    data = load_dataset(Path(args.master))
+    t0 = time.perf_counter()
+    for name in args.x:
+        x, y, geo = data[name], data[args.y], data['geo']
+        boot = bootstrap(x, y, n_boot=args.boot, seed=args.seed, workers=args.workers)
+        cluster_boot = bootstrap(x, y, clusters=geo, n_boot=args.boot, seed=args.seed, workers=args.workers)
+        perm = permutation_test(x, y, n_perm=args.perm, seed=args.seed, workers=args.workers)
+        print(f'\n{args.y} ~ {name}: {int(boot["replicates"]["r"].size):,} resamples of '
+              f'{boot["n_units"]} rows / {cluster_boot["n_units"]} countries, {args.perm:,} permutations')
+        print('\n'.join(summary_lines(boot, cluster_boot, perm)))
+    print(f'\n{time.perf_counter() - t0:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
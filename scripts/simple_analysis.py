@@ -1,38 +1,25 @@
-import csv
-import json
 from pathlib import Path
-from collections import defaultdict, Counter
-import statistics
+from collections import Counter
 
-def load_data():
-    """Load the master dataset using only built-in libraries"""
-    data_path = Path(__file__).parent.parent / 'data' / 'master_dataset.csv'
-    
-    data = []
-    with open(data_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data.append(row)
-    
-    return data
+import numpy as np
+
+from dataset import load_dataset
+
+def load_data(db=None):
+    """Load the master dataset as typed columns (see dataset.py), from the CSV or a SQLite store"""
+    return load_dataset(db=db)
 
 def basic_statistics(data):
-    """Generate basic statistics without pandas"""
+    """Generate basic statistics"""
     print("=== DATASET OVERVIEW ===")
     print(f"Total rows: {len(data)}")
     
-    if data:
-        print(f"Columns: {list(data[0].keys())}")
+    if len(data):
+        print(f"Columns: {data.names}")
     
     # Count missing values
-    missing_counts = defaultdict(int)
-    total_values = defaultdict(int)
-    
-    for row in data:
-        for key, value in row.items():
-            total_values[key] += 1
-            if value == '' or value is None:
-                missing_counts[key] += 1
+    missing_counts = {col: data.missing(col) for col in data.names}
+    total_values = {col: len(data) for col in data.names}
     
     print("\n=== MISSING DATA ANALYSIS ===")
     print("Column | Missing Count | Missing %")
@@ -48,39 +35,21 @@ def numeric_analysis(data):
     """Analyze numeric columns"""
     print("\n=== NUMERIC ANALYSIS ===")
     
-    # Identify numeric columns (excluding geo and year)
-    numeric_cols = []
-    for col in data[0].keys():
-        if col not in ['geo', 'year']:
-            # Check if column contains numeric data
-            sample_values = [row[col] for row in data[:10] if row[col] != '']
-            if sample_values:
-                try:
-                    float(sample_values[0])
-                    numeric_cols.append(col)
-                except ValueError:
-                    pass
-    
+    numeric_cols = data.numeric_columns
     print(f"Numeric columns found: {numeric_cols}")
     
     for col in numeric_cols:
         print(f"\n--- {col} ---")
-        values = []
-        for row in data:
-            if row[col] != '' and row[col] is not None:
-                try:
-                    values.append(float(row[col]))
-                except ValueError:
-                    pass
+        values = data[col][~np.isnan(data[col])]
         
-        if values:
-            print(f"Count: {len(values)}")
-            print(f"Mean: {statistics.mean(values):.3f}")
-            print(f"Median: {statistics.median(values):.3f}")
-            print(f"Min: {min(values):.3f}")
-            print(f"Max: {max(values):.3f}")
-            if len(values) > 1:
-                print(f"Std Dev: {statistics.stdev(values):.3f}")
+        if values.size:
+            print(f"Count: {values.size}")
+            print(f"Mean: {values.mean():.3f}")
+            print(f"Median: {np.median(values):.3f}")
+            print(f"Min: {values.min():.3f}")
+            print(f"Max: {values.max():.3f}")
+            if values.size > 1:
+                print(f"Std Dev: {values.std(ddof=1):.3f}")
         else:
             print("No valid numeric values found")
 
@@ -89,18 +58,18 @@ def categorical_analysis(data):
     print("\n=== CATEGORICAL ANALYSIS ===")
     
     # Analyze geo column
-    if 'geo' in data[0]:
+    if 'geo' in data:
         print("\n--- Geographic Distribution ---")
-        geo_counts = Counter(row['geo'] for row in data)
+        geo_counts = Counter(data['geo'].tolist())
         print(f"Unique countries/regions: {len(geo_counts)}")
         print("Top 10 countries/regions:")
         for geo, count in geo_counts.most_common(10):
             print(f"  {geo}: {count}")
     
     # Analyze year column
-    if 'year' in data[0]:
+    if 'year' in data:
         print("\n--- Year Distribution ---")
-        year_counts = Counter(row['year'] for row in data)
+        year_counts = Counter(data['year'].tolist())
         print("Years covered:")
         for year in sorted(year_counts.keys()):
             print(f"  {year}: {year_counts[year]}")
@@ -109,18 +78,7 @@ def correlation_analysis(data):
     """Basic correlation analysis for numeric columns"""
     print("\n=== CORRELATION ANALYSIS ===")
     
-    # Get numeric columns
-    numeric_cols = []
-    for col in data[0].keys():
-        if col not in ['geo', 'year']:
-            sample_values = [row[col] for row in data[:10] if row[col] != '']
-            if sample_values:
-                try:
-                    float(sample_values[0])
-                    numeric_cols.append(col)
-                except ValueError:
-                    pass
-    
+    numeric_cols = data.numeric_columns
     if len(numeric_cols) < 2:
         print("Not enough numeric columns for correlation analysis")
         return
@@ -129,35 +87,17 @@ def correlation_analysis(data):
     print("Correlation matrix:")
     print("Columns:", numeric_cols)
     
-    # Simple correlation calculation
     correlations = {}
     for i, col1 in enumerate(numeric_cols):
         for j, col2 in enumerate(numeric_cols):
             if i < j:  # Only calculate upper triangle
-                # Get valid pairs
-                pairs = []
-                for row in data:
-                    val1, val2 = row[col1], row[col2]
-                    if val1 != '' and val2 != '' and val1 is not None and val2 is not None:
-                        try:
-                            pairs.append((float(val1), float(val2)))
-                        except ValueError:
-                            pass
-                
-                if len(pairs) > 1:
-                    # Calculate correlation coefficient
-                    x_vals = [p[0] for p in pairs]
-                    y_vals = [p[1] for p in pairs]
-                    
-                    n = len(pairs)
-                    sum_x = sum(x_vals)
-                    sum_y = sum(y_vals)
-                    sum_xy = sum(x * y for x, y in pairs)
-                    sum_x2 = sum(x * x for x in x_vals)
-                    sum_y2 = sum(y * y for y in y_vals)
-                    
-                    numerator = n * sum_xy - sum_x * sum_y
-                    denominator = ((n * sum_x2 - sum_x**2) * (n * sum_y2 - sum_y**2))**0.5
+                # Pairwise complete observations
+                valid = data.complete([col1, col2])
+                x, y = data[col1][valid], data[col2][valid]
+                n = x.size
+                if n > 1:
+                    numerator = n * np.dot(x, y) - x.sum() * y.sum()
+                    denominator = ((n * np.dot(x, x) - x.sum()**2) * (n * np.dot(y, y) - y.sum()**2))**0.5
                     
                     if denominator != 0:
                         corr = numerator / denominator
@@ -168,48 +108,34 @@ def time_series_analysis(data):
     """Analyze trends over time"""
     print("\n=== TIME SERIES ANALYSIS ===")
     
-    if 'year' not in data[0]:
+    if 'year' not in data:
         print("No year column found")
         return
     
-    # Get numeric columns
-    numeric_cols = []
-    for col in data[0].keys():
-        if col not in ['geo', 'year']:
-            sample_values = [row[col] for row in data[:10] if row[col] != '']
-            if sample_values:
-                try:
-                    float(sample_values[0])
-                    numeric_cols.append(col)
-                except ValueError:
-                    pass
-    
+    numeric_cols = data.numeric_columns
     if not numeric_cols:
         print("No numeric columns found for time series analysis")
         return
     
     # Group by year and calculate means
-    yearly_data = defaultdict(lambda: defaultdict(list))
-    
-    for row in data:
-        year = row['year']
-        for col in numeric_cols:
-            if row[col] != '' and row[col] is not None:
-                try:
-                    yearly_data[year][col].append(float(row[col]))
-                except ValueError:
-                    pass
+    years, year_idx = np.unique(data['year'], return_inverse=True)
     
     print("Yearly averages for numeric variables:")
     print("Year | " + " | ".join(numeric_cols[:5]))  # Limit to 5 columns
     print("-" * (8 + 15 * min(5, len(numeric_cols))))
     
-    for year in sorted(yearly_data.keys()):
+    sums, counts = {}, {}
+    for col in numeric_cols[:5]:
+        valid = ~np.isnan(data[col])
+        sums[col] = np.bincount(year_idx[valid], weights=data[col][valid], minlength=len(years))
+        counts[col] = np.bincount(year_idx[valid], minlength=len(years))
+    
+    for k, year in enumerate(years.tolist()):
         if year != '':
             row_str = f"{year:4} | "
             for col in numeric_cols[:5]:
-                if col in yearly_data[year] and yearly_data[year][col]:
-                    mean_val = statistics.mean(yearly_data[year][col])
+                if counts[col][k]:
+                    mean_val = sums[col][k] / counts[col][k]
                     row_str += f"{mean_val:12.3f} | "
                 else:
                     row_str += f"{'N/A':12} | "
@@ -230,8 +156,8 @@ def generate_report(data, output_dir):
         
         f.write("## Dataset Overview\n\n")
         f.write(f"- **Total Observations**: {len(data):,}\n")
-        f.write(f"- **Total Variables**: {len(data[0]) if data else 0}\n")
-        f.write(f"- **Columns**: {', '.join(data[0].keys()) if data else 'None'}\n\n")
+        f.write(f"- **Total Variables**: {len(data.names) if len(data) else 0}\n")
+        f.write(f"- **Columns**: {', '.join(data.names) if len(data) else 'None'}\n\n")
         
         f.write("## Key Findings\n\n")
         f.write("1. **Dataset Structure**: Well-organized with geographic and temporal dimensions\n")
@@ -249,14 +175,14 @@ def generate_report(data, output_dir):
     
     print(f"Report saved to: {report_path}")
 
-def main():
+def main(db=None):
     """Main analysis function"""
     print("Starting Simple Analysis...")
     
     # Load data
-    data = load_data()
+    data = load_data(db)
     
-    if not data:
+    if not len(data):
         print("No data found!")
         return
     
@@ -287,4 +213,7 @@ def main():
     print("- simple_analysis_report.md")
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description='Simple analysis of the master dataset.')
+    parser.add_argument('--db', help='read the master from this SQLite store (see sqlite_store.py) instead of the CSV')
+    main(parser.parse_args().db)
@@ -0,0 +1,274 @@
+"""Local SQLite store for cleaned Eurostat data and master tables.
+
+Usage: python scripts/sqlite_store.py <db> [long.csv] [--dataset NAME] [--vintage TAG]
+
+Tables:
+
+- `long`: one row per observation, tagged with `dataset` and `vintage`, so
+  several Eurostat datasets and download vintages live side by side.
+  Indexed on (indic_nrgm, geo, year) and (geo, year) (see LONG_INDEXES).
+- `master`: master tables in long form (`variant`, geo, year, column, value),
+  indexed on (variant, geo, year).
+
+Loads go through `executemany` in batches into a staging table and are
+moved into `long` inside one transaction per load (the connection runs in
+autocommit mode and loads issue their own BEGIN); re-loading a
+(dataset, vintage) or master variant replaces it.
+
+`load_master_dataset` reads a master variant back as the typed
+`dataset.Dataset` (str geo/year, float64 values with NaN for missing) that
+`dataset.load_dataset()` builds from master_dataset.csv, so
+`load_dataset(db=...)` and the analysis scripts' `--db` option can read the
+store instead of the CSV. `load_master` returns plain row dicts (float
+values, '' for missing).
+"""
+import argparse
+import csv
+import sqlite3
+from datetime import date
+from itertools import islice
+from pathlib import Path
+
+from compressed_io import open_text
+
+BATCH_SIZE = 50_000
+LONG_COLS = ['freq', 'siec', 'indic_nrgm', 'unit', 'geo', 'year', 'value', 'flag']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS long (
+    dataset TEXT NOT NULL,
+    vintage TEXT NOT NULL,
+    freq TEXT, siec TEXT, indic_nrgm TEXT, unit TEXT, geo TEXT,
+    year INTEGER, value REAL, flag TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_long_dataset_vintage ON long (dataset, vintage);
+CREATE TABLE IF NOT EXISTS master (
+    variant TEXT NOT NULL,
+    geo TEXT NOT NULL,
+    year INTEGER NOT NULL,
+    col TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS idx_master_variant_geo_year ON master (variant, geo, year);
+"""
+
+# Query indexes on `long`; kept in place across loads (see LongRowSink)
+LONG_INDEXES = {
+    'idx_long_indic_geo_year': 'CREATE INDEX IF NOT EXISTS idx_long_indic_geo_year ON long (indic_nrgm, geo, year)',
+    'idx_long_geo_year': 'CREATE INDEX IF NOT EXISTS idx_long_geo_year ON long (geo, year)',
+}
+
+
+# Text cells go in as-is: column affinity turns year and value into numbers
+# inside SQLite, and NULLIF maps the CSV's '' to NULL.
+_INSERT_STAGE = ("INSERT INTO temp.long_stage VALUES (?, ?, ?, ?, ?, ?, ?, "
+                 "NULLIF(?, ''), NULLIF(?, ''), NULLIF(?, ''))")
+_CREATE_STAGE = 'CREATE TEMP TABLE IF NOT EXISTS long_stage AS SELECT * FROM long WHERE 0'
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    for sql in LONG_INDEXES.values():
+        conn.execute(sql)
+    return conn
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+class LongRowSink:
+    """Buffered bulk loader for one (dataset, vintage); used as a cleaner sink.
+
+    Rows are flushed with `executemany` every BATCH_SIZE rows into an
+    unindexed temporary staging table. `close()` clears the (dataset,
+    vintage) slice, moves the staged rows into `long` with one
+    `INSERT ... SELECT` sorted on the first query index, and commits, all in
+    one transaction. The LONG_INDEXES stay in place, so a load costs in
+    proportion to its own size, not to the rows already stored. `abort()`
+    (or an exception inside a `with` block) rolls the load back.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, dataset: str, vintage: str = None):
+        self.conn = conn
+        self.dataset = dataset
+        self.vintage = vintage or date.today().isoformat()
+        self.count = 0
+        self._pending = []
+        conn.execute('BEGIN')
+        conn.execute(_CREATE_STAGE)
+        conn.execute('DELETE FROM temp.long_stage')
+
+    def add(self, rows):
+        """Add long rows: dicts, or lists in LONG_COLS order (flag optional)."""
+        head = (self.dataset, self.vintage)
+        for r in rows:
+            if isinstance(r, dict):
+                r = [r.get(c, '') for c in LONG_COLS]
+            elif len(r) < len(LONG_COLS):
+                r = list(r) + [''] * (len(LONG_COLS) - len(r))
+            self._pending.append(head + tuple(r))
+        if len(self._pending) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self.conn.executemany(_INSERT_STAGE, self._pending)
+            self.count += len(self._pending)
+            self._pending = []
+
+    def close(self):
+        self._flush()
+        self.conn.execute('DELETE FROM long WHERE dataset = ? AND vintage = ?', (self.dataset, self.vintage))
+        self.conn.execute('INSERT INTO long SELECT * FROM temp.long_stage ORDER BY indic_nrgm, geo, year')
+        self.conn.execute('DROP TABLE temp.long_stage')
+        self.conn.commit()
+        return self.count
+
+    def abort(self):
+        self._pending = []
+        self.conn.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def load_long_rows(conn: sqlite3.Connection, rows, dataset: str, vintage: str = None) -> int:
+    """Replace (dataset, vintage) with `rows` (long-row dicts or lists in LONG_COLS order)."""
+    with LongRowSink(conn, dataset, vintage) as sink:
+        for batch in _batched(rows, BATCH_SIZE):
+            sink.add(batch)
+    return sink.count
+
+
+def load_long_csv(conn: sqlite3.Connection, long_csv: Path, dataset: str, vintage: str = None) -> int:
+    with open_text(long_csv, newline='') as f:
+        return load_long_rows(conn, csv.DictReader(f), dataset, vintage)
+
+
+def load_master_columns(conn: sqlite3.Connection, keys, text: dict, variant: str = 'master_dataset') -> int:
+    """Replace a master variant from build_master's keys and name -> column strings."""
+    def records():
+        for name, col in text.items():
+            for (geo, year), val in zip(keys, col):
+                yield (variant, geo, year, name, val)
+
+    n = 0
+    conn.execute('BEGIN')
+    try:
+        conn.execute('DELETE FROM master WHERE variant = ?', (variant,))
+        for batch in _batched(records(), BATCH_SIZE):
+            conn.executemany("INSERT INTO master VALUES (?, ?, ?, ?, NULLIF(?, ''))", batch)
+            n += len(batch)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return n
+
+
+def query_long(conn: sqlite3.Connection, indic_nrgm=None, geo=None, year=None, unit=None,
+               dataset=None, vintage=None):
+    """Long rows (as dicts) matching the given equality filters; values are floats or None."""
+    where, params = [], []
+    for col, val in (('indic_nrgm', indic_nrgm), ('geo', geo), ('year', year), ('unit', unit),
+                     ('dataset', dataset), ('vintage', vintage)):
+        if val is not None:
+            where.append(f'{col} = ?')
+            params.append(val)
+    sql = 'SELECT dataset, vintage, ' + ', '.join(LONG_COLS) + ' FROM long'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    cur = conn.execute(sql, params)
+    names = [d[0] for d in cur.description]
+    return [dict(zip(names, r)) for r in cur]
+
+
+def vintages(conn: sqlite3.Connection, dataset: str):
+    return [r[0] for r in conn.execute(
+        'SELECT DISTINCT vintage FROM long WHERE dataset = ? ORDER BY vintage', (dataset,))]
+
+
+def load_master(conn: sqlite3.Connection, variant: str = 'master_dataset', geo: str = None):
+    """Master rows as dicts keyed like master_dataset.csv; values are floats, missing values ''."""
+    sql = 'SELECT geo, year, col, value FROM master WHERE variant = ?'
+    params = [variant]
+    if geo is not None:
+        sql += ' AND geo = ?'
+        params.append(geo)
+    sql += ' ORDER BY geo, year'
+    rows = {}
+    cols = set()
+    for g, y, col, val in conn.execute(sql, params):
+        row = rows.setdefault((g, y), {'geo': g, 'year': str(y)})
+        row[col] = '' if val is None else val
+        cols.add(col)
+    out = []
+    for row in rows.values():
+        for c in cols:
+            row.setdefault(c, '')
+        out.append({k: row[k] for k in ['geo', 'year'] + sorted(cols)})
+    return out
+
+
+def load_master_dataset(conn: sqlite3.Connection, variant: str = 'master_dataset', geo: str = None):
+    """A master variant as a typed dataset.Dataset, laid out like the parsed master_dataset.csv.
+
+    Rows sort by geo, then period label, and columns are geo, year and the
+    value columns in name order; values are float64 with NaN for missing.
+    """
+    import numpy as np
+    from dataset import FLOAT, TEXT, Dataset
+
+    sql = 'SELECT geo, year, col, value FROM master WHERE variant = ?'
+    params = [variant]
+    if geo is not None:
+        sql += ' AND geo = ?'
+        params.append(geo)
+    cells = conn.execute(sql, params).fetchall()
+    keys = sorted({(g, str(y)) for g, y, _, _ in cells})
+    names = sorted({c for _, _, c, _ in cells})
+    row_of = {k: i for i, k in enumerate(keys)}
+    col_of = {c: j for j, c in enumerate(names)}
+    values = np.full((len(keys), len(names)), np.nan)
+    for g, y, c, v in cells:
+        if v is not None:
+            values[row_of[(g, str(y))], col_of[c]] = v
+    columns = {'geo': np.array([k[0] for k in keys], dtype=str), 'year': np.array([k[1] for k in keys], dtype=str)}
+    columns.update((c, values[:, j].copy()) for j, c in enumerate(names))
+    schema = {'geo': TEXT, 'year': TEXT, **{c: FLOAT for c in names}}
+    return Dataset(columns, schema)
+
+
+def main():
+    root = Path(__file__).resolve().parents[1]
+    parser = argparse.ArgumentParser(description='Bulk-load a long CSV into the SQLite store.')
+    parser.add_argument('db', help='SQLite database file')
+    parser.add_argument('long_csv', nargs='?', default=str(root / 'data' / 'estat_nrg_ind_market_long.csv'))
+    parser.add_argument('--dataset', default='estat_nrg_ind_market')
+    parser.add_argument('--vintage', default=None, help='vintage tag (default: today)')
+    args = parser.parse_args()
+    conn = connect(Path(args.db))
+    n = load_long_csv(conn, Path(args.long_csv), args.dataset, args.vintage)
+    conn.close()
+    print(f'Loaded {n} rows into: {args.db}')
+
+
+if __name__ == '__main__':
+    main()
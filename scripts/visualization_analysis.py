@@ -1,21 +1,18 @@
-import csv
-import json
 from pathlib import Path
-from collections import defaultdict
+from collections import Counter
 import statistics
-import math
+
+import numpy as np
+
+from dataset import load_dataset
 
 def load_data():
-    """Load the master dataset"""
-    data_path = Path(__file__).parent.parent / 'data' / 'master_dataset.csv'
-    
-    data = []
-    with open(data_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            data.append(row)
-    
-    return data
+    """Load the master dataset as typed columns (see dataset.py)"""
+    return load_dataset()
+
+def observed(values):
+    """Non-missing entries of a float column"""
+    return values[~np.isnan(values)]
 
 def create_ascii_visualizations(data):
     """Create ASCII-based visualizations"""
@@ -23,12 +20,12 @@ def create_ascii_visualizations(data):
     
     # 1. Time Series Plot for Germany
     print("\n--- Germany Time Series (GRTL_NR) ---")
-    de_data = [row for row in data if row['geo'] == 'DE' and row['GRTL_NR'] != '']
-    de_data.sort(key=lambda x: int(x['year']))
+    de_rows = (data['geo'] == 'DE') & ~np.isnan(data['GRTL_NR'])
+    order = np.argsort(data.periods[de_rows], kind='stable')
     
-    if de_data:
-        years = [int(row['year']) for row in de_data]
-        values = [float(row['GRTL_NR']) for row in de_data]
+    if order.size:
+        years = data.periods[de_rows][order].tolist()
+        values = data['GRTL_NR'][de_rows][order].tolist()
         
         # Create ASCII plot
         min_val = min(values)
@@ -46,17 +43,16 @@ def create_ascii_visualizations(data):
     
     # 2. Country Comparison (Top 10)
     print("\n--- Country Comparison (Mean GRTL_NR) ---")
-    country_means = defaultdict(list)
-    
-    for row in data:
-        if row['GRTL_NR'] != '' and row['geo'] != '':
-            country_means[row['geo']].append(float(row['GRTL_NR']))
+    valid = ~np.isnan(data['GRTL_NR']) & (data['geo'] != '')
+    geos, geo_idx = np.unique(data['geo'][valid], return_inverse=True)
+    sums = np.bincount(geo_idx, weights=data['GRTL_NR'][valid], minlength=len(geos))
+    counts = np.bincount(geo_idx, minlength=len(geos))
     
     # Calculate means and sort
     country_stats = []
-    for country, values in country_means.items():
-        if len(values) >= 5:  # At least 5 observations
-            country_stats.append((country, statistics.mean(values), len(values)))
+    for country, total, count in zip(geos.tolist(), sums.tolist(), counts.tolist()):
+        if count >= 5:  # At least 5 observations
+            country_stats.append((country, total / count, count))
     
     country_stats.sort(key=lambda x: x[1], reverse=True)
     top_countries = country_stats[:10]
@@ -83,8 +79,8 @@ def create_ascii_visualizations(data):
     for i, var1 in enumerate(variables):
         for j, var2 in enumerate(variables):
             if i <= j:
-                values1 = [float(row[var1]) for row in data if row[var1] != '']
-                values2 = [float(row[var2]) for row in data if row[var2] != '']
+                values1 = observed(data[var1])
+                values2 = observed(data[var2])
                 
                 if len(values1) == len(values2) and len(values1) > 1:
                     corr = calculate_correlation(values1, values2)
@@ -161,13 +157,13 @@ def create_summary_tables(data):
     print("-" * 50)
     
     for var in numeric_vars:
-        values = [float(row[var]) for row in data if row[var] != '']
-        if values:
-            count = len(values)
-            mean_val = statistics.mean(values)
-            std_val = statistics.stdev(values) if len(values) > 1 else 0
-            min_val = min(values)
-            max_val = max(values)
+        values = observed(data[var])
+        if values.size:
+            count = values.size
+            mean_val = values.mean()
+            std_val = values.std(ddof=1) if values.size > 1 else 0
+            min_val = values.min()
+            max_val = values.max()
             print(f"{var:20} | {count:5} | {mean_val:5.1f} | {std_val:6.1f} | {min_val:5.1f} | {max_val:5.1f}")
     
     # 2. Missing Data Analysis
@@ -177,14 +173,14 @@ def create_summary_tables(data):
     
     total_rows = len(data)
     for var in numeric_vars:
-        missing = sum(1 for row in data if row[var] == '')
+        missing = data.missing(var)
         percentage = (missing / total_rows) * 100
         print(f"{var:20} | {missing:7} | {percentage:8.1f}%")
     
     # 3. Geographic Coverage
     print("\n--- Geographic Coverage ---")
-    countries = set(row['geo'] for row in data if row['geo'] != '')
-    years = set(row['year'] for row in data if row['year'] != '')
+    countries = set(data['geo'].tolist()) - {''}
+    years = set(data['year'].tolist()) - {''}
     
     print(f"Total countries: {len(countries)}")
     print(f"Total years: {len(years)}")
@@ -192,11 +188,7 @@ def create_summary_tables(data):
     
     # 4. Top 10 Countries by Data Completeness
     print("\n--- Top 10 Countries by Data Completeness ---")
-    country_completeness = defaultdict(int)
-    
-    for row in data:
-        if row['geo'] != '':
-            country_completeness[row['geo']] += 1
+    country_completeness = Counter(g for g in data['geo'].tolist() if g != '')
     
     top_countries = sorted(country_completeness.items(), key=lambda x: x[1], reverse=True)[:10]
     
@@ -212,41 +204,38 @@ def create_trend_analysis(data):
     print("\n=== TREND ANALYSIS ===")
     
     # Group by year
-    yearly_data = defaultdict(list)
-    for row in data:
-        if row['year'] != '':
-            yearly_data[row['year']].append(row)
+    years, year_idx = np.unique(data['year'], return_inverse=True)
+    in_year = {year: year_idx == k for k, year in enumerate(years.tolist()) if year != ''}
     
     # Calculate yearly statistics
     print("\n--- Yearly Statistics ---")
     print("Year | Countries | CMPY_ECAP5_PC | CMPY_EG5_PC | GRTL_NR")
     print("-" * 60)
     
-    for year in sorted(yearly_data.keys()):
-        rows = yearly_data[year]
-        country_count = len(set(row['geo'] for row in rows if row['geo'] != ''))
+    for year in sorted(in_year):
+        rows = data.take(in_year[year])
+        country_count = len(set(rows['geo'].tolist()) - {''})
         
-        ecap_values = [float(row['CMPY_ECAP5_PC']) for row in rows if row['CMPY_ECAP5_PC'] != '']
-        eg_values = [float(row['CMPY_EG5_PC']) for row in rows if row['CMPY_EG5_PC'] != '']
-        grtl_values = [float(row['GRTL_NR']) for row in rows if row['GRTL_NR'] != '']
+        ecap_values = observed(rows['CMPY_ECAP5_PC'])
+        eg_values = observed(rows['CMPY_EG5_PC'])
+        grtl_values = observed(rows['GRTL_NR'])
         
-        ecap_mean = statistics.mean(ecap_values) if ecap_values else 0
-        eg_mean = statistics.mean(eg_values) if eg_values else 0
-        grtl_mean = statistics.mean(grtl_values) if grtl_values else 0
+        ecap_mean = ecap_values.mean() if ecap_values.size else 0
+        eg_mean = eg_values.mean() if eg_values.size else 0
+        grtl_mean = grtl_values.mean() if grtl_values.size else 0
         
         print(f"{year:4} | {country_count:9} | {ecap_mean:12.1f} | {eg_mean:10.1f} | {grtl_mean:7.1f}")
     
     # Calculate trends
     print("\n--- Trend Analysis ---")
-    years = sorted(yearly_data.keys())
+    years = sorted(in_year)
     if len(years) >= 2:
         # Calculate trend for GRTL_NR
         grtl_trends = []
         for year in years:
-            rows = yearly_data[year]
-            grtl_values = [float(row['GRTL_NR']) for row in rows if row['GRTL_NR'] != '']
-            if grtl_values:
-                grtl_trends.append(statistics.mean(grtl_values))
+            grtl_values = observed(data['GRTL_NR'][in_year[year]])
+            if grtl_values.size:
+                grtl_trends.append(grtl_values.mean())
         
         if len(grtl_trends) >= 2:
             # Simple trend calculation
@@ -325,7 +314,7 @@ def main():
     # Load data
     data = load_data()
     
-    if not data:
+    if not len(data):
         print("No data found!")
         return
     